@@ -1,5 +1,20 @@
+import json
+import pstats
+from collections import Counter
+from io import StringIO
+from urllib.parse import urlencode
+
+from django import forms
+from django.conf import settings
 from django.contrib import admin
-from .models import Invoice, WorkEntry, Client, UserProfile
+from django.contrib.auth.models import User
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+
+from .counters import updating_counters
+from .profiling import TOKEN_PARAM, capture_path, issue_token, list_captures
+from .models import Invoice, WorkEntry, Client, UserProfile, RecurringSchedule, OutboundEmail, ArchivedInvoice, ArchivedWorkEntry
 
 
 @admin.register(Client)
@@ -21,13 +36,33 @@ class UserProfileAdmin(admin.ModelAdmin):
     readonly_fields = ("created_at", "updated_at")
 
 
+class CountersAdminMixin:
+    """
+    Saves and deletes of invoices and work entries (inlines and bulk
+    deletes included) move the client counters once per request.
+    """
+
+    def changeform_view(self, *args, **kwargs):
+        with updating_counters():
+            return super().changeform_view(*args, **kwargs)
+
+    def delete_view(self, *args, **kwargs):
+        with updating_counters():
+            return super().delete_view(*args, **kwargs)
+
+    def changelist_view(self, *args, **kwargs):
+        with updating_counters():
+            return super().changelist_view(*args, **kwargs)
+
+
 class WorkEntryInline(admin.TabularInline):
     model = WorkEntry
     extra = 0
+    readonly_fields = ("amount",)
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(CountersAdminMixin, admin.ModelAdmin):
     list_display = (
         "invoice_number",
         "client",
@@ -43,6 +78,132 @@ class InvoiceAdmin(admin.ModelAdmin):
 
 
 @admin.register(WorkEntry)
-class WorkEntryAdmin(admin.ModelAdmin):
-    list_display = ("invoice", "work_date", "hours", "description")
+class WorkEntryAdmin(CountersAdminMixin, admin.ModelAdmin):
+    list_display = ("invoice", "work_date", "hours", "hourly_rate", "amount", "description")
     list_filter = ("work_date",)
+
+
+@admin.register(RecurringSchedule)
+class RecurringScheduleAdmin(admin.ModelAdmin):
+    list_display = ("client", "user", "period_type", "next_period_start", "hourly_rate", "is_active")
+    search_fields = ("client__name", "user__username")
+    list_filter = ("period_type", "is_active")
+    readonly_fields = ("created_at", "updated_at")
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "status", "attempts", "next_attempt_at", "created_at", "sent_at")
+    search_fields = ("subject",)
+    list_filter = ("status",)
+    readonly_fields = ("created_at", "sent_at", "last_error")
+
+
+class ArchivedWorkEntryInline(admin.TabularInline):
+    model = ArchivedWorkEntry
+    extra = 0
+    can_delete = False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedInvoice)
+class ArchivedInvoiceAdmin(admin.ModelAdmin):
+    list_display = ("invoice_number", "client_name", "period_start", "period_end", "total_amount", "archived_at")
+    search_fields = ("invoice_number", "client_name", "client_email")
+    list_filter = ("date_issued",)
+    inlines = [ArchivedWorkEntryInline]
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
+
+# --- Request profiles (billing/profiling.py) ---------------------------------
+
+PROFILE_SORTS = ("cumulative", "tottime", "ncalls")
+PROFILE_ROWS = 60
+
+
+class ProfileTokenForm(forms.Form):
+    username = forms.CharField(help_text="The user whose requests are profiled")
+
+    def clean_username(self):
+        try:
+            return User.objects.get(username=self.cleaned_data["username"])
+        except User.DoesNotExist:
+            raise forms.ValidationError("No such user.")
+
+
+def request_profiles(request):
+    form = ProfileTokenForm(request.POST or None)
+    issued = None
+    if request.method == "POST" and form.is_valid():
+        user = form.cleaned_data["username"]
+        token = issue_token(user)
+        issued = {
+            "user": user,
+            "token": token,
+            "link": request.build_absolute_uri(f"{reverse('dashboard')}?{urlencode({TOKEN_PARAM: token})}"),
+        }
+    return TemplateResponse(request, "admin/request_profiles.html", {
+        **admin.site.each_context(request),
+        "title": "Request profiles",
+        "form": form,
+        "issued": issued,
+        "token_minutes": getattr(settings, "PROFILER_TOKEN_MAX_AGE", 3600) // 60,
+        "captures": list_captures(),
+    })
+
+
+def request_profile(request, capture_id):
+    meta_path, stats_path = capture_path(capture_id, ".json"), capture_path(capture_id, ".prof")
+    if meta_path is None or stats_path is None:
+        raise Http404("No such capture")
+    meta = json.loads(meta_path.read_text())
+    sort = request.GET.get("sort") if request.GET.get("sort") in PROFILE_SORTS else PROFILE_SORTS[0]
+    stats = StringIO()
+    pstats.Stats(str(stats_path), stream=stats).strip_dirs().sort_stats(sort).print_stats(PROFILE_ROWS)
+
+    # The same statement run many times is the usual culprit (N+1 queries)
+    counts, times = Counter(), Counter()
+    for query in meta["queries"]:
+        counts[query["sql"]] += 1
+        times[query["sql"]] += query["ms"]
+    repeated = [
+        {"sql": sql, "count": count, "ms": round(times[sql], 2)}
+        for sql, count in counts.most_common() if count > 1
+    ][:10]
+    return TemplateResponse(request, "admin/request_profile.html", {
+        **admin.site.each_context(request),
+        "title": f"{meta['method']} {meta['path']}",
+        "capture": meta,
+        "sort": sort,
+        "sorts": PROFILE_SORTS,
+        "stats": stats.getvalue(),
+        "repeated": repeated,
+    })
+
+
+def request_profile_download(request, capture_id, suffix):
+    file_path = capture_path(capture_id, f".{suffix}") if suffix in ("prof", "json") else None
+    if file_path is None:
+        raise Http404("No such capture")
+    return FileResponse(open(file_path, "rb"), as_attachment=True, filename=file_path.name)
+
+
+# Mounted under the admin URL by invoicegen/urls.py; staff only
+profile_urls = [
+    path("", admin.site.admin_view(request_profiles), name="request_profiles"),
+    path("<str:capture_id>/", admin.site.admin_view(request_profile), name="request_profile"),
+    path(
+        "<str:capture_id>/download/<str:suffix>/", admin.site.admin_view(request_profile_download),
+        name="request_profile_download",
+    ),
+]
@@ -0,0 +1,467 @@
+"""
+Versioned JSON API (``/api/v1/``) for clients, invoices and work entries.
+
+- ``?fields=a,b,c`` selects the fields returned, and only the columns they
+  need are read from the database.
+- Lists use cursor pagination (``?cursor=...&limit=...``) on the primary
+  key, so page N costs the same as page 1.
+- ``?embed=work_entries`` on invoices loads every entry of the page with a
+  single prefetch query; invoice totals then come from those rows.
+- Responses carry an ``ETag``; an ``If-None-Match`` listing it gets a 304.
+  Tags are compared weakly, as the compression middleware marks them weak.
+- ``POST /api/v1/invoices/batch/`` creates an invoice and all of its entries
+  in one request and one transaction.
+- ``POST /api/v1/time-slices/`` records time from desktop timers; it is
+  added to the client's open invoice later, in batches (see
+  ``billing.timeslices``).
+- ``GET /api/v1/changes/?since=<cursor>`` returns what changed after the
+  cursor: the current state of each changed object, or a tombstone for
+  deleted ones (see ``billing.sync``).
+
+Authentication is the normal session login.
+"""
+import base64
+import hashlib
+import json
+from decimal import Decimal
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch, Sum
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET, require_POST
+
+from .counters import add_to_counters, updating_counters
+from .db_router import read_replica, unpinned
+from .forms import InvoiceForm
+from .models import ChangeLog, Client, Invoice, WorkEntry
+from .periods import InvalidEntries, parse_entries
+from .sync import track, tracking_changes
+from .timeslices import MAX_SLICES, InvalidSlices, parse_slices, record_slices
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+# Change pages carry one small record per object, so they can be bigger
+CHANGES_LIMIT = 500
+CHANGES_MAX_LIMIT = 2000
+CENTS = Decimal("0.01")
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors
+
+
+def api_view(view_func):
+    """
+    Session-authenticated JSON view: 401 instead of a login redirect, and
+    ``APIError`` turned into a JSON error body.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "Authentication required."}, status=401)
+        try:
+            return view_func(request, *args, **kwargs)
+        except APIError as exc:
+            body = {"error": str(exc)}
+            if exc.errors:
+                body["errors"] = exc.errors
+            return JsonResponse(body, status=exc.status)
+    return wrapper
+
+
+# --- Field maps --------------------------------------------------------------
+#
+# API field name -> (model columns needed, getter)
+
+def _attr(name):
+    return ([name], lambda obj: getattr(obj, name))
+
+
+CLIENT_FIELDS = {
+    "id": _attr("id"),
+    "name": _attr("name"),
+    "email": _attr("email"),
+    "default_hourly_rate": _attr("default_hourly_rate"),
+    "is_active": _attr("is_active"),
+    "created_at": _attr("created_at"),
+    "updated_at": _attr("updated_at"),
+}
+
+WORK_ENTRY_FIELDS = {
+    "id": _attr("id"),
+    "invoice_id": _attr("invoice_id"),
+    "work_date": _attr("work_date"),
+    "hours": _attr("hours"),
+    "hourly_rate": _attr("hourly_rate"),
+    "amount": _attr("amount"),
+    "description": _attr("description"),
+}
+
+
+def _invoice_total(name):
+    # Annotated by _invoice_queryset unless entries are prefetched, in which
+    # case the model property sums the prefetched rows.
+    annotated = f"api_{name}"
+
+    def getter(invoice):
+        if hasattr(invoice, annotated):
+            return (getattr(invoice, annotated) or Decimal("0")).quantize(CENTS)
+        return getattr(invoice, name)
+    return ([], getter)
+
+
+INVOICE_FIELDS = {
+    "id": _attr("id"),
+    "invoice_number": _attr("invoice_number"),
+    "client_id": _attr("client_id"),
+    "client_name": _attr("client_name"),
+    "client_email": _attr("client_email"),
+    "period_type": _attr("period_type"),
+    "period_start": _attr("period_start"),
+    "period_end": _attr("period_end"),
+    "hourly_rate": _attr("hourly_rate"),
+    "date_issued": _attr("date_issued"),
+    "status": _attr("status"),
+    "notes": _attr("notes"),
+    "total_hours": _invoice_total("total_hours"),
+    "total_amount": _invoice_total("total_amount"),
+}
+
+
+def _selected_fields(request, field_map):
+    raw = request.GET.get("fields")
+    if not raw:
+        return list(field_map)
+    names = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = [name for name in names if name not in field_map]
+    if unknown:
+        raise APIError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def _columns(field_map, names):
+    columns = {"id"}
+    for name in names:
+        columns.update(field_map[name][0])
+    return sorted(columns)
+
+
+def _serialize(obj, field_map, names):
+    return {name: field_map[name][1](obj) for name in names}
+
+
+# --- Responses ---------------------------------------------------------------
+
+def _json_body(request):
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        raise APIError("Request body must be JSON.")
+    if not isinstance(payload, dict):
+        raise APIError("Request body must be a JSON object.")
+    return payload
+
+
+def _etag_matches(etag, if_none_match):
+    # Weak comparison: W/"x" matches "x"
+    tags = parse_etags(if_none_match)
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def _etag_response(request, payload, status=200):
+    body = json.dumps(payload, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    if status == 200 and _etag_matches(etag, request.headers.get("If-None-Match", "")):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(body, status=status, content_type="application/json")
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise APIError("Invalid cursor.")
+
+
+def _paginate(request, queryset):
+    """
+    Keyset pagination, newest first. Returns ``(rows, next_cursor)``.
+    """
+    try:
+        limit = min(max(int(request.GET.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        raise APIError("limit must be an integer.")
+    queryset = queryset.order_by("-id")
+    if request.GET.get("cursor"):
+        queryset = queryset.filter(id__lt=_decode_cursor(request.GET["cursor"]))
+    rows = list(queryset[:limit + 1])
+    next_cursor = _encode_cursor(rows[limit - 1].pk) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+# --- Clients -----------------------------------------------------------------
+
+@require_GET
+@api_view
+@read_replica
+def client_list(request):
+    names = _selected_fields(request, CLIENT_FIELDS)
+    clients = Client.objects.filter(user=request.user).only(*_columns(CLIENT_FIELDS, names))
+    if request.GET.get("active") in ("true", "false"):
+        clients = clients.filter(is_active=request.GET["active"] == "true")
+    rows, next_cursor = _paginate(request, clients)
+    return _etag_response(request, {
+        "results": [_serialize(c, CLIENT_FIELDS, names) for c in rows],
+        "next_cursor": next_cursor,
+    })
+
+
+@require_GET
+@api_view
+@read_replica
+def client_detail(request, pk):
+    names = _selected_fields(request, CLIENT_FIELDS)
+    client = get_object_or_404(
+        Client.objects.only(*_columns(CLIENT_FIELDS, names)), pk=pk, user=request.user
+    )
+    return _etag_response(request, _serialize(client, CLIENT_FIELDS, names))
+
+
+# --- Invoices ----------------------------------------------------------------
+
+def _embed_entries(request):
+    embed = {e.strip() for e in request.GET.get("embed", "").split(",") if e.strip()}
+    if embed - {"work_entries"}:
+        raise APIError(f"Unknown embed: {', '.join(sorted(embed - {'work_entries'}))}")
+    return "work_entries" in embed
+
+
+def _invoice_queryset(request, names, embed):
+    invoices = Invoice.objects.filter(user=request.user).only(*_columns(INVOICE_FIELDS, names))
+    if embed:
+        invoices = invoices.prefetch_related(
+            Prefetch("work_entries", queryset=WorkEntry.objects.only(*_columns(WORK_ENTRY_FIELDS, WORK_ENTRY_FIELDS)))
+        )
+    else:
+        if "total_hours" in names:
+            invoices = invoices.annotate(api_total_hours=Sum("work_entries__hours"))
+        if "total_amount" in names:
+            invoices = invoices.annotate(api_total_amount=Sum("work_entries__amount"))
+    return invoices
+
+
+def _serialize_invoice(invoice, names, embed):
+    data = _serialize(invoice, INVOICE_FIELDS, names)
+    if embed:
+        data["work_entries"] = [
+            _serialize(e, WORK_ENTRY_FIELDS, list(WORK_ENTRY_FIELDS)) for e in invoice.work_entries.all()
+        ]
+    return data
+
+
+@require_GET
+@api_view
+@read_replica
+def invoice_list(request):
+    names = _selected_fields(request, INVOICE_FIELDS)
+    embed = _embed_entries(request)
+    invoices = _invoice_queryset(request, names, embed)
+    if request.GET.get("client"):
+        if not request.GET["client"].isdigit():
+            raise APIError("client must be a client id.")
+        invoices = invoices.filter(client_id=request.GET["client"])
+    if request.GET.get("status"):
+        invoices = invoices.filter(status=request.GET["status"])
+    rows, next_cursor = _paginate(request, invoices)
+    return _etag_response(request, {
+        "results": [_serialize_invoice(inv, names, embed) for inv in rows],
+        "next_cursor": next_cursor,
+    })
+
+
+@require_GET
+@api_view
+@read_replica
+def invoice_detail(request, pk):
+    names = _selected_fields(request, INVOICE_FIELDS)
+    embed = _embed_entries(request)
+    invoice = get_object_or_404(_invoice_queryset(request, names, embed), pk=pk)
+    return _etag_response(request, _serialize_invoice(invoice, names, embed))
+
+
+@require_GET
+@api_view
+@read_replica
+def work_entry_list(request, pk):
+    names = _selected_fields(request, WORK_ENTRY_FIELDS)
+    invoice = get_object_or_404(Invoice.objects.only("id"), pk=pk, user=request.user)
+    entries = invoice.work_entries.only(*_columns(WORK_ENTRY_FIELDS, names))
+    return _etag_response(request, {"results": [_serialize(e, WORK_ENTRY_FIELDS, names) for e in entries]})
+
+
+@require_POST
+@api_view
+def invoice_batch_create(request):
+    """
+    Create an invoice with all of its work entries::
+
+        {"client": 3, "period_type": "weekly", "period_start": "2025-01-06",
+         "period_end": "2025-01-12", "hourly_rate": "80.00", "notes": "",
+         "work_entries": [{"work_date": "2025-01-06", "hours": "7.5",
+                           "description": "Development"}, ...]}
+    """
+    payload = _json_body(request)
+    # Not isinstance: JSON true would pass as client 1
+    if type(payload.get("client")) is not int:
+        raise APIError("client must be a client id.")
+    client = get_object_or_404(Client, pk=payload["client"], user=request.user)
+    form = InvoiceForm({
+        "period_type": payload.get("period_type", "weekly"),
+        "period_start": payload.get("period_start"),
+        "period_end": payload.get("period_end"),
+        "hourly_rate": payload.get("hourly_rate") or client.default_hourly_rate,
+        "status": payload.get("status", "draft"),
+        "notes": payload.get("notes", ""),
+    })
+    if not form.is_valid():
+        raise APIError("Invalid invoice.", errors=form.errors.get_json_data())
+    raw_entries = payload.get("work_entries", [])
+    if not isinstance(raw_entries, list):
+        raise APIError("work_entries must be a list.")
+    try:
+        entries = parse_entries(
+            raw_entries, form.cleaned_data["period_start"], form.cleaned_data["period_end"], skip_blank=False
+        )
+    except InvalidEntries as exc:
+        raise APIError("Invalid work entries.", errors={str(i): message for i, message in exc.errors.items()})
+
+    with tracking_changes(), updating_counters():
+        invoice = form.save(commit=False)
+        invoice.user = request.user
+        invoice.client = client
+        invoice.client_name = client.name
+        invoice.client_email = client.email
+        invoice.save()
+        for entry in entries:
+            entry.invoice = invoice
+            entry.amount = entry.compute_amount(invoice.hourly_rate)
+        WorkEntry.objects.bulk_create(entries)
+        track("work_entry", [entry.pk for entry in entries], user_id=request.user.pk)
+        if invoice.status == "paid":
+            add_to_counters(client.pk, paid=sum(entry.amount for entry in entries))
+
+    invoice._prefetched_objects_cache = {"work_entries": entries}
+    return _etag_response(request, _serialize_invoice(invoice, list(INVOICE_FIELDS), True), status=201)
+
+
+# --- Time slices -------------------------------------------------------------
+
+@require_POST
+@api_view
+@unpinned
+def time_slice_create(request):
+    """
+    Record time tracked by a timer::
+
+        {"slices": [{"client": 3, "started_at": "2025-01-06T09:00:00+01:00",
+                     "seconds": 300, "description": "Development",
+                     "key": "timer-7f3a-1041"}, ...]}
+
+    Answers 202 once the slices are stored; ``manage.py
+    coalesce_time_slices`` adds them to the day's work entry of the
+    client's open invoice. Slices whose ``key`` was already posted are
+    ignored, so a timer can safely retry. Slices are not read back until
+    they are added, so posting them does not pin the session to the
+    primary database (no session write per post).
+    """
+    rows = _json_body(request).get("slices")
+    if not isinstance(rows, list) or not 0 < len(rows) <= MAX_SLICES:
+        raise APIError(f"slices must be a list of 1 to {MAX_SLICES} slices.")
+    try:
+        slices = parse_slices(rows, request.user)
+    except InvalidSlices as exc:
+        raise APIError(str(exc), errors={str(i): message for i, message in exc.errors.items()})
+    record_slices(slices)
+    return JsonResponse({"received": len(slices)}, status=202)
+
+
+# --- Incremental sync --------------------------------------------------------
+
+CHANGE_TYPES = {
+    "client": (CLIENT_FIELDS, lambda user, ids: Client.objects.filter(user=user, pk__in=ids)),
+    "invoice": (INVOICE_FIELDS, lambda user, ids: Invoice.objects.filter(user=user, pk__in=ids).annotate(
+        api_total_hours=Sum("work_entries__hours"), api_total_amount=Sum("work_entries__amount"),
+    )),
+    "work_entry": (WORK_ENTRY_FIELDS, lambda user, ids: WorkEntry.objects.filter(invoice__user=user, pk__in=ids)),
+}
+
+
+@require_GET
+@api_view
+@read_replica
+def changes(request):
+    """
+    Everything that changed after ``since``, oldest first::
+
+        {"changes": [{"seq": 41, "type": "invoice", "id": 7, "data": {...}},
+                     {"seq": 42, "type": "work_entry", "id": 90, "deleted": true}],
+         "cursor": "NDI=", "has_more": false}
+
+    An object appears at most once, with its latest state. Omit ``since``
+    for a full sync; store ``cursor`` and pass it back as ``since`` next time.
+    """
+    try:
+        limit = min(max(int(request.GET.get("limit", CHANGES_LIMIT)), 1), CHANGES_MAX_LIMIT)
+    except ValueError:
+        raise APIError("limit must be an integer.")
+    since = _decode_cursor(request.GET["since"]) if request.GET.get("since") else 0
+
+    rows = list(
+        ChangeLog.objects.filter(user=request.user, seq__gt=since)
+        .order_by("seq")
+        .values_list("seq", "model", "object_id", "deleted")[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # One query per object type for the current state of the upserted rows
+    wanted = {}
+    for _, model, object_id, deleted in rows:
+        if not deleted:
+            wanted.setdefault(model, []).append(object_id)
+    objects = {}
+    for model, ids in wanted.items():
+        field_map, queryset = CHANGE_TYPES[model]
+        for obj in queryset(request.user, ids):
+            objects[model, obj.pk] = _serialize(obj, field_map, list(field_map))
+
+    results = []
+    for seq, model, object_id, deleted in rows:
+        data = None if deleted else objects.get((model, object_id))
+        change = {"seq": seq, "type": model, "id": object_id}
+        if data is None:
+            # Deleted, or deleted after this page's log rows were read
+            change["deleted"] = True
+        else:
+            change["data"] = data
+        results.append(change)
+
+    return _etag_response(request, {
+        "changes": results,
+        "cursor": _encode_cursor(rows[-1][0] if rows else since),
+        "has_more": has_more,
+    })
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class BillingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'billing'
+
+    def ready(self):
+        from . import auth, counters, sync
+
+        auth.connect_signals()
+        counters.connect_signals()
+        sync.connect_signals()
@@ -0,0 +1,140 @@
+"""
+Cold storage for old paid invoices.
+
+``manage.py archive_invoices`` moves paid invoices whose period ended and
+that were issued more than ``ARCHIVE_AFTER_DAYS`` ago, with their work
+entries, from ``Invoice``/``WorkEntry`` into ``ArchivedInvoice``/
+``ArchivedWorkEntry``. The hot tables and their indexes then only hold the
+invoices people actually work with.
+
+Reads only reach the archive when asked to: a list or report filtered to
+a date range that starts before the archive cutoff (or has no start)
+also reads the archive. Without a date filter, or with one starting
+later, the archive is never touched, and the page says that older paid
+invoices are archived. Archived invoices keep their ids, so their detail
+page and PDF keep working.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef, Sum
+from django.utils import timezone
+
+from .models import ArchivedInvoice, ArchivedWorkEntry, Invoice, OutboundEmail, WorkEntry
+from .sync import track
+
+INVOICE_COLUMNS = [
+    "id", "user_id", "client_id", "invoice_number", "client_name", "client_email", "period_type",
+    "period_start", "period_end", "hourly_rate", "date_issued", "status", "notes", "sent_pdf_sha256",
+]
+ENTRY_COLUMNS = ["id", "invoice_id", "work_date", "hours", "description", "hourly_rate", "amount"]
+
+
+def archive_cutoff(today=None):
+    return (today or timezone.localdate()) - timedelta(days=getattr(settings, "ARCHIVE_AFTER_DAYS", 730))
+
+
+def reaches_archive(date_from, date_to, today=None):
+    """
+    Whether a date filter from ``date_from`` to ``date_to`` (dates, ISO
+    strings or empty) reaches into the archive. Without any date the views
+    show the hot tables only. Archived periods all end before the cutoff,
+    so a later start never needs the archive.
+    """
+    if not (date_from or date_to):
+        return False
+    if not date_from:
+        return True
+    if isinstance(date_from, str):
+        try:
+            date_from = date.fromisoformat(date_from)
+        except ValueError:
+            return True
+    return date_from < archive_cutoff(today)
+
+
+def archived_totals(archived):
+    """
+    ``(count, hours, amount)`` of an ``ArchivedInvoice`` queryset in one query.
+    """
+    totals = archived.aggregate(count=Count("id"), hours=Sum("total_hours"), amount=Sum("total_amount"))
+    return totals["count"], totals["hours"] or 0, totals["amount"] or 0
+
+
+def archivable(cutoff):
+    """
+    Paid invoices issued and finished before ``cutoff``, with no email
+    still waiting to go out.
+    """
+    pending_email = OutboundEmail.objects.filter(invoice=OuterRef("pk"), status="queued")
+    return Invoice.objects.filter(
+        status="paid", date_issued__lt=cutoff, period_end__lt=cutoff
+    ).exclude(Exists(pending_email))
+
+
+def _delete_rows(model, column, ids):
+    # Plain DELETE: the ORM would load every row to send delete signals
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {column} IN ({', '.join(['%s'] * len(ids))})", list(ids)
+        )
+
+
+def _archive_batch(cutoff, batch_size):
+    ids = list(
+        archivable(cutoff).select_for_update(skip_locked=True)
+        .order_by("pk").values_list("pk", flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0, 0
+
+    invoices = list(
+        Invoice.objects.filter(pk__in=ids)
+        .annotate(archive_hours=Sum("work_entries__hours"), archive_amount=Sum("work_entries__amount"))
+        .values(*INVOICE_COLUMNS, "archive_hours", "archive_amount")
+    )
+    ArchivedInvoice.objects.bulk_create([
+        ArchivedInvoice(
+            **{column: row[column] for column in INVOICE_COLUMNS},
+            total_hours=row["archive_hours"] or 0,
+            total_amount=row["archive_amount"] or 0,
+        )
+        for row in invoices
+    ])
+    entries = [
+        ArchivedWorkEntry(**row)
+        for row in WorkEntry.objects.filter(invoice_id__in=ids).values(*ENTRY_COLUMNS)
+    ]
+    ArchivedWorkEntry.objects.bulk_create(entries, batch_size=2000)
+
+    # Keep the email history, just without the link to the hot row
+    OutboundEmail.objects.filter(invoice_id__in=ids).update(invoice=None)
+    # The objects leave the change feed: sync clients get tombstones for them
+    owners = {row["id"]: row["user_id"] for row in invoices}
+    for user_id in set(owners.values()):
+        track("invoice", [pk for pk, owner in owners.items() if owner == user_id], user_id=user_id, deleted=True)
+        track(
+            "work_entry", [e.id for e in entries if owners[e.invoice_id] == user_id], user_id=user_id, deleted=True,
+        )
+    _delete_rows(WorkEntry, "invoice_id", ids)
+    _delete_rows(Invoice, "id", ids)
+    return len(ids), len(entries)
+
+
+def archive_invoices(cutoff=None, batch_size=500):
+    """
+    Move every archivable invoice in batches of ``batch_size``, one
+    transaction each. Returns ``(invoices, entries)`` moved.
+    """
+    cutoff = cutoff or archive_cutoff()
+    moved_invoices = moved_entries = 0
+    while True:
+        with transaction.atomic():
+            invoices, entries = _archive_batch(cutoff, batch_size)
+        if not invoices:
+            return moved_invoices, moved_entries
+        moved_invoices += invoices
+        moved_entries += entries
@@ -0,0 +1,67 @@
+"""
+Cached user lookups for authenticated requests.
+
+With the stock ``ModelBackend`` every request loads its ``User`` with one
+query, and views that need the business details load the ``UserProfile``
+with another. ``CachedModelBackend`` keeps both in the cache for
+``AUTH_USER_CACHE_TTL`` seconds: ``AuthenticationMiddleware`` still checks
+the session's password hash against the cached user, and the lazy
+``request.user`` memoizes it for the rest of the request.
+
+Saving or deleting a ``User`` or ``UserProfile`` drops the entry once the
+transaction commits. That reaches every worker only with a shared cache;
+with a per-process cache the other workers keep serving the old copy, so a
+changed password or a deactivated account still gets in there until the
+TTL runs out. Production therefore enables the backend only with
+``REDIS_URL`` set. Even then, changes made with a queryset ``update()``
+(which sends no signals) show up only after ``AUTH_USER_CACHE_TTL``: that
+is the window in which a revoked user can still be let in, and the price
+of the saved query.
+
+Production pairs it with the ``cached_db`` (or ``signed_cookies``) session
+engine, which takes the session query off most requests too.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import UserProfile
+
+CACHE_KEY = "auth_user:{}"
+
+
+def invalidate_user(user_id):
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY.format(user_id)))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = CACHE_KEY.format(user_id)
+        user = cache.get(key)
+        if user is None:
+            UserModel = get_user_model()
+            # The profile comes along (or is cached as missing) in the same query
+            user = UserModel._default_manager.select_related("userprofile").filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(key, user, getattr(settings, "AUTH_USER_CACHE_TTL", 60))
+        return user if self.user_can_authenticate(user) else None
+
+
+def _user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def _profile_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+def connect_signals():
+    UserModel = get_user_model()
+    post_save.connect(_user_changed, sender=UserModel, dispatch_uid="auth_cache_user_saved")
+    post_delete.connect(_user_changed, sender=UserModel, dispatch_uid="auth_cache_user_deleted")
+    post_save.connect(_profile_changed, sender=UserProfile, dispatch_uid="auth_cache_profile_saved")
+    post_delete.connect(_profile_changed, sender=UserProfile, dispatch_uid="auth_cache_profile_deleted")
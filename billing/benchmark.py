@@ -0,0 +1,587 @@
+"""
+Performance benchmark harness.
+
+``generate_dataset`` seeds N users x M clients x K invoices with one work entry
+per day of each invoice period, using a fixed random seed so every run sees
+the same data. ``run_scenarios`` then drives the real views through the Django
+test client and records wall time, CPU time, query count and peak Python memory
+for each scenario. Results are plain dicts so they can be dumped to JSON and
+compared against a stored baseline with ``compare_to_baseline``.
+
+``run_pdf_engines`` compares the PDF engines on invoices of different
+lengths, ``run_pdf_memory`` renders thousands of invoices in one process to
+catch memory that grows with every render, and ``run_compression`` weighs the CPU cost of compressing (and
+minifying) responses against the bytes it saves.
+
+Run it through ``python manage.py benchmark`` (see the command for options).
+"""
+import gc
+import json
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+from django.test import Client as TestClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .compression import brotli, compress, minify_html
+from .counters import refresh_counters
+from .models import Client, Invoice, WorkEntry, UserProfile
+from .pdf import current_rss_mb, get_renderer, render_invoice_pdf
+
+PERIOD_DAYS = {"weekly": 7, "fortnightly": 14, "monthly": 30}
+
+DESCRIPTIONS = [
+    "Site visit",
+    "Development",
+    "Client meeting",
+    "Code review",
+    "Planning",
+    "Support",
+    "",
+]
+
+# Roughly what a long-time user's history looks like.
+STATUS_WEIGHTS = [("paid", 60), ("sent", 20), ("overdue", 5), ("draft", 15)]
+
+
+class Dataset:
+    """
+    Handles to the seeded objects that scenarios need.
+    """
+
+    def __init__(self, users, seed):
+        self.users = users
+        self.seed = seed
+        self.user = users[0]
+        # The longest invoice of the first user: the worst case for detail/PDF.
+        self.invoice = (
+            Invoice.objects.filter(user=self.user)
+            .annotate(entry_count=Count("work_entries"))
+            .order_by("-entry_count", "pk")
+            .first()
+        )
+        self.client = self.invoice.client
+
+
+def _period_for(index, period_type, today):
+    """
+    Return ``(start, end)`` for the ``index``-th period counting back from today.
+    """
+    length = PERIOD_DAYS[period_type]
+    monday = today - timedelta(days=today.weekday())
+    start = monday - timedelta(days=length * (index + 1))
+    return start, start + timedelta(days=length - 1)
+
+
+def generate_dataset(users=2, clients=5, invoices=20, seed=1234):
+    """
+    Create ``users`` x ``clients`` x ``invoices`` with daily work entries.
+
+    Everything goes in through ``bulk_create`` so seeding a large dataset
+    takes seconds, not minutes. Invoice numbers are assigned here because
+    ``bulk_create`` bypasses ``Invoice.save``.
+    """
+    rng = random.Random(seed)
+    today = timezone.localdate()
+    password = make_password("benchmark")
+    statuses = [s for s, _ in STATUS_WEIGHTS]
+    weights = [w for _, w in STATUS_WEIGHTS]
+
+    User.objects.bulk_create([
+        User(
+            username=f"bench_{seed}_{u}",
+            email=f"bench{u}@example.com",
+            first_name="Bench",
+            last_name=f"User {u}",
+            password=password,
+        )
+        for u in range(users)
+    ])
+    user_objs = list(User.objects.filter(username__startswith=f"bench_{seed}_").order_by("pk"))
+    UserProfile.objects.bulk_create([
+        UserProfile(user=user, business_name=f"Bench Business {i}", phone="0400 000 000",
+                    address="1 Example St\nMelbourne VIC 3000")
+        for i, user in enumerate(user_objs)
+    ])
+
+    Client.objects.bulk_create([
+        Client(
+            user=user,
+            name=f"Client {u}-{c}",
+            email=f"client{u}_{c}@example.com",
+            default_hourly_rate=Decimal(rng.randrange(30, 150)),
+        )
+        for u, user in enumerate(user_objs)
+        for c in range(clients)
+    ])
+    client_objs = list(Client.objects.filter(user__in=user_objs).order_by("pk"))
+
+    invoice_objs = []
+    for client in client_objs:
+        period_type = rng.choice(list(PERIOD_DAYS))
+        for k in range(invoices):
+            start, end = _period_for(invoices - 1 - k, period_type, today)
+            invoice_objs.append(Invoice(
+                user_id=client.user_id,
+                client=client,
+                invoice_number=f"{k + 1:05d}",
+                client_name=client.name,
+                client_email=client.email,
+                period_type=period_type,
+                period_start=start,
+                period_end=end,
+                hourly_rate=client.default_hourly_rate,
+                date_issued=end,
+                status=rng.choices(statuses, weights)[0],
+            ))
+    Invoice.objects.bulk_create(invoice_objs, batch_size=1000)
+    invoice_objs = Invoice.objects.filter(client__in=client_objs).order_by("pk")
+
+    entries = []
+    for invoice in invoice_objs.iterator():
+        day = invoice.period_start
+        while day <= invoice.period_end:
+            entry = WorkEntry(
+                invoice_id=invoice.pk,
+                work_date=day,
+                hours=Decimal(rng.randrange(0, 37)) / 4,
+                description=rng.choice(DESCRIPTIONS),
+            )
+            entry.amount = entry.compute_amount(invoice.hourly_rate)
+            entries.append(entry)
+            day += timedelta(days=1)
+        if len(entries) >= 5000:
+            WorkEntry.objects.bulk_create(entries)
+            entries = []
+    WorkEntry.objects.bulk_create(entries)
+    refresh_counters([client.pk for client in client_objs])
+
+    return Dataset(user_objs, seed)
+
+
+# --- Scenarios ---------------------------------------------------------------
+#
+# A scenario is ``setup(dataset) -> callable(http_client) -> response``. Setup
+# runs outside the timed region, so it can reset whatever state the request
+# mutates (e.g. put an invoice back into draft before "mark sent").
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def _get(url):
+    return lambda http: http.get(url)
+
+
+def invoice_post_data(invoice, start, days):
+    """
+    Form data for the invoice create/edit views with one entry per day,
+    matching what the JavaScript in ``invoice_form.html`` submits.
+    """
+    data = {
+        "period_type": invoice.period_type if invoice else "weekly",
+        "period_start": start.isoformat(),
+        "period_end": (start + timedelta(days=days - 1)).isoformat(),
+        "hourly_rate": "75.00",
+        "status": "draft",
+        "notes": "",
+        "work_entries-TOTAL_FORMS": str(days),
+        "work_entries-INITIAL_FORMS": "0",
+    }
+    for i in range(days):
+        data[f"work_entries-{i}-work_date"] = (start + timedelta(days=i)).isoformat()
+        data[f"work_entries-{i}-hours"] = "7.5"
+        data[f"work_entries-{i}-description"] = "Development"
+    return data
+
+
+@scenario("dashboard")
+def _dashboard(ds):
+    return _get(reverse("dashboard"))
+
+
+@scenario("client_list")
+def _client_list(ds):
+    return _get(reverse("client_list") + "?status=all")
+
+
+@scenario("client_detail")
+def _client_detail(ds):
+    return _get(reverse("client_detail", args=[ds.client.pk]))
+
+
+@scenario("invoice_list")
+def _invoice_list(ds):
+    return _get(reverse("invoice_list"))
+
+
+@scenario("invoice_detail")
+def _invoice_detail(ds):
+    return _get(reverse("invoice_detail", args=[ds.invoice.pk]))
+
+
+@scenario("invoice_pdf")
+def _invoice_pdf(ds):
+    return _get(reverse("invoice_pdf", args=[ds.invoice.pk]))
+
+
+@scenario("invoice_ubl")
+def _invoice_ubl(ds):
+    return _get(reverse("invoice_ubl", args=[ds.invoice.pk]))
+
+
+@scenario("invoice_create")
+def _invoice_create(ds):
+    start = timezone.localdate() - timedelta(days=timezone.localdate().weekday())
+    data = invoice_post_data(None, start, 7)
+    url = reverse("invoice_create_for_client", args=[ds.client.pk])
+    return lambda http: http.post(url, data)
+
+
+@scenario("invoice_edit")
+def _invoice_edit(ds):
+    invoice = ds.invoice
+    days = (invoice.period_end - invoice.period_start).days + 1
+    data = invoice_post_data(invoice, invoice.period_start, days)
+    data["status"] = invoice.status
+    url = reverse("invoice_edit", args=[invoice.pk])
+    return lambda http: http.post(url, data)
+
+
+@scenario("invoice_duplicate")
+def _invoice_duplicate(ds):
+    return _get(reverse("invoice_duplicate", args=[ds.invoice.pk]))
+
+
+def _reset_status(ds, status):
+    """
+    Put the scenario invoice back in ``status`` before a timed status
+    change. It is saved through the model, not a raw UPDATE, so the client
+    counters follow and repeated runs don't make them drift.
+    """
+    invoice = Invoice.objects.get(pk=ds.invoice.pk)
+    if invoice.status != status:
+        invoice.status = status
+        invoice.save(update_fields=["status"])
+
+
+@scenario("invoice_change_status")
+def _invoice_change_status(ds):
+    _reset_status(ds, "sent")
+    url = reverse("invoice_change_status", args=[ds.invoice.pk])
+    return lambda http: http.post(url, {"status": "paid", "next": reverse("invoice_list")})
+
+
+@scenario("invoice_status_fragment")
+def _invoice_status_fragment(ds):
+    _reset_status(ds, "sent")
+    url = reverse("invoice_status_fragment", args=[ds.invoice.pk])
+    return lambda http: http.post(url, {"status": "paid", "next": reverse("dashboard")})
+
+
+@scenario("invoice_mark_sent")
+def _invoice_mark_sent(ds):
+    _reset_status(ds, "draft")
+    return _get(reverse("invoice_mark_sent", args=[ds.invoice.pk]))
+
+
+@scenario("invoice_mark_paid")
+def _invoice_mark_paid(ds):
+    _reset_status(ds, "sent")
+    return _get(reverse("invoice_mark_paid", args=[ds.invoice.pk]))
+
+
+@scenario("time_slice_post")
+def _time_slice_post(ds):
+    url = reverse("api_time_slice_create")
+    body = json.dumps({"slices": [
+        {"client": ds.client.pk, "started_at": timezone.now().isoformat(), "seconds": 300},
+    ]})
+    return lambda http: http.post(url, body, content_type="application/json")
+
+
+def _run_once(http, setup, dataset):
+    request = setup(dataset)
+    gc.collect()
+    started, cpu_started = time.perf_counter(), time.process_time()
+    response = request(http)
+    if getattr(response, "streaming", False):
+        b"".join(response.streaming_content)
+    return (time.perf_counter() - started) * 1000, (time.process_time() - cpu_started) * 1000, response
+
+
+def run_scenario(name, dataset, repeat=5):
+    """
+    Time ``repeat`` runs of a scenario after one warm-up run, then do one more
+    run under ``tracemalloc`` and ``CaptureQueriesContext`` for memory and
+    query counts (kept separate so tracing overhead does not skew timings).
+    """
+    setup = SCENARIOS[name]
+    http = TestClient()
+    http.force_login(dataset.user)
+
+    _run_once(http, setup, dataset)  # warm-up: template loading, imports
+    timings, cpu_timings = [], []
+    for _ in range(repeat):
+        elapsed, cpu, response = _run_once(http, setup, dataset)
+        timings.append(elapsed)
+        cpu_timings.append(cpu)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            _, _, response = _run_once(http, setup, dataset)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status_code": response.status_code,
+        "wall_ms": {
+            "min": round(min(timings), 3),
+            "median": round(statistics.median(timings), 3),
+            "max": round(max(timings), 3),
+        },
+        # Process CPU time: what rendering-heavy views (PDF) cost a worker,
+        # without the database wait that wall time includes
+        "cpu_ms": round(statistics.median(cpu_timings), 3),
+        "queries": len(queries),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run_scenarios(dataset, names=None, repeat=5):
+    # PDFs of invoices the scenarios send go to a scratch store, not the real one
+    with tempfile.TemporaryDirectory() as sent_pdfs, override_settings(SENT_PDF_ROOT=sent_pdfs):
+        return {name: run_scenario(name, dataset, repeat) for name in (names or SCENARIOS)}
+
+
+# --- PDF engines -------------------------------------------------------------
+
+PDF_ENGINES = {
+    "xhtml2pdf": "billing.pdf.XHTML2PDFRenderer",
+    "reportlab": "billing.pdf_reportlab.ReportLabRenderer",
+}
+
+
+def pdf_engine_invoice(dataset, lines):
+    """
+    A new invoice of the dataset's client with ``lines`` daily work entries,
+    loaded the way the PDF view loads it.
+    """
+    client = dataset.client
+    end = timezone.localdate()
+    start = end - timedelta(days=lines - 1)
+    invoice = Invoice.objects.create(
+        user=dataset.user, client=client, client_name=client.name, client_email=client.email,
+        period_type="custom", period_start=start, period_end=end,
+        hourly_rate=client.default_hourly_rate, notes="Payment within 14 days.",
+    )
+    entries = []
+    for i in range(lines):
+        entry = WorkEntry(
+            invoice=invoice, work_date=start + timedelta(days=i), hours=Decimal("7.5"),
+            description=DESCRIPTIONS[i % len(DESCRIPTIONS)],
+        )
+        entry.amount = entry.compute_amount(invoice.hourly_rate)
+        entries.append(entry)
+    WorkEntry.objects.bulk_create(entries)
+    return (
+        Invoice.objects.select_related("client", "user__userprofile")
+        .prefetch_related("work_entries").get(pk=invoice.pk)
+    )
+
+
+def run_pdf_engines(dataset, line_counts=(1, 31, 365), engines=None, repeat=5):
+    """
+    Render an invoice of each size with each engine (``PDF_ENGINES`` keys)
+    after one warm-up render. Records median wall and CPU time per render,
+    peak Python memory of one more render under ``tracemalloc`` and the
+    PDF size, keyed ``"<engine>/<lines>"``.
+    """
+    results = {}
+    for lines in line_counts:
+        invoice = pdf_engine_invoice(dataset, lines)
+        profile = getattr(invoice.user, "userprofile", None)
+        for name in engines or PDF_ENGINES:
+            renderer = get_renderer(PDF_ENGINES[name])
+            renderer.render(invoice, profile)
+            timings, cpu_timings = [], []
+            for _ in range(repeat):
+                gc.collect()
+                started, cpu_started = time.perf_counter(), time.process_time()
+                pdf = renderer.render(invoice, profile)
+                timings.append((time.perf_counter() - started) * 1000)
+                cpu_timings.append((time.process_time() - cpu_started) * 1000)
+
+            gc.collect()
+            tracemalloc.start()
+            try:
+                renderer.render(invoice, profile)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            results[f"{name}/{lines}"] = {
+                "wall_ms": {
+                    "min": round(min(timings), 3),
+                    "median": round(statistics.median(timings), 3),
+                    "max": round(max(timings), 3),
+                },
+                "cpu_ms": round(statistics.median(cpu_timings), 3),
+                "peak_kb": round(peak / 1024, 1),
+                "pdf_kb": round(len(pdf) / 1024, 1),
+            }
+    return results
+
+
+# --- PDF memory --------------------------------------------------------------
+
+def _growth_per_1000(samples):
+    """
+    Least-squares slope of ``samples`` (one per render), per 1000 renders.
+    """
+    if len(samples) < 2:
+        return 0.0
+    slope, _ = statistics.linear_regression(range(len(samples)), samples)
+    return slope * 1000
+
+
+def run_pdf_memory(dataset, renders=2000, engines=None, warmup=0.5):
+    """
+    Render the dataset's invoices round-robin ``renders`` times with each
+    engine (``PDF_ENGINES`` keys or renderer paths) through
+    ``render_invoice_pdf``, sampling traced Python memory and RSS after
+    every render. Growth is the trend after the first ``warmup`` share of
+    renders, in KiB per 1000 renders: by then bounded caches have filled,
+    and only memory that grows with every render still climbs.
+    """
+    invoices = list(
+        Invoice.objects.filter(user__in=dataset.users).select_related("client", "user__userprofile")
+        .prefetch_related("work_entries").order_by("pk")
+    )
+    results = {}
+    for name in engines or PDF_ENGINES:
+        engine = PDF_ENGINES.get(name, name)
+        traced, rss = [], []
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            for i in range(renders):
+                invoice = invoices[i % len(invoices)]
+                render_invoice_pdf(invoice, getattr(invoice.user, "userprofile", None), engine=engine)
+                traced.append(tracemalloc.get_traced_memory()[0] / 1024)
+                rss.append(current_rss_mb() * 1024)
+        finally:
+            elapsed = time.perf_counter() - started
+            tracemalloc.stop()
+        settled = int(renders * warmup)
+        results[name] = {
+            "renders": renders,
+            "ms_per_render": round(elapsed * 1000 / renders, 2),
+            "traced_kb": {"settled": round(traced[settled], 1), "end": round(traced[-1], 1), "peak": round(max(traced), 1)},
+            "rss_mb": {"settled": round(rss[settled] / 1024, 1), "end": round(rss[-1] / 1024, 1)},
+            "traced_kb_per_1000": round(_growth_per_1000(traced[settled:]), 1),
+            "rss_kb_per_1000": round(_growth_per_1000(rss[settled:]), 1),
+        }
+    return results
+
+
+def pdf_memory_leaks(results, max_kb_per_1000=512):
+    """
+    Engines of ``run_pdf_memory`` results whose traced memory keeps growing
+    by more than ``max_kb_per_1000`` KiB per 1000 renders, or whose RSS grows
+    by four times that (RSS moves in allocator-sized steps).
+    """
+    leaks = []
+    for name, result in results.items():
+        if result["traced_kb_per_1000"] > max_kb_per_1000:
+            leaks.append(f"{name}: Python memory grows {result['traced_kb_per_1000']} KiB per 1000 renders")
+        if result["rss_kb_per_1000"] > 4 * max_kb_per_1000:
+            leaks.append(f"{name}: RSS grows {result['rss_kb_per_1000']} KiB per 1000 renders")
+    return leaks
+
+
+# --- Compression -------------------------------------------------------------
+
+COMPRESSION_SCENARIOS = ["dashboard", "client_list", "invoice_list", "invoice_detail", "invoice_ubl"]
+
+
+def _median_cpu_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        result = func()
+        timings.append((time.process_time() - started) * 1000)
+    return result, round(statistics.median(timings), 3)
+
+
+def run_compression(dataset, names=None, repeat=20):
+    """
+    Fetch each scenario's response uncompressed, then time minifying (HTML
+    only) and compressing the body with every available encoding the way
+    ``CompressionMiddleware`` does. Sizes are in KiB, CPU times are medians
+    of ``repeat`` runs.
+    """
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    results = {}
+    for name in names or COMPRESSION_SCENARIOS:
+        http = TestClient()
+        http.force_login(dataset.user)
+        response = SCENARIOS[name](dataset)(http)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        result = {"raw_kb": round(len(body) / 1024, 1)}
+        if response["Content-Type"].startswith("text/html"):
+            minified, result["minify_cpu_ms"] = _median_cpu_ms(
+                lambda: minify_html(body.decode()).encode(), repeat
+            )
+            result["minified_kb"] = round(len(minified) / 1024, 1)
+        for encoding in encodings:
+            compressed, cpu_ms = _median_cpu_ms(lambda: compress(body, encoding), repeat)
+            result[encoding] = {"kb": round(len(compressed) / 1024, 1), "cpu_ms": cpu_ms}
+        results[name] = result
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold=0.25):
+    """
+    Return a list of human-readable regressions.
+
+    A scenario regresses when its median wall time exceeds the baseline by
+    more than ``threshold`` (a fraction), or when it issues more queries.
+    Scenarios missing from either side are ignored.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        was, now = previous["wall_ms"]["median"], current["wall_ms"]["median"]
+        if was and now > was * (1 + threshold):
+            regressions.append(
+                f"{name}: median {now:.1f}ms vs baseline {was:.1f}ms "
+                f"(+{(now / was - 1) * 100:.0f}%)"
+            )
+        if current["queries"] > previous["queries"]:
+            regressions.append(
+                f"{name}: {current['queries']} queries vs baseline {previous['queries']}"
+            )
+    return regressions
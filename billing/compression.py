@@ -0,0 +1,144 @@
+"""
+Response compression, with optional HTML minification.
+
+``CompressionMiddleware`` works like Django's ``GZipMiddleware`` but also
+speaks brotli, which browsers prefer: at the low quality used for dynamic
+pages it packs HTML 10-25% tighter than gzip for no more CPU.
+Streaming responses (the UBL download) are compressed chunk by chunk as
+they are produced, so they stay streams. Only text types are touched:
+PDFs, zips and images are already compressed and pass through as-is.
+
+With ``HTML_MINIFY`` on, the indentation and blank lines the templates
+leave in HTML pages are stripped before compressing; ``pre``, ``textarea``,
+``script`` and ``style`` contents are kept exactly.
+
+Static files never reach this middleware: WhiteNoise answers them first,
+from the variants ``collectstatic`` compressed ahead of time.
+"""
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/xml", "application/javascript", "image/svg+xml")
+# Not worth a Content-Encoding below this many bytes
+MIN_SIZE = 200
+# Dynamic responses are compressed on every request; quality 4 is about as
+# fast as gzip -6 (11, the maximum, is for static files compressed once)
+BROTLI_QUALITY = 4
+# BREACH mitigation, as in GZipMiddleware
+GZIP_MAX_RANDOM_BYTES = 100
+
+PRESERVED_BLOCK = re.compile(r"<(pre|textarea|script|style)\b.*?</\1\s*>", re.S | re.I)
+LINE_BREAK_SPACE = re.compile(r"\n\s+")
+
+
+def negotiate(accept_encoding):
+    """
+    The encoding to answer ``accept_encoding`` with: "br", "gzip" or None.
+    """
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.partition(";")
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        try:
+            weights[name.strip()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            weights[name.strip()] = 0.0
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if weights.get(encoding, 0) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return compress_string(data, max_random_bytes=GZIP_MAX_RANDOM_BYTES)
+
+
+def compress_stream(chunks, encoding):
+    if encoding == "gzip":
+        yield from compress_sequence(chunks, max_random_bytes=GZIP_MAX_RANDOM_BYTES)
+        return
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in chunks:
+        # Flush so every chunk reaches the client as soon as it is produced
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def minify_html(html):
+    """
+    Strip indentation and blank lines outside ``pre``/``textarea``/
+    ``script``/``style`` blocks. A line break stays wherever one was, so
+    the rendered page is unchanged.
+    """
+    parts, position = [], 0
+    for block in PRESERVED_BLOCK.finditer(html):
+        parts.append(LINE_BREAK_SPACE.sub("\n", html[position:block.start()]))
+        parts.append(block.group(0))
+        position = block.end()
+    parts.append(LINE_BREAK_SPACE.sub("\n", html[position:]))
+    return "".join(parts)
+
+
+class CompressionMiddleware:
+    """
+    Minify (optionally) and brotli/gzip-compress text responses. Put it
+    right after WhiteNoise, so it sees the final response body.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        content_type = response.get("Content-Type", "").lower()
+        if response.has_header("Content-Encoding") or not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        if (
+            not response.streaming and content_type.startswith("text/html")
+            and getattr(settings, "HTML_MINIFY", False)
+        ):
+            response.content = minify_html(response.content.decode(response.charset)).encode(response.charset)
+            response.headers["Content-Length"] = str(len(response.content))
+
+        if not response.streaming and len(response.content) < MIN_SIZE:
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None or getattr(response, "is_async", False):
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+            # The compressed size is only known once the stream ends
+            del response.headers["Content-Length"]
+        else:
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # A strong ETag names exact bytes; the API still matches the weak one
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
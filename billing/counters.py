@@ -0,0 +1,294 @@
+"""
+Per-client summary counters: ``Client.invoice_count``, ``total_paid`` and
+``last_invoiced``.
+
+Client pages read these columns instead of counting and summing the
+client's invoices on every view. They include archived invoices, so
+``archive_invoices`` moving paid invoices out of the hot table leaves them
+as they are.
+
+Saves and deletes of invoices and work entries move the counters by what
+they changed, through signals: a new invoice adds one to the count, an
+invoice becoming paid adds its entries' amounts, an entry of a paid
+invoice adds the difference in its amount, and so on, each applied with
+a relative UPDATE (``total_paid = total_paid + n``). A write therefore
+costs the same however long the client's history is. Only the changes a
+delta can't express (an invoice deleted or moved to another client, an
+issue date moved back, a paid invoice re-priced) recompute the client's
+counters from its invoices and the archive's stored totals
+(``refresh_counters``).
+
+Outside ``updating_counters()`` a change is applied right away. Inside it,
+the changes are added up per client and applied once, at the end of the
+block's transaction. Bulk paths send no signals and call
+``add_to_counters`` themselves.
+
+``manage.py reconcile_client_counters`` repairs counters after writes that
+bypass all of this (raw SQL, queryset updates, fixtures, restores).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import (
+    Case, Count, DateField, DecimalField, F, IntegerField, Max, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.db.models.sql import UpdateQuery
+
+from .models import ArchivedInvoice, Client, Invoice, WorkEntry
+
+COUNTERS = ["invoice_count", "total_paid", "last_invoiced"]
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+_pending = ContextVar("counters_pending", default=None)
+_refresh_statements = {}
+
+
+def _per_client(queryset, client_field, aggregate, output_field):
+    return Subquery(
+        queryset.filter(**{client_field: OuterRef("pk")}).order_by()
+        .values(client_field).annotate(value=aggregate).values("value"),
+        output_field=output_field,
+    )
+
+
+def counter_expressions():
+    """
+    The three counters of the client in ``OuterRef("pk")``, as expressions
+    for ``update()`` or ``annotate()``.
+    """
+    invoices, archived = Invoice.objects.all(), ArchivedInvoice.objects.all()
+    paid_entries = WorkEntry.objects.filter(invoice__status="paid")
+
+    def last_issued(queryset):
+        return _per_client(queryset, "client_id", Max("date_issued"), DateField())
+
+    return {
+        "invoice_count": (
+            Coalesce(_per_client(invoices, "client_id", Count("pk"), IntegerField()), 0)
+            + Coalesce(_per_client(archived, "client_id", Count("pk"), IntegerField()), 0)
+        ),
+        "total_paid": Coalesce(
+            _per_client(paid_entries, "invoice__client_id", Sum("amount"), MONEY), Value(Decimal("0")), output_field=MONEY,
+        ) + Coalesce(
+            _per_client(archived, "client_id", Sum("total_amount"), MONEY), Value(Decimal("0")), output_field=MONEY,
+        ),
+        # Greatest() of a NULL is NULL on SQLite; pair each side with the other
+        "last_invoiced": Greatest(
+            Coalesce(last_issued(invoices), last_issued(archived)),
+            Coalesce(last_issued(archived), last_issued(invoices)),
+        ),
+    }
+
+
+def _refresh_statement():
+    """
+    The counters UPDATE of one client as ``(sql, params)``, with the client
+    id last. Compiling its subqueries takes far longer than running them
+    (about 5 ms against 0.1 ms on SQLite), so it is compiled once per
+    database vendor.
+    """
+    if connection.vendor not in _refresh_statements:
+        query = Client.objects.filter(pk=0).query.chain(UpdateQuery)
+        query.add_update_values(counter_expressions())
+        _refresh_statements[connection.vendor] = query.get_compiler(connection=connection).as_sql()
+    return _refresh_statements[connection.vendor]
+
+
+def refresh_counters(client_ids):
+    """
+    Recompute the counters of ``client_ids``, one UPDATE per client.
+    """
+    client_ids = sorted({pk for pk in client_ids if pk})
+    if client_ids:
+        statement, params = _refresh_statement()
+        with connection.cursor() as cursor:
+            # In id order, so concurrent refreshes lock clients in the same order
+            cursor.executemany(statement, [[*params[:-1], pk] for pk in client_ids])
+
+
+def reconcile_counters(batch_size=500, dry_run=False):
+    """
+    Compare every client's counters with freshly computed ones and rewrite
+    the stale ones (unless ``dry_run``), ``batch_size`` clients at a time.
+    Returns ``(clients checked, clients stale)``.
+    """
+    expected = {f"expected_{name}": expression for name, expression in counter_expressions().items()}
+    checked = stale = 0
+    last_id = 0
+    while True:
+        rows = list(
+            Client.objects.filter(pk__gt=last_id).order_by("pk").annotate(**expected)
+            .values("pk", *COUNTERS, *expected)[:batch_size]
+        )
+        if not rows:
+            return checked, stale
+        stale_ids = [
+            row["pk"] for row in rows
+            if any(row[name] != row[f"expected_{name}"] for name in COUNTERS)
+        ]
+        if stale_ids and not dry_run:
+            with transaction.atomic():
+                refresh_counters(stale_ids)
+        checked += len(rows)
+        stale += len(stale_ids)
+        last_id = rows[-1]["pk"]
+
+
+def add_to_counters(client_id, invoices=0, paid=0, issued=None, recount=False):
+    """
+    Move the counters of ``client_id`` by ``invoices`` invoices and
+    ``paid`` paid, and ``last_invoiced`` up to ``issued``; with
+    ``recount`` recompute them instead. Applied now, or at the end of the
+    enclosing ``updating_counters()`` block.
+    """
+    if not client_id:
+        return
+    pending = _pending.get()
+    changes = {} if pending is None else pending["clients"]
+    change = changes.setdefault(client_id, {"invoices": 0, "paid": Decimal("0"), "issued": None, "recount": False})
+    change["invoices"] += invoices
+    change["paid"] += paid
+    if issued and (change["issued"] is None or issued > change["issued"]):
+        change["issued"] = issued
+    change["recount"] = change["recount"] or recount
+    if pending is None:
+        _apply(changes)
+
+
+def _per_changed_client(changes, key, output_field, default):
+    whens = [When(pk=pk, then=Value(change[key], output_field=output_field)) for pk, change in changes if change[key]]
+    return Case(*whens, default=default, output_field=output_field) if whens else None
+
+
+def _apply(changes):
+    """
+    Apply the changes: one relative UPDATE for every client moved by
+    deltas, then a recount of the clients that need one.
+    """
+    recount = sorted(pk for pk, change in changes.items() if change["recount"])
+    moved = sorted((pk, change) for pk, change in changes.items() if not change["recount"])
+    values = {}
+    invoices = _per_changed_client(moved, "invoices", IntegerField(), Value(0))
+    if invoices is not None:
+        values["invoice_count"] = F("invoice_count") + invoices
+    paid = _per_changed_client(moved, "paid", MONEY, Value(Decimal("0"), output_field=MONEY))
+    if paid is not None:
+        values["total_paid"] = F("total_paid") + paid
+    issued = _per_changed_client(moved, "issued", DateField(), Value(None, output_field=DateField()))
+    if issued is not None:
+        # Greatest() of a NULL is NULL on SQLite; pair each side with the other
+        values["last_invoiced"] = Greatest(Coalesce(F("last_invoiced"), issued), Coalesce(issued, F("last_invoiced")))
+    if values:
+        Client.objects.filter(pk__in=[pk for pk, change in moved]).update(**values)
+    refresh_counters(recount)
+
+
+@contextmanager
+def updating_counters():
+    """
+    Run the block in a transaction and apply the counter changes of every
+    client it touched once, just before that transaction commits.
+    """
+    if _pending.get() is not None:
+        # An enclosing block applies them
+        with transaction.atomic():
+            yield
+        return
+    pending = {"clients": {}, "invoices": {}}
+    token = _pending.set(pending)
+    try:
+        with transaction.atomic():
+            yield
+            _apply(pending["clients"])
+    finally:
+        _pending.reset(token)
+
+
+# --- Signal receivers --------------------------------------------------------
+
+def _invoice_state(invoice_id, entry=None):
+    """
+    ``(client_id, status)`` of the invoice ``invoice_id``, from the entry's
+    cached invoice, the invoices seen in this block, or the database.
+    """
+    if entry is not None and WorkEntry.invoice.is_cached(entry) and entry.invoice.pk == invoice_id:
+        return entry.invoice.client_id, entry.invoice.status
+    pending = _pending.get()
+    if pending is not None and invoice_id in pending["invoices"]:
+        return pending["invoices"][invoice_id]
+    state = Invoice.objects.filter(pk=invoice_id).values_list("client_id", "status").first() or (None, None)
+    if pending is not None:
+        pending["invoices"][invoice_id] = state
+    return state
+
+
+def _add_entry_amount(invoice_id, amount, entry=None):
+    if amount:
+        client_id, status = _invoice_state(invoice_id, entry)
+        if status == "paid":
+            add_to_counters(client_id, paid=amount)
+
+
+def _invoice_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    pending = _pending.get()
+    if pending is not None:
+        pending["invoices"][instance.pk] = (instance.client_id, instance.status)
+    if created:
+        # Its entries are counted as they are added
+        add_to_counters(instance.client_id, invoices=1, issued=instance.date_issued)
+        return
+    loaded = getattr(instance, "_loaded_counters", None)
+    if loaded is None:
+        add_to_counters(instance.client_id, recount=True)
+        return
+    client_id, status, issued, rate = loaded
+    if (
+        client_id != instance.client_id
+        or instance.date_issued < issued
+        or (status == "paid" and rate != instance.hourly_rate)
+    ):
+        # A count moved, a latest date withdrawn or amounts re-priced in place
+        add_to_counters(client_id, recount=True)
+        add_to_counters(instance.client_id, recount=True)
+        return
+    paid = Decimal("0")
+    if (status == "paid") != (instance.status == "paid"):
+        paid = instance.work_entries.aggregate(s=Sum("amount"))["s"] or Decimal("0")
+        if status == "paid":
+            paid = -paid
+    add_to_counters(instance.client_id, paid=paid, issued=instance.date_issued if instance.date_issued > issued else None)
+
+
+def _invoice_deleted(sender, instance, **kwargs):
+    add_to_counters(instance.client_id, recount=True)
+
+
+def _entry_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = None if created else getattr(instance, "_loaded_entry", None)
+    if not created and loaded is None:
+        add_to_counters(_invoice_state(instance.invoice_id, instance)[0], recount=True)
+        return
+    if loaded == (instance.invoice_id, instance.amount):
+        return
+    if loaded is not None:
+        _add_entry_amount(loaded[0], -loaded[1])
+    _add_entry_amount(instance.invoice_id, instance.amount, instance)
+
+
+def _entry_deleted(sender, instance, **kwargs):
+    _add_entry_amount(instance.invoice_id, -instance.amount, instance)
+
+
+def connect_signals():
+    post_save.connect(_invoice_saved, sender=Invoice, dispatch_uid="counters_invoice_saved")
+    post_delete.connect(_invoice_deleted, sender=Invoice, dispatch_uid="counters_invoice_deleted")
+    post_save.connect(_entry_saved, sender=WorkEntry, dispatch_uid="counters_entry_saved")
+    post_delete.connect(_entry_deleted, sender=WorkEntry, dispatch_uid="counters_entry_deleted")
@@ -0,0 +1,95 @@
+"""
+Primary/replica database routing.
+
+Views decorated with ``@read_replica`` read from the ``replica`` database
+alias when one is configured. Everything else, including every write, uses
+``default``. After a request writes anything, ``ReplicaRoutingMiddleware``
+pins that session to the primary for ``DATABASE_REPLICA_PIN_SECONDS`` so
+the user never sees a list that is missing the invoice they just saved.
+Views decorated with ``@unpinned`` write nothing the user reads back right
+away, and leave the session (and its row) alone.
+"""
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA = "replica"
+PIN_SESSION_KEY = "_db_primary_until"
+
+_use_replica = ContextVar("use_replica", default=False)
+_wrote = ContextVar("wrote", default=None)
+
+
+def read_replica(view_func):
+    """
+    Mark a read-only view as safe to serve from the replica.
+    """
+    view_func.use_replica = True
+    return view_func
+
+
+def unpinned(view_func):
+    """
+    Mark a view whose writes do not need to pin the session to the primary.
+    """
+    view_func.pins_primary = False
+    return view_func
+
+
+def replica_enabled():
+    return REPLICA in connections.databases and getattr(settings, "DATABASE_REPLICA_READS", True)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        wrote = _wrote.get()
+        if wrote is not None and model._meta.app_label != "sessions":
+            wrote.append(model._meta.label)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Turns replica reads on for ``@read_replica`` views and pins a session to
+    the primary after it writes. Must come after ``AuthenticationMiddleware``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        wrote_token = _wrote.set([])
+        try:
+            response = self.get_response(request)
+            if _wrote.get() and hasattr(request, "session") and getattr(request, "_pins_primary", True):
+                pin = getattr(settings, "DATABASE_REPLICA_PIN_SECONDS", 10)
+                request.session[PIN_SESSION_KEY] = time.time() + pin
+            return response
+        finally:
+            _use_replica.set(False)
+            _wrote.reset(wrote_token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._pins_primary = getattr(view_func, "pins_primary", True)
+        if not getattr(view_func, "use_replica", False) or not replica_enabled():
+            return None
+        if request.method not in ("GET", "HEAD"):
+            return None
+        if hasattr(request, "session") and request.session.get(PIN_SESSION_KEY, 0) > time.time():
+            return None
+        # Resolve the user from the primary before switching, so a fresh
+        # login or password change is never checked against a lagging copy.
+        request.user.is_authenticated
+        _use_replica.set(True)
+        return None
@@ -0,0 +1,160 @@
+"""
+Set-based invoice duplication.
+
+``duplicate_invoices`` copies any number of invoices as new drafts in a
+fixed number of queries per batch, whatever the batch size or the number
+of work entries:
+
+1. one query reads the source invoices,
+2. the last invoice number of every client involved is read in one go (as
+   in ``billing.recurring``) and consecutive numbers are handed out,
+3. the copies are bulk-inserted,
+4. their work entries are copied by a single ``INSERT ... SELECT`` that
+   never brings the rows into Python,
+5. the new invoices and entries are recorded for incremental sync.
+
+With ``next_period`` the copies cover the period right after their
+source's, and every entry date moves by the same number of days; entries
+that would fall past the end of a shorter period (the 31st of a month
+rolled into a 30-day month) are left out.
+"""
+from django.db import NotSupportedError, connection
+from django.db.models import Max, Q
+
+from .counters import add_to_counters, updating_counters
+from .models import Invoice, WorkEntry
+from .periods import following_period
+from .recurring import last_invoice_numbers
+from .sync import track
+
+COPIED_FIELDS = ["user_id", "client_id", "client_name", "client_email", "period_type", "hourly_rate", "notes"]
+
+# Date arithmetic is the one part of the copy that differs per database
+SHIFTED_DATE = {
+    "postgresql": "e.work_date + m.shift",
+    "sqlite": "date(e.work_date, m.shift || ' days')",
+}
+
+
+def _last_user_numbers(user_ids):
+    """
+    Map user id -> last numeric invoice number, for invoices without a
+    client (numbered per user by ``Invoice.save``).
+    """
+    last_ids = (
+        Invoice.objects.filter(user_id__in=user_ids)
+        .values("user_id")
+        .annotate(last_id=Max("id"))
+        .values_list("last_id", flat=True)
+    )
+    return {
+        user_id: int(number) if (number or "").isdigit() else 0
+        for user_id, number in Invoice.objects.filter(id__in=last_ids).values_list("user_id", "invoice_number")
+    }
+
+
+def _copy_entries(pairs):
+    """
+    Copy the work entries of every ``(source, copy)`` pair in one statement.
+    """
+    entry_table = connection.ops.quote_name(WorkEntry._meta.db_table)
+    mapping, params = [], []
+    for source, copy in pairs:
+        shift = copy.period_start - source["period_start"]
+        # Last source date that still lands inside the copy's period
+        last_day = copy.period_end - shift
+        mapping.append("(%s, %s, %s, %s)")
+        params += [source["id"], copy.pk, shift.days, connection.ops.adapt_datefield_value(last_day)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH m (old_id, new_id, shift, last_day) AS (VALUES {', '.join(mapping)}) "
+            f"INSERT INTO {entry_table} (invoice_id, work_date, hours, description, hourly_rate, amount) "
+            f"SELECT m.new_id, {SHIFTED_DATE[connection.vendor]}, e.hours, e.description, e.hourly_rate, e.amount "
+            f"FROM {entry_table} e JOIN m ON e.invoice_id = m.old_id "
+            f"WHERE e.work_date <= m.last_day ORDER BY e.id",
+            params,
+        )
+
+
+def _duplicate_batch(sources, next_period, skip_existing):
+    targets = {}
+    for source in sources:
+        if next_period:
+            targets[source["id"]] = following_period(
+                source["period_type"], source["period_start"], source["period_end"]
+            )
+        else:
+            targets[source["id"]] = (source["period_start"], source["period_end"])
+
+    if skip_existing:
+        # Invoices without a client are matched among their user's client-less ones
+        existing = set(
+            Invoice.objects.filter(
+                Q(client_id__in={s["client_id"] for s in sources if s["client_id"]})
+                | Q(client__isnull=True, user_id__in={s["user_id"] for s in sources if not s["client_id"]}),
+                period_start__in={start for start, _ in targets.values()},
+            ).values_list("user_id", "client_id", "period_start")
+        )
+        sources = [
+            s for s in sources if (s["user_id"], s["client_id"], targets[s["id"]][0]) not in existing
+        ]
+        if not sources:
+            return []
+
+    numbers = last_invoice_numbers({s["client_id"] for s in sources if s["client_id"]})
+    if any(not s["client_id"] for s in sources):
+        user_numbers = _last_user_numbers({s["user_id"] for s in sources if not s["client_id"]})
+    copies = []
+    for source in sources:
+        if source["client_id"]:
+            key, counter = source["client_id"], numbers
+        else:
+            key, counter = source["user_id"], user_numbers
+        counter[key] = counter.get(key, 0) + 1
+        start, end = targets[source["id"]]
+        copies.append(Invoice(
+            **{field: source[field] for field in COPIED_FIELDS},
+            invoice_number=f"{counter[key]:05d}",
+            period_start=start,
+            period_end=end,
+            status="draft",
+        ))
+
+    # Both supported databases return the new ids from a bulk insert
+    Invoice.objects.bulk_create(copies)
+    _copy_entries(zip(sources, copies))
+
+    # Neither bulk_create nor raw SQL sends signals; record the new rows for sync and the counters ourselves
+    for copy in copies:
+        add_to_counters(copy.client_id, invoices=1, issued=copy.date_issued)
+    owners = {copy.pk: copy.user_id for copy in copies}
+    entry_ids = WorkEntry.objects.filter(invoice_id__in=owners).values_list("pk", "invoice_id")
+    by_user = {}
+    for pk, invoice_id in entry_ids:
+        by_user.setdefault(owners[invoice_id], []).append(pk)
+    for user_id in set(owners.values()):
+        track("invoice", [pk for pk, owner in owners.items() if owner == user_id], user_id=user_id)
+        track("work_entry", by_user.get(user_id, []), user_id=user_id)
+    return copies
+
+
+def duplicate_invoices(invoices, next_period=False, skip_existing=False, batch_size=500):
+    """
+    Copy every invoice of the ``invoices`` queryset, with its work entries,
+    as a new draft issued today, all in one transaction. With
+    ``next_period`` the copies move to the following period;
+    ``skip_existing`` leaves out invoices whose client (or, without a
+    client, whose user's client-less invoices) already has an invoice
+    starting on the target date, so rolling the same invoices
+    forward twice creates nothing the second time. Returns the new
+    invoices, in the order of their sources' ids.
+    """
+    if connection.vendor not in SHIFTED_DATE:
+        raise NotSupportedError(f"Invoice duplication does not support {connection.vendor}")
+    copies = []
+    with updating_counters():
+        sources = list(invoices.order_by("pk").values("id", "period_start", "period_end", *COPIED_FIELDS))
+        for i in range(0, len(sources), batch_size):
+            copies += _duplicate_batch(sources[i:i + batch_size], next_period, skip_existing)
+    return copies
+
@@ -1,8 +1,9 @@
 from django import forms
+from django.db.models import Max
 from django.forms import inlineformset_factory
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import Invoice, WorkEntry, Client, UserProfile
+from .models import Invoice, WorkEntry, Client, UserProfile, RecurringSchedule
 
 
 class RegisterForm(UserCreationForm):
@@ -57,6 +58,13 @@ class InvoiceForm(forms.ModelForm):
     def clean_status(self):
         return self.cleaned_data.get('status') or 'draft'
 
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('period_start'), cleaned_data.get('period_end')
+        if start and end and end < start:
+            raise forms.ValidationError('The period cannot end before it starts.')
+        return cleaned_data
+
 
 class WorkEntryForm(forms.ModelForm):
     class Meta:
@@ -127,3 +135,61 @@ class UserProfileForm(forms.ModelForm):
         # Add CSS classes for better styling
         for field in self.fields.values():
             field.widget.attrs.update({"class": "form-control"})
+
+
+class RecurringScheduleForm(forms.ModelForm):
+    """
+    Form for recurring invoice schedules. The weekday hours template is
+    edited as seven separate fields and stored as a list on the model.
+    """
+    WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+    class Meta:
+        model = RecurringSchedule
+        fields = [
+            "period_type",
+            "next_period_start",
+            "hourly_rate",
+            "entry_description",
+            "notes",
+            "is_active",
+        ]
+        widgets = {
+            "next_period_start": forms.DateInput(attrs={"type": "date"}),
+            "hourly_rate": forms.NumberInput(attrs={"step": "0.01", "min": "0"}),
+            "notes": forms.Textarea(attrs={"rows": 3}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        hours = self.instance.weekday_hours
+        for i, day in enumerate(self.WEEKDAYS):
+            self.fields[f"hours_{day}"] = forms.DecimalField(
+                label=day.title(), max_digits=5, decimal_places=2, min_value=0,
+                initial=hours[i], widget=forms.NumberInput(attrs={"step": "0.25", "min": "0"}),
+            )
+        for name, field in self.fields.items():
+            if name == 'is_active':
+                field.widget.attrs.update({"class": "form-check-input", "role": "switch"})
+            else:
+                field.widget.attrs.update({"class": "form-control"})
+
+    def weekday_fields(self):
+        return [self[f"hours_{day}"] for day in self.WEEKDAYS]
+
+    def clean_next_period_start(self):
+        start = self.cleaned_data["next_period_start"]
+        if self.instance.pk:
+            # Moving back over generated periods would invoice them twice
+            last_end = self.instance.invoices.aggregate(last_end=Max("period_end"))["last_end"]
+            if last_end and start <= last_end:
+                raise forms.ValidationError(
+                    f"Invoices were already generated up to {last_end:%Y-%m-%d}; start after that date."
+                )
+        return start
+
+    def save(self, commit=True):
+        self.instance.weekday_hours = [
+            str(self.cleaned_data[f"hours_{day}"]) for day in self.WEEKDAYS
+        ]
+        return super().save(commit=commit)
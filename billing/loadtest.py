@@ -0,0 +1,251 @@
+"""
+Closed-loop HTTP load generator.
+
+Each virtual user logs in over HTTP as one of the seeded benchmark users and
+then loops over a weighted mix of tasks (dashboard views, invoice creation
+with a month of entries, PDF downloads, status changes) until the run time is
+up. Latencies are recorded per task so the report shows where the time goes.
+A request counts as an error unless the server answered the way that task
+succeeds: a page that bounced to the login form, a create form re-rendered
+with errors or a status change that didn't take all count, although their
+HTTP status is below 400.
+
+The target server must share the database this process is configured with:
+task targets (client and invoice ids) are looked up directly, the same way a
+locally started gunicorn/uvicorn would see them.
+"""
+import random
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from django.contrib.auth.models import User
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+
+from .benchmark import invoice_post_data
+from .models import Client, Invoice
+
+PASSWORD = "benchmark"
+
+STATUSES = ["draft", "sent", "overdue", "paid"]
+
+
+class VirtualUser:
+    """
+    One logged-in browser session with the ids it needs to build requests.
+    """
+
+    def __init__(self, base_url, user, rng):
+        self.base_url = base_url
+        self.user = user
+        self.rng = rng
+        self.session = requests.Session()
+        self.client_ids = list(Client.objects.filter(user=user).values_list("pk", flat=True))
+        self.invoice_ids = list(Invoice.objects.filter(user=user).values_list("pk", flat=True))
+
+    def url(self, path):
+        return urljoin(self.base_url, path)
+
+    def login(self):
+        login_url = self.url(reverse("login"))
+        self.session.get(login_url)
+        response = self.session.post(login_url, {
+            "username": self.user.username,
+            "password": PASSWORD,
+            "csrfmiddlewaretoken": self.session.cookies.get("csrftoken", ""),
+        }, headers={"Referer": login_url}, allow_redirects=False)
+        if response.status_code != 302:
+            raise RuntimeError(f"Login failed for {self.user.username}: HTTP {response.status_code}")
+
+    def post(self, path, data):
+        url = self.url(path)
+        data = dict(data, csrfmiddlewaretoken=self.session.cookies.get("csrftoken", ""))
+        return self.session.post(url, data, headers={"Referer": url}, allow_redirects=False)
+
+
+# --- Tasks -------------------------------------------------------------------
+#
+# ``(name, weight, func)``; each func takes a VirtualUser, sends one request
+# and returns whether the server answered the way the task succeeds.
+
+def is_page(response, content_type="text/html"):
+    # Pages are fetched following redirects, so a lapsed session shows up
+    # as a 200 login form reached through a redirect.
+    return (
+        response.status_code == 200 and not response.history
+        and response.headers.get("Content-Type", "").startswith(content_type)
+    )
+
+
+def redirects_to(response, url_name):
+    if response.status_code != 302:
+        return False
+    try:
+        return resolve(urlsplit(response.headers.get("Location", "")).path).url_name == url_name
+    except Resolver404:
+        return False
+
+
+def has_status(response, status):
+    if response.status_code != 200:
+        return False
+    try:
+        return response.json().get("status") == status
+    except ValueError:
+        return False
+
+
+def _dashboard(vu):
+    return is_page(vu.session.get(vu.url(reverse("dashboard"))))
+
+
+def _client_list(vu):
+    return is_page(vu.session.get(vu.url(reverse("client_list"))))
+
+
+def _invoice_list(vu):
+    return is_page(vu.session.get(vu.url(reverse("invoice_list"))))
+
+
+def _invoice_detail(vu):
+    return is_page(vu.session.get(vu.url(reverse("invoice_detail", args=[vu.rng.choice(vu.invoice_ids)]))))
+
+
+def _invoice_pdf(vu):
+    response = vu.session.get(vu.url(reverse("invoice_pdf", args=[vu.rng.choice(vu.invoice_ids)])))
+    return is_page(response, "application/pdf")
+
+
+def _invoice_create_month(vu):
+    today = timezone.localdate()
+    start = today.replace(day=1) - timedelta(days=vu.rng.randrange(0, 365))
+    data = invoice_post_data(None, start, 31)
+    data["period_type"] = "monthly"
+    response = vu.post(reverse("invoice_create_for_client", args=[vu.rng.choice(vu.client_ids)]), data)
+    # A form with errors is re-rendered with a 200
+    return redirects_to(response, "invoice_detail")
+
+
+def _invoice_change_status(vu):
+    pk = vu.rng.choice(vu.invoice_ids)
+    status = vu.rng.choice(STATUSES)
+    # What the status pickers post: the fragment endpoint, not the full-page form
+    response = vu.post(reverse("invoice_status_fragment", args=[pk]), {
+        "status": status,
+        "next": reverse("dashboard"),
+    })
+    return has_status(response, status)
+
+
+TASKS = [
+    ("dashboard", 35, _dashboard),
+    ("client_list", 10, _client_list),
+    ("invoice_list", 10, _invoice_list),
+    ("invoice_detail", 15, _invoice_detail),
+    ("invoice_pdf", 10, _invoice_pdf),
+    ("invoice_create_month", 5, _invoice_create_month),
+    ("invoice_change_status", 15, _invoice_change_status),
+]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """
+    Thread-safe latency/error collector.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, name, elapsed_ms, ok):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(elapsed_ms)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, duration):
+        tasks = {}
+        total = errors = 0
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            failed = self.errors.get(name, 0)
+            total += len(values)
+            errors += failed
+            tasks[name] = {
+                "requests": len(values),
+                "errors": failed,
+                "error_rate": round(failed / len(values), 4),
+                "rps": round(len(values) / duration, 2),
+                "latency_ms": {
+                    "p50": round(percentile(values, 50), 1),
+                    "p90": round(percentile(values, 90), 1),
+                    "p95": round(percentile(values, 95), 1),
+                    "p99": round(percentile(values, 99), 1),
+                    "max": round(values[-1], 1),
+                },
+            }
+        return {
+            "duration_s": round(duration, 2),
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "rps": round(total / duration, 2) if duration else 0.0,
+            "tasks": tasks,
+        }
+
+
+def _worker(vu, deadline, recorder, think_time):
+    names = [name for name, _, _ in TASKS]
+    weights = [weight for _, weight, _ in TASKS]
+    funcs = {name: func for name, _, func in TASKS}
+    while time.monotonic() < deadline:
+        name = vu.rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            ok = funcs[name](vu)
+        except requests.RequestException:
+            ok = False
+        recorder.record(name, (time.perf_counter() - started) * 1000, ok)
+        if think_time:
+            time.sleep(vu.rng.uniform(0, think_time))
+
+
+def run_load(base_url, users, concurrency=10, duration=60, think_time=0.0, seed=1234):
+    """
+    Log in ``concurrency`` virtual users (cycling over ``users``) and drive
+    the task mix for ``duration`` seconds. Returns the summary dict.
+    """
+    rng = random.Random(seed)
+    virtual_users = []
+    for i in range(concurrency):
+        vu = VirtualUser(base_url, users[i % len(users)], random.Random(rng.random()))
+        vu.login()
+        virtual_users.append(vu)
+
+    recorder = Recorder()
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [
+        threading.Thread(target=_worker, args=(vu, deadline, recorder, think_time), daemon=True)
+        for vu in virtual_users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.monotonic() - started)
+
+
+def seeded_users(seed):
+    return list(User.objects.filter(username__startswith=f"bench_{seed}_").order_by("pk"))
@@ -0,0 +1,193 @@
+"""
+Database-backed outbound mail queue.
+
+``QueuedEmailBackend`` is a drop-in ``EMAIL_BACKEND``: anything Django sends
+(e.g. password reset emails) is stored as an ``OutboundEmail`` row instead
+of talking to SMTP inside the request. ``deliver_due`` is the worker side:
+it claims a batch of due rows, sends them over one connection of
+``MAIL_QUEUE_BACKEND`` and reschedules failures with exponential backoff.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Invoice, OutboundEmail
+from .pdf import invoice_pdf_filename, render_invoice_pdf
+from .pdf_store import freeze_sent_pdf, read_pdf
+
+# A claimed row is invisible to other workers for this long; if the worker
+# dies mid-batch the row simply becomes due again.
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def retry_delay(attempts):
+    base = getattr(settings, "MAIL_QUEUE_RETRY_BASE", 60)
+    cap = getattr(settings, "MAIL_QUEUE_RETRY_MAX", 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), cap))
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """
+    Email backend that enqueues messages for ``send_queued_mail``.
+    """
+
+    def send_messages(self, email_messages):
+        rows = []
+        for message in email_messages:
+            if message.attachments:
+                raise ValueError("QueuedEmailBackend does not support attachments; use enqueue_invoice_email.")
+            html = next(
+                (content for content, mimetype in getattr(message, "alternatives", []) if mimetype == "text/html"),
+                "",
+            )
+            rows.append(OutboundEmail(
+                from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+                to=list(message.to),
+                cc=list(message.cc),
+                bcc=list(message.bcc),
+                reply_to=list(message.reply_to),
+                subject=message.subject,
+                body=message.body,
+                html_body=html,
+            ))
+        OutboundEmail.objects.bulk_create(rows)
+        return len(rows)
+
+
+def enqueue_invoice_email(invoice, profile=None):
+    """
+    Queue ``invoice`` for delivery to its client with the PDF attached.
+    The PDF is rendered later by the worker, not in the request.
+    """
+    sender = (profile.business_name if profile else "") or invoice.user.get_full_name() or invoice.user.username
+    context = {"invoice": invoice, "profile": profile, "sender": sender}
+    return OutboundEmail.objects.create(
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[invoice.client_email],
+        reply_to=[invoice.user.email] if invoice.user.email else [],
+        subject=f"Invoice {invoice.invoice_number} from {sender}",
+        body=render_to_string("billing/invoice_email.txt", context),
+        invoice=invoice,
+    )
+
+
+def _claim_batch(batch_size, now):
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status="queued", next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        if batch:
+            OutboundEmail.objects.filter(pk__in=[e.pk for e in batch]).update(
+                next_attempt_at=now + CLAIM_LEASE
+            )
+    return batch
+
+
+def _attach_invoice_pdfs(batch):
+    """
+    Load the invoices referenced by the batch in one go and render the PDF
+    of each one that has no cached attachment yet, once per invoice. The
+    bytes are kept on the row so a retry does not render them again.
+    """
+    invoice_ids = {e.invoice_id for e in batch if e.invoice_id}
+    if not invoice_ids:
+        return
+    invoices = (
+        Invoice.objects.select_related("client", "user__userprofile")
+        .prefetch_related("work_entries")
+        .in_bulk(invoice_ids)
+    )
+    rendered = {}
+    for email in batch:
+        if not email.invoice_id:
+            continue
+        email.invoice = invoice = invoices[email.invoice_id]
+        if email.attachment is not None:
+            continue
+        if invoice.pk not in rendered:
+            if invoice.sent_pdf_pending:
+                # Marked sent but not stored yet: store it now, so the email and later downloads match
+                freeze_sent_pdf(invoice)
+            # A sent invoice goes out as the copy stored when it was sent
+            stored = read_pdf(invoice.sent_pdf_sha256) if invoice.sent_pdf_sha256 else None
+            rendered[invoice.pk] = stored or render_invoice_pdf(invoice, getattr(invoice.user, "userprofile", None))
+        email.attachment = rendered[invoice.pk]
+        OutboundEmail.objects.filter(pk=email.pk).update(attachment=email.attachment)
+
+
+def _build_message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.to,
+        cc=email.cc,
+        bcc=email.bcc,
+        reply_to=email.reply_to,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, "text/html")
+    if email.attachment is not None:
+        message.attach(invoice_pdf_filename(email.invoice), bytes(email.attachment), "application/pdf")
+    return message
+
+
+def deliver_due(batch_size=50, now=None):
+    """
+    Send one batch of due emails. Returns ``(sent, failed)`` counts.
+    """
+    now = now or timezone.now()
+    batch = _claim_batch(batch_size, now)
+    if not batch:
+        return 0, 0
+
+    max_attempts = getattr(settings, "MAIL_QUEUE_MAX_ATTEMPTS", 6)
+    connection = get_connection(settings.MAIL_QUEUE_BACKEND, fail_silently=False)
+    sent = failed = 0
+
+    def record_failure(email, exc):
+        nonlocal failed
+        failed += 1
+        email.attempts += 1
+        email.last_error = f"{type(exc).__name__}: {exc}"
+        if email.attempts >= max_attempts:
+            email.status = "failed"
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+    pending = list(batch)
+    try:
+        _attach_invoice_pdfs(batch)
+        connection.open()
+        while pending:
+            email = pending.pop(0)
+            try:
+                _build_message(email, connection).send()
+            except Exception as exc:
+                record_failure(email, exc)
+                # The connection may be unusable after an error; start over.
+                connection.close()
+                connection.open()
+            else:
+                sent += 1
+                email.attempts += 1
+                email.status = "sent"
+                email.sent_at = timezone.now()
+                email.last_error = ""
+    except Exception as exc:
+        # Could not render or (re)connect: the rest of the batch backs off too.
+        for email in pending:
+            record_failure(email, exc)
+    finally:
+        connection.close()
+        OutboundEmail.objects.bulk_update(
+            batch, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"]
+        )
+    return sent, failed
@@ -0,0 +1,39 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from billing.archive import archivable, archive_cutoff, archive_invoices
+
+
+class Command(BaseCommand):
+    help = "Move paid invoices older than ARCHIVE_AFTER_DAYS, and their work entries, to the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Archive invoices issued more than this many days ago")
+        parser.add_argument("--before", help="Archive invoices issued before this date (YYYY-MM-DD)")
+        parser.add_argument("--batch-size", type=int, default=500, help="Invoices per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be archived")
+
+    def handle(self, *args, **options):
+        if options["before"]:
+            try:
+                cutoff = date.fromisoformat(options["before"])
+            except ValueError:
+                raise CommandError(f"Invalid --before {options['before']!r}; expected YYYY-MM-DD.")
+        elif options["days"] is not None:
+            cutoff = timezone.localdate() - timedelta(days=options["days"])
+        else:
+            cutoff = archive_cutoff()
+
+        if options["dry_run"]:
+            self.stdout.write(f"{archivable(cutoff).count()} invoices issued before {cutoff} would be archived.")
+            return
+
+        started = time.perf_counter()
+        invoices, entries = archive_invoices(cutoff=cutoff, batch_size=options["batch_size"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {invoices} invoices and {entries} work entries issued before {cutoff} in {elapsed:.2f}s."
+        ))
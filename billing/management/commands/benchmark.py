@@ -0,0 +1,135 @@
+import json
+import platform
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from billing.benchmark import (
+    PDF_ENGINES, SCENARIOS, compare_to_baseline, generate_dataset, run_compression, run_pdf_engines,
+    run_scenarios,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with a reproducible dataset, time the "
+        "main billing views and compare the results against a stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2)
+        parser.add_argument("--clients", type=int, default=5, help="Clients per user")
+        parser.add_argument("--invoices", type=int, default=20, help="Invoices per client")
+        parser.add_argument("--seed", type=int, default=1234)
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per scenario")
+        parser.add_argument(
+            "--scenario", action="append", dest="scenarios", choices=sorted(SCENARIOS),
+            help="Only run this scenario (repeatable). Defaults to all.",
+        )
+        parser.add_argument("--output", default="benchmarks/latest.json", help="Where to write the JSON results")
+        parser.add_argument("--baseline", default="benchmarks/baseline.json",
+                            help="Baseline JSON to compare against (skipped if missing)")
+        parser.add_argument("--threshold", type=float, default=0.25,
+                            help="Allowed median slowdown before failing, as a fraction")
+        parser.add_argument("--save-baseline", action="store_true",
+                            help="Write these results to --baseline instead of comparing")
+        parser.add_argument("--pdf-engines", action="store_true",
+                            help="Also compare the PDF engines (%s)" % ", ".join(PDF_ENGINES))
+        parser.add_argument("--pdf-lines", default="1,31,365",
+                            help="Work entry counts of the invoices rendered by --pdf-engines")
+        parser.add_argument("--compression", action="store_true",
+                            help="Also report the CPU cost and savings of response compression")
+
+    def handle(self, *args, **options):
+        # Always run against a fresh test database so the dataset is
+        # reproducible and real data is never touched.
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.stdout.write(
+                f"Seeding {options['users']} users x {options['clients']} clients x "
+                f"{options['invoices']} invoices (seed {options['seed']})..."
+            )
+            dataset = generate_dataset(
+                users=options["users"],
+                clients=options["clients"],
+                invoices=options["invoices"],
+                seed=options["seed"],
+            )
+            results = run_scenarios(dataset, options["scenarios"], options["repeat"])
+            pdf_results = None
+            if options["pdf_engines"]:
+                line_counts = [int(n) for n in options["pdf_lines"].split(",")]
+                pdf_results = run_pdf_engines(dataset, line_counts, repeat=options["repeat"])
+            compression_results = run_compression(dataset) if options["compression"] else None
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            "meta": {
+                "users": options["users"],
+                "clients": options["clients"],
+                "invoices": options["invoices"],
+                "seed": options["seed"],
+                "repeat": options["repeat"],
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": settings.DATABASES["default"]["ENGINE"],
+            },
+            "results": results,
+        }
+        if pdf_results:
+            report["pdf_engines"] = pdf_results
+        if compression_results:
+            report["compression"] = compression_results
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<24} {result['wall_ms']['median']:>9.1f} ms  {result['cpu_ms']:>9.1f} ms cpu  "
+                f"{result['queries']:>5} queries  {result['peak_kb']:>9.1f} KiB  "
+                f"[{result['status_code']}]"
+            )
+
+        for name, result in (pdf_results or {}).items():
+            self.stdout.write(
+                f"pdf {name:<20} {result['wall_ms']['median']:>9.1f} ms  {result['cpu_ms']:>9.1f} ms cpu  "
+                f"{result['peak_kb']:>9.1f} KiB  {result['pdf_kb']:>7.1f} KiB pdf"
+            )
+
+        for name, result in (compression_results or {}).items():
+            line = f"compress {name:<15} {result['raw_kb']:>7.1f} KiB"
+            if "minified_kb" in result:
+                line += f"  minified {result['minified_kb']:>6.1f} KiB ({result['minify_cpu_ms']:.2f} ms)"
+            for encoding in ("gzip", "br"):
+                if encoding in result:
+                    line += f"  {encoding} {result[encoding]['kb']:>6.1f} KiB ({result[encoding]['cpu_ms']:.2f} ms)"
+            self.stdout.write(line)
+
+        output_path = Path(options["output"])
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_text(json.dumps(report, indent=2))
+        self.stdout.write(f"Results written to {options['output']}")
+
+        baseline_path = Path(options["baseline"])
+        if options["save_baseline"]:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(report, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {baseline_path}"))
+            return
+
+        if not baseline_path.exists():
+            self.stdout.write(f"No baseline at {baseline_path}; skipping comparison.")
+            return
+
+        baseline = json.loads(baseline_path.read_text())
+        if baseline.get("meta", {}).get("seed") != options["seed"]:
+            self.stdout.write(self.style.WARNING("Baseline was recorded with a different seed."))
+        regressions = compare_to_baseline(results, baseline["results"], options["threshold"])
+        if regressions:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
@@ -0,0 +1,81 @@
+import hashlib
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+# Written into STATIC_ROOT by the collectstatic run it describes
+STATIC_STAMP = ".collectstatic-fingerprint"
+
+
+def static_fingerprint():
+    """
+    Hash of every file collectstatic would copy, and of the settings that
+    decide what it writes.
+    """
+    digest = hashlib.sha256(f"{settings.STATIC_URL}\0{getattr(settings, 'STATICFILES_STORAGE', '')}".encode())
+    files = {}
+    for finder in finders.get_finders():
+        for path, storage in finder.list(["CVS", ".*", "*~"]):
+            files.setdefault(path, storage.path(path))
+    for path in sorted(files):
+        digest.update(path.encode() + b"\0" + Path(files[path]).read_bytes() + b"\0")
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the start-up steps in one process, skipping those with nothing to do: collectstatic when "
+        "the static sources are unchanged since the last run, migrate when no migration is pending."
+    )
+    # Run as a timed step of their own below
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Run collectstatic and migrate regardless")
+        parser.add_argument("--skip-migrate", action="store_true", help="Leave the database alone (build step)")
+
+    def step(self, name, func):
+        started = time.perf_counter()
+        outcome = func()
+        self.stdout.write(f"{name}: {outcome} in {time.perf_counter() - started:.2f}s")
+
+    def collectstatic(self):
+        stamp = Path(settings.STATIC_ROOT) / STATIC_STAMP
+        fingerprint = static_fingerprint()
+        if not self.force and stamp.is_file() and stamp.read_text() == fingerprint:
+            return "unchanged, skipped"
+        call_command("collectstatic", interactive=False, verbosity=0)
+        stamp.write_text(fingerprint)
+        return "collected"
+
+    def check(self):
+        call_command("check")
+        return "passed"
+
+    def migrate(self):
+        try:
+            executor = MigrationExecutor(connection)
+            pending = executor.migration_plan(executor.loader.graph.leaf_nodes())
+            if not pending and not self.force:
+                return "up to date, skipped"
+            call_command("migrate", interactive=False, verbosity=0)
+            return f"applied {len(pending)} migration(s)"
+        except Exception as exc:
+            # As before: a database that is not reachable yet must not stop the web server
+            return f"failed ({exc}), continuing"
+
+    def handle(self, *args, **options):
+        self.force = options["force"]
+        started = time.perf_counter()
+        if settings.STATIC_ROOT:
+            self.step("collectstatic", self.collectstatic)
+        self.step("check", self.check)
+        if not options["skip_migrate"]:
+            self.step("migrate", self.migrate)
+        self.stdout.write(self.style.SUCCESS(f"Boot steps done in {time.perf_counter() - started:.2f}s."))
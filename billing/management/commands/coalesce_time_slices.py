@@ -0,0 +1,36 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from billing.timeslices import coalesce_time_slices
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Add posted timer time slices to the day's work entry of each client's open invoice."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Slices per transaction")
+        parser.add_argument("--loop", action="store_true", help="Keep running instead of exiting when done")
+        parser.add_argument("--interval", type=float, default=60.0, help="Seconds between runs with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            try:
+                updated = coalesce_time_slices(batch_size=options["batch_size"])
+            except Exception:
+                if not options["loop"]:
+                    raise
+                # Batches commit one by one; the failed one is retried on the next run
+                logger.exception("Coalescing time slices failed; trying again in %ss", options["interval"])
+                close_old_connections()
+            else:
+                if updated or not options["loop"]:
+                    self.stdout.write(f"Updated {updated} work entries in {time.perf_counter() - started:.2f}s.")
+                if not options["loop"]:
+                    return
+            time.sleep(options["interval"])
@@ -0,0 +1,27 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.recurring import generate_due_invoices
+
+
+class Command(BaseCommand):
+    help = "Create draft invoices for every recurring schedule whose next period has started."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Treat this date (YYYY-MM-DD) as today")
+        parser.add_argument("--batch-size", type=int, default=500, help="Schedules per transaction")
+
+    def handle(self, *args, **options):
+        today = None
+        if options["date"]:
+            try:
+                today = date.fromisoformat(options["date"])
+            except ValueError:
+                raise CommandError(f"Invalid --date {options['date']!r}; expected YYYY-MM-DD.")
+
+        started = time.perf_counter()
+        created = generate_due_invoices(today=today, batch_size=options["batch_size"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Created {created} recurring invoices in {elapsed:.2f}s."))
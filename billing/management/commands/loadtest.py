@@ -0,0 +1,75 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.benchmark import generate_dataset
+from billing.loadtest import TASKS, run_load, seeded_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a realistic mix of freelancer traffic against a running server "
+        "and report throughput, latency percentiles and error rates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000/", help="Base URL of the server under test")
+        parser.add_argument("--concurrency", type=int, default=10, help="Number of virtual users")
+        parser.add_argument("--duration", type=float, default=60, help="Run time in seconds")
+        parser.add_argument("--think-time", type=float, default=0.0,
+                            help="Max random pause between a virtual user's requests, in seconds")
+        parser.add_argument("--seed", type=int, default=1234)
+        parser.add_argument("--seed-data", action="store_true",
+                            help="Create the benchmark users/clients/invoices first if they don't exist")
+        parser.add_argument("--users", type=int, default=10, help="Users to seed with --seed-data")
+        parser.add_argument("--clients", type=int, default=5, help="Clients per user with --seed-data")
+        parser.add_argument("--invoices", type=int, default=20, help="Invoices per client with --seed-data")
+        parser.add_argument("--output", default="", help="Also write the summary as JSON to this path")
+
+    def handle(self, *args, **options):
+        users = seeded_users(options["seed"])
+        if not users and options["seed_data"]:
+            self.stdout.write("Seeding load test data...")
+            generate_dataset(options["users"], options["clients"], options["invoices"], options["seed"])
+            users = seeded_users(options["seed"])
+        if not users:
+            raise CommandError(
+                f"No seeded users for seed {options['seed']}; run again with --seed-data."
+            )
+
+        self.stdout.write(
+            f"{options['concurrency']} virtual users ({len(users)} accounts) against "
+            f"{options['url']} for {options['duration']:g}s..."
+        )
+        try:
+            summary = run_load(
+                options["url"], users,
+                concurrency=options["concurrency"],
+                duration=options["duration"],
+                think_time=options["think_time"],
+                seed=options["seed"],
+            )
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(
+            f"{'task':<24}{'reqs':>7}{'err%':>7}{'rps':>8}{'p50':>8}{'p90':>8}{'p95':>8}{'p99':>8}"
+        )
+        for name, _, _ in TASKS:
+            task = summary["tasks"].get(name)
+            if not task:
+                continue
+            lat = task["latency_ms"]
+            self.stdout.write(
+                f"{name:<24}{task['requests']:>7}{task['error_rate'] * 100:>6.1f}%{task['rps']:>8.1f}"
+                f"{lat['p50']:>8.0f}{lat['p90']:>8.0f}{lat['p95']:>8.0f}{lat['p99']:>8.0f}"
+            )
+        self.stdout.write(
+            f"Total: {summary['requests']} requests, {summary['rps']:.1f} req/s, "
+            f"{summary['error_rate'] * 100:.2f}% errors"
+        )
+
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(summary, indent=2))
+            self.stdout.write(f"Summary written to {options['output']}")
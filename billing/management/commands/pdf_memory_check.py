@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from billing.benchmark import PDF_ENGINES, generate_dataset, pdf_memory_leaks, run_pdf_memory
+
+
+class Command(BaseCommand):
+    help = (
+        "Render thousands of invoice PDFs in one process from a throwaway test database, "
+        "tracking Python memory and RSS per render, and fail if either keeps growing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--renders", type=int, default=2000, help="Renders per engine")
+        parser.add_argument(
+            "--engine", action="append", dest="engines", choices=sorted(PDF_ENGINES),
+            help="Only check this engine (repeatable). Defaults to all.",
+        )
+        parser.add_argument("--clients", type=int, default=5)
+        parser.add_argument("--invoices", type=int, default=20, help="Invoices per client")
+        parser.add_argument("--seed", type=int, default=1234)
+        parser.add_argument("--max-growth", type=float, default=512,
+                            help="Allowed Python memory growth in KiB per 1000 renders")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            dataset = generate_dataset(
+                users=1, clients=options["clients"], invoices=options["invoices"], seed=options["seed"],
+            )
+            results = run_pdf_memory(dataset, options["renders"], options["engines"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<10} {result['renders']} renders  {result['ms_per_render']:>7.1f} ms each  "
+                f"python {result['traced_kb']['settled']:.0f} -> {result['traced_kb']['end']:.0f} KiB "
+                f"({result['traced_kb_per_1000']:+.1f} KiB/1000)  "
+                f"rss {result['rss_mb']['settled']:.1f} -> {result['rss_mb']['end']:.1f} MB "
+                f"({result['rss_kb_per_1000']:+.1f} KiB/1000)"
+            )
+        leaks = pdf_memory_leaks(results, options["max_growth"])
+        if leaks:
+            raise CommandError("Unbounded memory growth:\n  " + "\n  ".join(leaks))
+        self.stdout.write(self.style.SUCCESS("No memory growth across renders."))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from billing.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute every client's invoice count, total paid and last invoice date, and fix the stale ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Clients per query")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the clients with stale counters")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        checked, stale = reconcile_counters(batch_size=options["batch_size"], dry_run=options["dry_run"])
+        elapsed = time.perf_counter() - started
+        action = "would be fixed" if options["dry_run"] else "fixed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} clients in {elapsed:.2f}s; {stale} had stale counters ({action})."
+        ))
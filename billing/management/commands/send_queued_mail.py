@@ -0,0 +1,43 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from billing.mail import deliver_due
+from billing.pdf_store import freeze_pending_pdfs
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued outbound emails over a shared connection, retrying failures with backoff, "
+        "and store the PDFs of invoices marked sent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50, help="Emails sent per connection")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when the queue is empty")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent, failed = deliver_due(batch_size=options["batch_size"])
+                stored = freeze_pending_pdfs()
+            except Exception:
+                if not options["loop"]:
+                    raise
+                # One bad round (database gone, a render crashing) must not stop all mail
+                logger.exception("Mail worker round failed; trying again in %ss", options["interval"])
+                close_old_connections()
+                time.sleep(options["interval"])
+                continue
+            if sent or failed or stored:
+                self.stdout.write(f"Sent {sent}, failed {failed}, stored {stored} sent PDF(s).")
+                # Keep draining without sleeping while there is a backlog.
+                continue
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.23 on 2026-10-19 09:47
+
+from django.db import migrations, models
+
+
+def backfill_amounts(apps, schema_editor):
+    Invoice = apps.get_model('billing', 'Invoice')
+    WorkEntry = apps.get_model('billing', 'WorkEntry')
+    invoice_rate = Invoice.objects.filter(pk=models.OuterRef('invoice_id')).values('hourly_rate')[:1]
+    WorkEntry.objects.update(amount=models.ExpressionWrapper(
+        models.F('hours') * models.Subquery(invoice_rate),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0010_per_client_invoice_numbering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workentry',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Hours x rate, stored when the entry is saved', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='workentry',
+            name='hourly_rate',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Overrides the invoice hourly rate for this entry', max_digits=8, null=True),
+        ),
+        migrations.RunPython(backfill_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.23 on 2026-10-19 09:49
+
+import billing.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billing', '0011_workentry_amount_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_type', models.CharField(choices=[('weekly', 'Weekly'), ('fortnightly', 'Fortnightly'), ('monthly', 'Monthly')], default='weekly', max_length=12)),
+                ('next_period_start', models.DateField(help_text='Start of the next period to invoice')),
+                ('hourly_rate', models.DecimalField(blank=True, decimal_places=2, help_text="Leave empty to use the client's default rate", max_digits=8, null=True)),
+                ('weekday_hours', models.JSONField(default=billing.models.default_weekday_hours, help_text='Hours to pre-fill for each weekday, Monday first')),
+                ('entry_description', models.CharField(blank=True, max_length=200)),
+                ('notes', models.TextField(blank=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['next_period_start', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='recurringschedule',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_schedules', to='billing.client'),
+        ),
+        migrations.AddField(
+            model_name='recurringschedule',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_schedules', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='schedule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='billing.recurringschedule'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringschedule',
+            index=models.Index(fields=['is_active', 'next_period_start'], name='billing_rec_is_acti_aed016_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(condition=models.Q(('schedule__isnull', False)), fields=('schedule', 'period_start'), name='unique_schedule_period'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.23 on 2026-10-19 09:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def seed_change_log(apps, schema_editor):
+    """
+    Give every existing object a sequence number, so a first sync from
+    ``since=0`` returns everything.
+    """
+    User = apps.get_model('auth', 'User')
+    Client = apps.get_model('billing', 'Client')
+    Invoice = apps.get_model('billing', 'Invoice')
+    WorkEntry = apps.get_model('billing', 'WorkEntry')
+    ChangeCounter = apps.get_model('billing', 'ChangeCounter')
+    ChangeLog = apps.get_model('billing', 'ChangeLog')
+    for user_id in User.objects.values_list('pk', flat=True).iterator():
+        ids = [('client', pk) for pk in Client.objects.filter(user_id=user_id).values_list('pk', flat=True)]
+        ids += [('invoice', pk) for pk in Invoice.objects.filter(user_id=user_id).values_list('pk', flat=True)]
+        ids += [
+            ('work_entry', pk)
+            for pk in WorkEntry.objects.filter(invoice__user_id=user_id).values_list('pk', flat=True)
+        ]
+        if not ids:
+            continue
+        ChangeLog.objects.bulk_create(
+            [ChangeLog(user_id=user_id, model=model, object_id=pk, seq=seq) for seq, (model, pk) in enumerate(ids, 1)],
+            batch_size=2000,
+        )
+        ChangeCounter.objects.create(user_id=user_id, value=len(ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billing', '0013_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('seq', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'seq'], name='billing_cha_user_id_8756a4_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='changelog',
+            constraint=models.UniqueConstraint(fields=('model', 'object_id'), name='unique_changelog_object'),
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
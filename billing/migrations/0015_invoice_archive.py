@@ -0,0 +1,59 @@
+# Generated by Django 4.2.23 on 2026-10-19 10:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billing', '0014_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedInvoice',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('invoice_number', models.CharField(blank=True, max_length=20)),
+                ('client_name', models.CharField(max_length=120)),
+                ('client_email', models.EmailField(blank=True, max_length=254)),
+                ('period_type', models.CharField(choices=[('weekly', 'Weekly'), ('fortnightly', 'Fortnightly'), ('monthly', 'Monthly'), ('custom', 'Custom range')], max_length=12)),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('hourly_rate', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('date_issued', models.DateField()),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('sent', 'Sent'), ('paid', 'Paid'), ('overdue', 'Overdue')], max_length=10)),
+                ('notes', models.TextField(blank=True)),
+                ('total_hours', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_invoices', to='billing.client')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_invoices', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedWorkEntry',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('work_date', models.DateField()),
+                ('hours', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('hourly_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='work_entries', to='billing.archivedinvoice')),
+            ],
+            options={
+                'ordering': ['work_date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedinvoice',
+            index=models.Index(fields=['user', 'period_start'], name='billing_arc_user_id_2285ce_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.23 on 2026-10-19 10:50
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+MONEY = models.DecimalField(max_digits=12, decimal_places=2)
+
+
+def _per_client(queryset, client_field, aggregate, output_field):
+    return Subquery(
+        queryset.filter(**{client_field: OuterRef('pk')}).order_by()
+        .values(client_field).annotate(value=aggregate).values('value'),
+        output_field=output_field,
+    )
+
+
+def backfill_counters(apps, schema_editor):
+    # The counters as billing.counters computed them when this migration was
+    # written, kept here so later changes to that module can't alter it
+    Client = apps.get_model('billing', 'Client')
+    invoices = apps.get_model('billing', 'Invoice').objects.all()
+    archived = apps.get_model('billing', 'ArchivedInvoice').objects.all()
+    paid_entries = apps.get_model('billing', 'WorkEntry').objects.filter(invoice__status='paid')
+
+    def last_issued(queryset):
+        return _per_client(queryset, 'client_id', Max('date_issued'), models.DateField())
+
+    Client.objects.update(
+        invoice_count=(
+            Coalesce(_per_client(invoices, 'client_id', Count('pk'), models.IntegerField()), 0)
+            + Coalesce(_per_client(archived, 'client_id', Count('pk'), models.IntegerField()), 0)
+        ),
+        total_paid=Coalesce(
+            _per_client(paid_entries, 'invoice__client_id', Sum('amount'), MONEY), Value(Decimal('0')), output_field=MONEY,
+        ) + Coalesce(
+            _per_client(archived, 'client_id', Sum('total_amount'), MONEY), Value(Decimal('0')), output_field=MONEY,
+        ),
+        # Greatest() of a NULL is NULL on SQLite; pair each side with the other
+        last_invoiced=Greatest(
+            Coalesce(last_issued(invoices), last_issued(archived)),
+            Coalesce(last_issued(archived), last_issued(invoices)),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0015_invoice_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='invoice_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of invoices issued to this client'),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='last_invoiced',
+            field=models.DateField(blank=True, editable=False, help_text="Issue date of the client's latest invoice", null=True),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='total_paid',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text="Total amount of the client's paid invoices", max_digits=12),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-19 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0016_client_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='sent_pdf_sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='sent_pdf_sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
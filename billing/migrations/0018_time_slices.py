@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billing', '0017_sent_pdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimeSlice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('work_date', models.DateField()),
+                ('seconds', models.PositiveIntegerField()),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('key', models.CharField(blank=True, max_length=64)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='billing.client')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='timeslice',
+            constraint=models.UniqueConstraint(condition=models.Q(('key', ''), _negated=True), fields=('user', 'key'), name='unique_time_slice_key'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0018_time_slices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='sent_pdf_pending',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
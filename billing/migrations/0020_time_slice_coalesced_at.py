@@ -0,0 +1,22 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0019_invoice_sent_pdf_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timeslice',
+            name='coalesced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='timeslice',
+            index=models.Index(fields=['coalesced_at'], name='billing_tim_coalesc_2c1d70_idx'),
+        ),
+    ]
@@ -1,5 +1,5 @@
 from decimal import Decimal
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
@@ -45,6 +45,27 @@ class Client(models.Model):
         help_text="When this client was last updated"
     )
 
+    # Summary counters over the client's invoices, archived ones included,
+    # kept up to date by billing.counters
+    invoice_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Number of invoices issued to this client"
+    )
+    total_paid = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        help_text="Total amount of the client's paid invoices"
+    )
+    last_invoiced = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Issue date of the client's latest invoice"
+    )
+
     class Meta:
         ordering = ["name"]
 
@@ -85,6 +106,8 @@ class Invoice(models.Model):
         ('overdue', 'Overdue'),
     ]
 
+    is_archived = False
+
     # User who owns this invoice
     user = models.ForeignKey(
         User,
@@ -117,37 +140,148 @@ class Invoice(models.Model):
     date_issued = models.DateField(default=timezone.localdate)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
     notes = models.TextField(blank=True)
+    # SHA-256 of the PDF stored when the invoice was sent (billing/pdf_store.py)
+    sent_pdf_sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    # Sent, but its PDF is not stored yet: the mail worker stores it
+    sent_pdf_pending = models.BooleanField(default=False, editable=False)
+    # When a worker started storing it; another may take over once it is old
+    sent_pdf_claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Set when the invoice was generated from a recurring schedule
+    schedule = models.ForeignKey(
+        "RecurringSchedule",
+        related_name="invoices",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
 
     class Meta:
         ordering = ["-id"]
         unique_together = [['client', 'invoice_number']]
+        constraints = [
+            # One generated invoice per schedule and period, so re-running
+            # the generator can never bill the same period twice.
+            models.UniqueConstraint(
+                fields=["schedule", "period_start"],
+                condition=models.Q(schedule__isnull=False),
+                name="unique_schedule_period",
+            ),
+        ]
 
     def __str__(self):
         return f"Invoice {self.invoice_number or '(draft)'} - {self.client_name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_loaded()
+
+    def _remember_loaded(self):
+        # Remember the loaded rate so save() knows whether entry amounts went stale
+        self._loaded_hourly_rate = self.__dict__.get("hourly_rate")
+        # ... and what the client counters depend on, so they move by the difference
+        counted = ("client_id", "status", "date_issued", "hourly_rate")
+        self._loaded_counters = (
+            tuple(self.__dict__[name] for name in counted) if all(name in self.__dict__ for name in counted) else None
+        )
+
     def get_absolute_url(self):
         return reverse("invoice_detail", args=[self.pk])
 
+    def _next_invoice_number(self):
+        if self.client_id:
+            # Lock the client until the invoice is saved, as the bulk paths
+            # do, so two invoices of one client can't get the same number
+            Client.objects.select_for_update().filter(pk=self.client_id).values_list("pk").first()
+            last = Invoice.objects.filter(client_id=self.client_id).order_by("-id").first()
+            # Keep counting past numbers that were moved to the archive
+            archived = ArchivedInvoice.objects.filter(client_id=self.client_id).order_by("-id").first()
+            if archived and (last is None or archived.pk > last.pk):
+                last = archived
+        else:
+            last = Invoice.objects.filter(user=self.user).order_by("-id").first()
+        next_num = 1
+        if last and (last.invoice_number or "").isdigit():
+            next_num = int(last.invoice_number) + 1
+        return f"{next_num:05d}"
+
+    def reset_sent_pdf(self):
+        """
+        Drop the stored PDF: a draft has none, any other invoice is queued
+        for the mail worker to store it again. Returns the fields changed.
+        """
+        self.sent_pdf_sha256 = ""
+        self.sent_pdf_pending = self.status != "draft"
+        self.sent_pdf_claimed_at = None
+        return ["sent_pdf_sha256", "sent_pdf_pending", "sent_pdf_claimed_at"]
+
     def save(self, *args, **kwargs):
-        if not self.invoice_number:
-            if self.client_id:
-                last = Invoice.objects.filter(client_id=self.client_id).order_by("-id").first()
-            else:
-                last = Invoice.objects.filter(user=self.user).order_by("-id").first()
-            next_num = 1
-            if last and (last.invoice_number or "").isdigit():
-                next_num = int(last.invoice_number) + 1
-            self.invoice_number = f"{next_num:05d}"
-        super().save(*args, **kwargs)
+        if kwargs.get("update_fields") is None:
+            # Any field may have changed, so the stored PDF may no longer match
+            self.reset_sent_pdf()
+        loaded_rate = getattr(self, "_loaded_hourly_rate", None)
+        rate_changed = loaded_rate is not None and loaded_rate != self.hourly_rate
+        if self.invoice_number and not rate_changed:
+            super().save(*args, **kwargs)
+        else:
+            with transaction.atomic():
+                if not self.invoice_number:
+                    self.invoice_number = self._next_invoice_number()
+                if rate_changed:
+                    # Entries without their own rate follow the invoice rate. They are
+                    # re-priced first, so post_save receivers see the new amounts.
+                    self.work_entries.filter(hourly_rate__isnull=True).update(
+                        amount=models.ExpressionWrapper(
+                            models.F("hours") * self.hourly_rate,
+                            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+                        )
+                    )
+                super().save(*args, **kwargs)
+        self._remember_loaded()
+
+    def _prefetched_entries(self):
+        """
+        Work entries loaded by ``prefetch_related("work_entries")``, or None.
+        Lets the totals below reuse the rows a view already fetched.
+        """
+        return getattr(self, "_prefetched_objects_cache", {}).get("work_entries")
+
+    @classmethod
+    def with_totals(cls, invoices):
+        """
+        ``invoices`` annotated with their entries' hours and amount, so
+        a list reads ``total_hours`` and ``total_amount`` without a query
+        per invoice.
+        """
+        return invoices.annotate(
+            entries_hours=models.Sum("work_entries__hours"), entries_amount=models.Sum("work_entries__amount"),
+        )
 
     @property
     def total_hours(self):
+        if "entries_hours" in self.__dict__:
+            return self.entries_hours or Decimal("0.00")
+        entries = self._prefetched_entries()
+        if entries is not None:
+            return sum((e.hours for e in entries), Decimal("0.00"))
         agg = self.work_entries.aggregate(s=models.Sum("hours"))
         return agg["s"] or Decimal("0.00")
 
     @property
     def total_amount(self):
-        return self.total_hours * self.hourly_rate
+        if "entries_amount" in self.__dict__:
+            return self.entries_amount or Decimal("0.00")
+        entries = self._prefetched_entries()
+        if entries is not None:
+            return sum((e.amount for e in entries), Decimal("0.00"))
+        agg = self.work_entries.aggregate(s=models.Sum("amount"))
+        return agg["s"] or Decimal("0.00")
 
 
 class WorkEntry(models.Model):
@@ -157,6 +291,20 @@ class WorkEntry(models.Model):
     work_date = models.DateField()
     hours = models.DecimalField(max_digits=5, decimal_places=2)
     description = models.CharField(max_length=200, blank=True)
+    hourly_rate = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Overrides the invoice hourly rate for this entry"
+    )
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        help_text="Hours x rate, stored when the entry is saved"
+    )
 
     class Meta:
         ordering = ["work_date"]
@@ -164,13 +312,275 @@ class WorkEntry(models.Model):
     def __str__(self):
         return f"{self.work_date} - {self.hours} h"
 
-    @property
-    def amount(self):
-        "Daily amoutn made"
-        h = self.hours or Decimal("0")
-        r = (
-            (self.invoice.hourly_rate or Decimal("0"))
-            if self.invoice_id
-            else Decimal("0")
+    def compute_amount(self, invoice_rate=None):
+        """
+        Daily amount made. ``invoice_rate`` saves a lookup of the parent
+        invoice when the caller already has it (e.g. bulk inserts).
+        """
+        rate = self.hourly_rate
+        if rate is None:
+            if invoice_rate is None:
+                invoice_rate = self.invoice.hourly_rate if self.invoice_id else None
+            rate = invoice_rate
+        hours = Decimal(str(self.hours or 0))
+        return (hours * Decimal(str(rate or 0))).quantize(Decimal("0.01"))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_loaded()
+
+    def _remember_loaded(self):
+        # The client counters move by the difference in amount
+        self._loaded_entry = (
+            (self.invoice_id, self.amount) if "invoice_id" in self.__dict__ and "amount" in self.__dict__ else None
         )
-        return h * r
+
+    def save(self, *args, **kwargs):
+        self.amount = self.compute_amount()
+        super().save(*args, **kwargs)
+        self._remember_loaded()
+
+
+def default_weekday_hours():
+    # Monday to Friday, 8 hours a day
+    return ["8.00", "8.00", "8.00", "8.00", "8.00", "0.00", "0.00"]
+
+
+class RecurringSchedule(models.Model):
+    """
+    Recurring invoice schedule for a client.
+    ``manage.py generate_recurring`` creates a draft invoice for every period
+    that has started, pre-filled with the weekday hours template, and moves
+    ``next_period_start`` forward.
+    """
+    PERIOD_CHOICES = [c for c in Invoice.PERIOD_CHOICES if c[0] != "custom"]
+
+    user = models.ForeignKey(
+        User,
+        related_name="recurring_schedules",
+        on_delete=models.CASCADE,
+    )
+    client = models.ForeignKey(
+        Client,
+        related_name="recurring_schedules",
+        on_delete=models.CASCADE,
+    )
+    period_type = models.CharField(
+        max_length=12, choices=PERIOD_CHOICES, default="weekly"
+    )
+    next_period_start = models.DateField(
+        help_text="Start of the next period to invoice"
+    )
+    hourly_rate = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Leave empty to use the client's default rate"
+    )
+    weekday_hours = models.JSONField(
+        default=default_weekday_hours,
+        help_text="Hours to pre-fill for each weekday, Monday first"
+    )
+    entry_description = models.CharField(max_length=200, blank=True)
+    notes = models.TextField(blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["next_period_start", "id"]
+        indexes = [
+            models.Index(fields=["is_active", "next_period_start"]),
+        ]
+
+    def __str__(self):
+        return f"{self.get_period_type_display()} invoice for {self.client}"
+
+
+class OutboundEmail(models.Model):
+    """
+    Outgoing email waiting in the delivery queue.
+    Web requests only insert rows; ``manage.py send_queued_mail`` delivers
+    them over a shared SMTP connection and retries failures with backoff.
+    """
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(help_text="List of recipient addresses")
+    cc = models.JSONField(default=list, blank=True)
+    bcc = models.JSONField(default=list, blank=True)
+    reply_to = models.JSONField(default=list, blank=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+
+    # Invoice whose PDF is attached; rendered once by the worker and kept
+    # in ``attachment`` so retries don't render it again.
+    invoice = models.ForeignKey(
+        Invoice,
+        related_name="emails",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    attachment = models.BinaryField(null=True, blank=True, editable=False)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+
+class ChangeCounter(models.Model):
+    """
+    Per-user change sequence. Locked while a batch of changes is recorded,
+    so sequence numbers are handed out in commit order for each user.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+
+class ChangeLog(models.Model):
+    """
+    Latest change of each synced object. Rewritten in place on every change,
+    so the table grows with the number of objects, not with the number of
+    edits; ``deleted`` rows are the tombstones.
+    """
+    user = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    model = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    seq = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["model", "object_id"], name="unique_changelog_object"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "seq"]),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.model} {self.object_id}{' (deleted)' if self.deleted else ''}"
+
+
+class ArchivedInvoice(models.Model):
+    """
+    A paid invoice moved out of the hot ``Invoice`` table by
+    ``manage.py archive_invoices``. Keeps the original id, and its totals
+    are stored since an archived invoice never changes again.
+    """
+    is_archived = True
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        User,
+        related_name="archived_invoices",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    client = models.ForeignKey(
+        Client,
+        related_name="archived_invoices",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
+    invoice_number = models.CharField(max_length=20, blank=True)
+    client_name = models.CharField(max_length=120)
+    client_email = models.EmailField(blank=True)
+    period_type = models.CharField(max_length=12, choices=Invoice.PERIOD_CHOICES)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    hourly_rate = models.DecimalField(max_digits=8, decimal_places=2)
+    date_issued = models.DateField()
+    status = models.CharField(max_length=10, choices=Invoice.STATUS_CHOICES)
+    notes = models.TextField(blank=True)
+    sent_pdf_sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    total_hours = models.DecimalField(max_digits=10, decimal_places=2)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-id"]
+        indexes = [
+            models.Index(fields=["user", "period_start"]),
+        ]
+
+    def __str__(self):
+        return f"Invoice {self.invoice_number} - {self.client_name} (archived)"
+
+    def get_absolute_url(self):
+        return reverse("invoice_detail", args=[self.pk])
+
+
+class ArchivedWorkEntry(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    invoice = models.ForeignKey(
+        ArchivedInvoice, related_name="work_entries", on_delete=models.CASCADE
+    )
+    work_date = models.DateField()
+    hours = models.DecimalField(max_digits=5, decimal_places=2)
+    description = models.CharField(max_length=200, blank=True)
+    hourly_rate = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        ordering = ["work_date"]
+
+    def __str__(self):
+        return f"{self.work_date} - {self.hours} h"
+
+
+class TimeSlice(models.Model):
+    """
+    Time posted by a desktop timer. Ingestion only appends rows here;
+    ``manage.py coalesce_time_slices`` adds them to the day's work entry of
+    the client's open invoice in batches.
+    """
+    user = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    client = models.ForeignKey(Client, related_name="+", on_delete=models.CASCADE)
+    work_date = models.DateField()
+    seconds = models.PositiveIntegerField()
+    description = models.CharField(max_length=200, blank=True)
+    # Chosen by the timer, so a retried post is not counted twice
+    key = models.CharField(max_length=64, blank=True)
+    # Set once added to a work entry; the row (and its key) is kept for
+    # TIME_SLICE_KEY_DAYS so retries of the post are still recognised
+    coalesced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["coalesced_at"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], condition=~models.Q(key=""), name="unique_time_slice_key",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.work_date} - {self.seconds} s"
@@ -0,0 +1,330 @@
+"""
+Invoice PDF rendering, shared by the download view and the mail worker.
+
+The engine is pluggable: ``INVOICE_PDF_RENDERER`` is the dotted path of a
+``BasePDFRenderer`` subclass, instantiated once per worker process.
+
+- ``billing.pdf.XHTML2PDFRenderer`` (default) lays out
+  ``invoice_pdf.html``/``invoice_pdf.css`` with xhtml2pdf, so the invoice
+  can be restyled by editing the template.
+- ``billing.pdf_reportlab.ReportLabRenderer`` draws the same invoice
+  directly with ReportLab platypus, skipping the HTML/CSS layout pass.
+
+Everything that does not depend on the invoice is prepared once per worker
+rather than on every render: templates, stylesheets, paragraph styles and
+the DejaVu Sans fonts, which are parsed and registered with ReportLab once.
+Call ``warm_up`` at worker start so the first download does not pay for it.
+
+What a render leaves behind is dropped as soon as it finishes
+(``release_render_caches``), so worker memory does not creep up between
+the garbage collector's full passes. Once a worker is over
+``PDF_RENDER_MEMORY_LIMIT_MB`` anyway, its renders move to a helper process
+that is replaced every ``PDF_SUBPROCESS_RENDERS`` renders
+(``render_in_subprocess``), and the worker stops growing.
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils.module_loading import import_string
+from reportlab import rl_config
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from xhtml2pdf import pisa
+from xhtml2pdf.default import DEFAULT_CSS, DEFAULT_FONT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDERER = "billing.pdf.XHTML2PDFRenderer"
+
+# No render timestamp or random document id: the same invoice always gives
+# the same bytes, which the sent-PDF store relies on (billing/pdf_store.py)
+rl_config.invariant = 1
+
+# ReportLab font name -> file in PDF_FONT_DIR
+FONT_FILES = {"DejaVuSans": "DejaVuSans.ttf", "DejaVuSans-Bold": "DejaVuSans-Bold.ttf"}
+
+
+class PDFRenderError(Exception):
+    pass
+
+
+def invoice_pdf_filename(invoice):
+    return f"Invoice_{invoice.invoice_number or invoice.pk}.pdf"
+
+
+def register_fonts(font_dir):
+    """
+    Register DejaVu Sans (regular and bold) with ReportLab and make the CSS
+    family ``"DejaVu Sans"`` resolve to it. Returns False, leaving PDFs in
+    Helvetica, when the font files are not in ``font_dir``.
+    """
+    paths = {name: Path(font_dir or "") / filename for name, filename in FONT_FILES.items()}
+    missing = [str(path) for path in paths.values() if not path.is_file()]
+    if missing:
+        logger.warning("PDF fonts not found (%s); invoices use Helvetica", ", ".join(missing))
+        return False
+    for name, path in paths.items():
+        pdfmetrics.registerFont(TTFont(name, str(path)))
+    pdfmetrics.registerFontFamily(
+        "DejaVuSans", normal="DejaVuSans", bold="DejaVuSans-Bold",
+        italic="DejaVuSans", boldItalic="DejaVuSans-Bold",
+    )
+    # Every xhtml2pdf document starts from a copy of this mapping
+    DEFAULT_FONT["dejavu sans"] = "DejaVuSans"
+    return True
+
+
+_fonts_lock = threading.Lock()
+_fonts = None
+
+
+def pdf_fonts():
+    """
+    ``(regular, bold)`` ReportLab font names for invoices: DejaVu Sans,
+    registered on first call, or Helvetica when it is not installed.
+    """
+    global _fonts
+    with _fonts_lock:
+        if _fonts is None:
+            if register_fonts(getattr(settings, "PDF_FONT_DIR", "")):
+                _fonts = ("DejaVuSans", "DejaVuSans-Bold")
+            else:
+                _fonts = ("Helvetica", "Helvetica-Bold")
+    return _fonts
+
+
+class BasePDFRenderer(ABC):
+    """
+    An invoice PDF engine. One instance serves every render of a worker
+    process: ``load`` returns whatever does not depend on the invoice, and
+    ``render`` gets it back through ``prepare``. With ``DEBUG`` on it is
+    loaded again for every render, so template edits show up without a
+    restart (like Django's cached loader).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prepared = None
+
+    def load(self):
+        return None
+
+    def prepare(self):
+        prepared = self._prepared
+        if prepared is None:
+            with self._lock:
+                prepared = self._prepared or self.load()
+                if not settings.DEBUG:
+                    self._prepared = prepared
+        return prepared
+
+    @abstractmethod
+    def render(self, invoice, profile=None):
+        """
+        Return ``invoice`` as PDF bytes. ``invoice`` may be an ``Invoice``
+        or an ``ArchivedInvoice``, with its work entries prefetched.
+        """
+
+    def warm_up(self):
+        self.prepare()
+
+
+class XHTML2PDFRenderer(BasePDFRenderer):
+    """
+    Renders ``invoice_pdf.html`` with xhtml2pdf. The stylesheet is handed
+    over together with xhtml2pdf's default CSS instead of being part of
+    every document.
+    """
+
+    template_name = "billing/invoice_pdf.html"
+    stylesheet_name = "billing/invoice_pdf.css"
+
+    def load(self):
+        pdf_fonts()
+        return (
+            get_template(self.template_name),
+            DEFAULT_CSS + "\n" + get_template(self.stylesheet_name).render(),
+        )
+
+    def create_pdf(self, html):
+        _, default_css = self.prepare()
+        result = BytesIO()
+        pdf = pisa.CreatePDF(html, dest=result, encoding="UTF-8", default_css=default_css)
+        if pdf.err:
+            raise PDFRenderError("PDF generation error")
+        return result.getvalue()
+
+    def render(self, invoice, profile=None):
+        template, _ = self.prepare()
+        return self.create_pdf(template.render({"invoice": invoice, "profile": profile}))
+
+    def warm_up(self):
+        # A blank page also fills xhtml2pdf's and ReportLab's lazy imports
+        self.create_pdf("<p></p>")
+
+
+_renderers = {}
+
+
+def get_renderer(path=None):
+    """
+    The worker's instance of the ``path`` engine (default:
+    ``INVOICE_PDF_RENDERER``).
+    """
+    path = path or getattr(settings, "INVOICE_PDF_RENDERER", DEFAULT_RENDERER)
+    renderer = _renderers.get(path)
+    if renderer is None:
+        renderer = _renderers.setdefault(path, import_string(path)())
+    return renderer
+
+
+_memoized_caches = None
+
+
+def _xhtml2pdf_caches():
+    """
+    The result caches of xhtml2pdf's memoized CSS helpers (``getSize``,
+    ``getColor``...). The release pinned here (0.2.17) never drops entries,
+    and the keys come from the rendered documents. Newer releases bound
+    these caches and empty them at the end of each render themselves
+    (``Memoized.maxsize``); there is nothing for us to clear then.
+    """
+    global _memoized_caches
+    if _memoized_caches is None:
+        from xhtml2pdf import util
+
+        kinds = tuple(
+            kind for kind in (getattr(util, "Memoized", None), getattr(util, "memoized", None))
+            if isinstance(kind, type)
+        )
+        caches = {}
+        for name, module in list(sys.modules.items()):
+            if kinds and (name == "xhtml2pdf" or name.startswith("xhtml2pdf.")):
+                for value in vars(module).values():
+                    if (
+                        isinstance(value, kinds) and isinstance(getattr(value, "cache", None), dict)
+                        and not hasattr(value, "maxsize")
+                    ):
+                        caches[id(value.cache)] = value.cache
+        _memoized_caches = list(caches.values())
+    return _memoized_caches
+
+
+# The memoized helpers check for a key, then read it: emptying their caches
+# while another thread renders can raise KeyError in that render. So the
+# caches are only emptied, under this lock, when no render is running.
+_render_lock = threading.Lock()
+_renders_in_flight = 0
+
+
+def release_render_caches():
+    """
+    Drop what a render leaves behind: xhtml2pdf's memoized lookups, unless
+    another render is still using them, and the reference cycles of the
+    document just built (about 900 objects for an xhtml2pdf invoice).
+    Collecting the young generations finds them for about 0.4 ms; left
+    alone they wait for a full collection.
+    """
+    with _render_lock:
+        if not _renders_in_flight:
+            for cache in _xhtml2pdf_caches():
+                cache.clear()
+    gc.collect(1)
+
+
+def _render(engine, invoice, profile):
+    global _renders_in_flight
+    with _render_lock:
+        _renders_in_flight += 1
+    try:
+        return get_renderer(engine).render(invoice, profile)
+    finally:
+        with _render_lock:
+            _renders_in_flight -= 1
+        release_render_caches()
+
+
+def current_rss_mb():
+    """
+    Resident memory of this process, in MB.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:  # pragma: no cover - not Linux: the peak, which is what the limit guards
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+_subprocess_lock = threading.Lock()
+_subprocess_pool = None
+
+
+def _subprocess_init():
+    django.setup()
+
+
+def _subprocess_render(engine, invoice, profile):
+    return _render(engine, invoice, profile)
+
+
+def render_in_subprocess(invoice, profile=None, engine=None):
+    """
+    Render ``invoice`` in the helper process, started on first use. The
+    invoice goes over pickled, with whatever was prefetched on it, so the
+    caller must have loaded everything the template needs.
+    """
+    global _subprocess_pool
+    # The helper reads the settings module, not changes made at run time
+    engine = engine or getattr(settings, "INVOICE_PDF_RENDERER", DEFAULT_RENDERER)
+    with _subprocess_lock:
+        if _subprocess_pool is None:
+            _subprocess_pool = ProcessPoolExecutor(
+                max_workers=1,
+                # A fresh interpreter: forking a threaded worker is not safe
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_subprocess_init,
+                max_tasks_per_child=getattr(settings, "PDF_SUBPROCESS_RENDERS", 100),
+            )
+        pool = _subprocess_pool
+    try:
+        return pool.submit(_subprocess_render, engine, invoice, profile).result()
+    except BrokenProcessPool:
+        with _subprocess_lock:
+            if _subprocess_pool is pool:
+                _subprocess_pool = None
+        logger.warning("PDF helper process died; rendering in the worker")
+        return _render(engine, invoice, profile)
+
+
+def render_invoice_pdf(invoice, profile=None, engine=None):
+    """
+    Render ``invoice`` to PDF bytes with ``engine`` (a ``get_renderer``
+    path; default ``INVOICE_PDF_RENDERER``). Raises ``PDFRenderError`` on
+    failure. Over ``PDF_RENDER_MEMORY_LIMIT_MB`` it renders in the helper
+    process.
+    """
+    limit = getattr(settings, "PDF_RENDER_MEMORY_LIMIT_MB", 0)
+    if limit and current_rss_mb() > limit:
+        return render_in_subprocess(invoice, profile, engine)
+    return _render(engine, invoice, profile)
+
+
+def warm_up():
+    """
+    Prepare the configured engine before the first request.
+    """
+    get_renderer().warm_up()
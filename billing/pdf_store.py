@@ -0,0 +1,215 @@
+"""
+The PDFs clients were sent, kept exactly as sent.
+
+When an invoice moves to "sent", the request only flags it
+(``sent_pdf_pending``). The mail worker then renders its PDF once
+(``freeze_sent_pdf``), before attaching it to the invoice email or in
+``freeze_pending_pdfs`` between batches, and writes it to
+``SENT_PDF_ROOT`` under its SHA-256, which the invoice keeps in
+``sent_pdf_sha256``. The flag is only cleared together with that, so a
+failed render is tried again. Until then downloads render the invoice on
+demand; from then on downloads and emails use the stored bytes, so later
+profile or template changes do not alter a document the client already
+has. Saving an invoice in full (editing it, creating it as sent) stores
+it again.
+Renders are deterministic (see ``billing.pdf``): the same document hashes
+to the same file and is stored once.
+
+Stored PDFs are served from disk (``serve_pdf``): ``FileResponse`` hands
+the open file to the server, which sends it with ``sendfile`` where it can
+(gunicorn does), with single-range ``Range`` requests and the digest as a
+strong ETag. Files are never deleted; the directory must be on a
+persistent disk. A missing file falls back to rendering the invoice again.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+
+from .models import Invoice
+from .pdf import PDFRenderError, render_invoice_pdf
+
+logger = logging.getLogger(__name__)
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# A claimed invoice is left to its worker for this long; if the render
+# fails or the worker dies, another worker tries again after it.
+FREEZE_LEASE = timedelta(minutes=5)
+
+
+def store_root():
+    return Path(getattr(settings, "SENT_PDF_ROOT", settings.BASE_DIR / "sent_pdfs"))
+
+
+def blob_path(digest):
+    # Two-character fan-out keeps directories small
+    return store_root() / digest[:2] / f"{digest}.pdf"
+
+
+def store_pdf(data):
+    """
+    Write ``data`` unless an identical file is already stored, and return
+    its SHA-256.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest)
+    if not path.is_file():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed, so readers never see half a file
+        fd, partial = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(partial, path)
+        except BaseException:
+            os.unlink(partial)
+            raise
+    return digest
+
+
+def read_pdf(digest):
+    """
+    The stored PDF ``digest`` as bytes, or None if its file is missing.
+    """
+    try:
+        return blob_path(digest).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def freeze_sent_pdf(invoice):
+    """
+    Render ``invoice`` once, store it and record its digest on the row, if
+    it is still waiting for that (``sent_pdf_pending``) and no other worker
+    is on it. Returns the digest, or None when it was not stored. A failed
+    render is logged and tried again once the claim has run out; until
+    then the invoice is rendered on demand.
+    """
+    now = timezone.now()
+    claimable = Q(sent_pdf_claimed_at__isnull=True) | Q(sent_pdf_claimed_at__lt=now - FREEZE_LEASE)
+    # Claimed with one UPDATE, so two workers never render the same invoice
+    if not Invoice.objects.filter(claimable, pk=invoice.pk, sent_pdf_pending=True).update(sent_pdf_claimed_at=now):
+        return None
+    loaded = (
+        Invoice.objects.select_related("client", "user__userprofile").prefetch_related("work_entries")
+        .filter(pk=invoice.pk).first()
+    )
+    if loaded is None:
+        return None
+    try:
+        data = render_invoice_pdf(loaded, getattr(loaded.user, "userprofile", None))
+    except PDFRenderError:
+        logger.exception("Could not store the sent PDF of invoice %s; retrying after %s", invoice.pk, FREEZE_LEASE)
+        return None
+    digest = store_pdf(data)
+    # Only while the claim is still ours: an edit or a move back to draft during the render dropped it
+    stored = Invoice.objects.filter(pk=invoice.pk, sent_pdf_pending=True, sent_pdf_claimed_at=now).update(
+        sent_pdf_sha256=digest, sent_pdf_pending=False, sent_pdf_claimed_at=None,
+    )
+    if not stored:
+        return None
+    invoice.sent_pdf_sha256, invoice.sent_pdf_pending = digest, False
+    return digest
+
+
+def freeze_pending_pdfs(batch_size=20):
+    """
+    Store the PDFs of up to ``batch_size`` invoices waiting for it that no
+    other worker has claimed. Returns how many were stored.
+    """
+    claimable = Q(sent_pdf_claimed_at__isnull=True) | Q(sent_pdf_claimed_at__lt=timezone.now() - FREEZE_LEASE)
+    pending = Invoice.objects.filter(claimable, sent_pdf_pending=True).order_by("pk")[:batch_size]
+    return sum(freeze_sent_pdf(invoice) is not None for invoice in pending.only("pk"))
+
+
+def _byte_range(header, size):
+    """
+    ``(start, end)`` (inclusive) of a single-range ``Range`` header, None to
+    ignore the header, or False when the range is not satisfiable.
+    """
+    match = RANGE.match(header.replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        return None  # malformed or several ranges: the whole file will do
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), (min(int(last), size - 1) if last else size - 1)
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class FileRange:
+    """
+    ``length`` bytes of ``file`` from ``start``. Keeps ``fileno()``, so the
+    server can still ``sendfile`` it: gunicorn starts at the file's offset
+    and stops at the response's ``Content-Length``.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def serve_pdf(request, digest, filename):
+    """
+    A download of the stored PDF ``digest``, or None if its file is missing.
+    """
+    etag = f'"{digest}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+    try:
+        file = open(blob_path(digest), "rb")
+    except FileNotFoundError:
+        logger.warning("Stored PDF %s is missing; rendering it again", digest)
+        return None
+    size = os.fstat(file.fileno()).st_size
+
+    byte_range = None
+    if "Range" in request.headers and request.headers.get("If-Range", etag) == etag:
+        byte_range = _byte_range(request.headers["Range"], size)
+    if byte_range is False:
+        file.close()
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(
+            FileRange(file, start, end - start + 1), status=206, content_type="application/pdf",
+            as_attachment=True, filename=filename,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    else:
+        response = FileResponse(file, content_type="application/pdf", as_attachment=True, filename=filename)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    # The user's own document: browsers may keep it, shared caches may not
+    response["Cache-Control"] = "private, max-age=0, must-revalidate"
+    return response
@@ -0,0 +1,181 @@
+"""
+Billing period calendar shared by the invoice views, the API and batch jobs.
+
+Mirrors the rules the invoice form applies in the browser: weekly periods run
+Monday to Sunday, fortnightly periods are 14 days from their start, monthly
+periods run to the end of the start date's month, and custom periods are
+whatever the user picked.
+
+``parse_entries`` is the one place submitted work entries are parsed: hours
+and rates as ``Decimal`` (never ``float``), dates checked against the
+invoice period, every bad row reported at once.
+"""
+import calendar
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from .models import WorkEntry
+
+CENTS = Decimal("0.01")
+MAX_HOURS = Decimal("999.99")
+DESCRIPTION_LENGTH = 200
+# Like Django's formset absolute_max: bounds the work a forged TOTAL_FORMS can cause
+MAX_FORM_ROWS = 1000
+
+
+def end_of_month(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def monday_of(day):
+    return day - timedelta(days=day.weekday())
+
+
+def period_end(period_type, start):
+    """
+    Last day of the ``period_type`` period beginning on ``start``.
+    """
+    if period_type == "weekly":
+        return start + timedelta(days=6)
+    if period_type == "fortnightly":
+        return start + timedelta(days=13)
+    if period_type == "monthly":
+        return end_of_month(start)
+    raise ValueError(f"Period type {period_type!r} has no fixed length")
+
+
+def period_bounds(period_type, start, end=None):
+    """
+    ``(start, end)`` of the ``period_type`` period chosen from ``start``:
+    weekly periods snap to the Monday, custom periods keep ``end``.
+    """
+    if period_type == "weekly":
+        start = monday_of(start)
+    if period_type == "custom":
+        if end is None or end < start:
+            raise ValueError("A custom period needs an end on or after its start")
+        return start, end
+    return start, period_end(period_type, start)
+
+
+def default_period(period_type, today):
+    """
+    The period a new invoice form starts with: the current week (fortnight
+    from this Monday) or month.
+    """
+    if period_type == "monthly":
+        return period_bounds(period_type, today.replace(day=1))
+    if period_type == "custom":
+        period_type = "weekly"
+    return period_bounds(period_type, monday_of(today))
+
+
+def next_period_start(period_type, start):
+    return period_end(period_type, start) + timedelta(days=1)
+
+
+def following_period(period_type, start, end):
+    """
+    ``(start, end)`` of the period right after ``start``..``end``; custom
+    periods keep their length.
+    """
+    start, length = end + timedelta(days=1), end - start
+    if period_type == "custom":
+        return start, start + length
+    return start, period_end(period_type, start)
+
+
+def days_between(start, end):
+    """
+    Every date from ``start`` to ``end`` inclusive.
+    """
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+class InvalidEntries(ValueError):
+    """
+    Raised by ``parse_entries``; ``errors`` maps row index -> message.
+    """
+
+    def __init__(self, errors):
+        super().__init__("Invalid work entries.")
+        self.errors = errors
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value).strip())
+
+
+def _as_decimal(value, default=None):
+    if value is None or str(value).strip() == "":
+        return default
+    number = Decimal(str(value).strip())
+    if not number.is_finite():
+        raise InvalidOperation
+    return number.quantize(CENTS)
+
+
+def parse_entries(rows, start, end, skip_blank=True):
+    """
+    Turn submitted rows (mappings with ``work_date``, ``hours``,
+    ``description`` and optionally ``hourly_rate``, as strings or parsed
+    values) into unsaved ``WorkEntry`` objects in one pass.
+
+    Rows with neither hours nor a description are left out when
+    ``skip_blank`` is set, like the untouched days of the invoice form.
+    Raises ``InvalidEntries`` listing every bad row: unparseable values,
+    hours outside 0-999.99 and dates outside ``start``..``end``.
+    """
+    entries, errors = [], {}
+    for i, row in enumerate(rows):
+        try:
+            hours, description = row.get("hours"), row.get("description") or ""
+        except AttributeError:
+            errors[i] = "Each entry must be an object."
+            continue
+        if skip_blank and str(hours or "").strip() == "" and not str(description).strip():
+            continue
+        try:
+            work_date = _as_date(row["work_date"])
+        except (KeyError, TypeError, ValueError):
+            errors[i] = "Enter the date as YYYY-MM-DD."
+            continue
+        if not start <= work_date <= end:
+            errors[i] = f"{work_date.isoformat()} is outside the invoice period ({start.isoformat()} to {end.isoformat()})."
+            continue
+        try:
+            hours = _as_decimal(hours, Decimal("0.00"))
+            hourly_rate = _as_decimal(row.get("hourly_rate"))
+        except (TypeError, ValueError, InvalidOperation):
+            errors[i] = "Hours and rates must be numbers."
+            continue
+        if not Decimal("0") <= hours <= MAX_HOURS or (hourly_rate is not None and hourly_rate < 0):
+            errors[i] = "Hours must be between 0 and 999.99, rates at least 0."
+            continue
+        entries.append(WorkEntry(
+            work_date=work_date,
+            hours=hours,
+            hourly_rate=hourly_rate,
+            description=str(description)[:DESCRIPTION_LENGTH],
+        ))
+    if errors:
+        raise InvalidEntries(errors)
+    return entries
+
+
+def posted_entry_rows(data, prefix="work_entries"):
+    """
+    The rows of the invoice form's entry table from POST ``data``.
+    """
+    try:
+        count = min(int(data.get(f"{prefix}-TOTAL_FORMS") or 0), MAX_FORM_ROWS)
+    except ValueError:
+        count = 0
+    return [
+        {
+            "work_date": data.get(f"{prefix}-{i}-work_date", ""),
+            "hours": data.get(f"{prefix}-{i}-hours", ""),
+            "description": data.get(f"{prefix}-{i}-description", ""),
+        }
+        for i in range(count)
+    ]
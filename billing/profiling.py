@@ -0,0 +1,189 @@
+"""
+On-demand request profiling, for slowness that only shows with one user's
+data.
+
+Staff issue a signed token for a user from the admin's "Request profiles"
+page. Requests of that user carrying the token, as ``?_profile=<token>`` or
+an ``X-Profile-Token`` header, run under cProfile. Their SQL statements are
+logged with timings. Tokens expire after ``PROFILER_TOKEN_MAX_AGE`` seconds.
+Requests without one pay only a dictionary lookup.
+
+Each capture is a ``.prof`` file (pstats format: ``python -m pstats``,
+snakeviz, flameprof) and a ``.json`` file with the request, timings and SQL
+log, in ``PROFILER_DIR``. Only the newest ``PROFILER_KEEP`` captures are
+kept. Profiles cover the view and the middleware after this one, not the
+body of streaming responses. One request per process is profiled at a time:
+from Python 3.12 cProfile sees every thread, so a second token request is
+served unprofiled meanwhile.
+"""
+import cProfile
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.utils import timezone
+
+TOKEN_PARAM = "_profile"
+TOKEN_HEADER = "HTTP_X_PROFILE_TOKEN"
+TOKEN_SALT = "billing.profiling"
+# Longer statements are cut; the log stays readable and bounded
+MAX_SQL_LENGTH = 2000
+MAX_QUERIES = 2000
+
+_profiling = threading.Lock()
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILER_DIR", settings.BASE_DIR / "profiles"))
+
+
+def issue_token(user):
+    """
+    A token that turns profiling on for ``user``'s requests.
+    """
+    return signing.dumps(user.pk, salt=TOKEN_SALT)
+
+
+def token_user_id(token):
+    """
+    The user id ``token`` was issued for, or None if it is forged or expired.
+    """
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=getattr(settings, "PROFILER_TOKEN_MAX_AGE", 3600))
+    except signing.BadSignature:
+        return None
+
+
+class QueryLog:
+    """
+    Every statement run while it is installed, in order, with its duration.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.count = 0
+        self.total_ms = 0.0
+
+    def wrapper(self, alias):
+        """
+        The ``execute_wrapper`` for the ``alias`` connection.
+        """
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                self.count += 1
+                self.total_ms += elapsed
+                if len(self.queries) < MAX_QUERIES:
+                    self.queries.append({"alias": alias, "sql": sql[:MAX_SQL_LENGTH], "many": many, "ms": round(elapsed, 3)})
+        return record
+
+
+def save_capture(profile, meta):
+    """
+    Write ``profile`` and ``meta`` as a new capture, drop the oldest beyond
+    ``PROFILER_KEEP`` and return the capture id.
+    """
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Sorts by capture time; the suffix keeps concurrent processes apart
+    capture_id = f"{timezone.now():%Y%m%dT%H%M%S%f}-{secrets.token_hex(3)}"
+    profile.dump_stats(directory / f"{capture_id}.prof")
+    # The .json appears last and whole, so listings never see half a capture
+    partial = directory / f"{capture_id}.json.tmp"
+    partial.write_text(json.dumps({"id": capture_id, **meta}))
+    os.replace(partial, directory / f"{capture_id}.json")
+
+    keep = max(1, getattr(settings, "PROFILER_KEEP", 50))
+    for old in sorted(directory.glob("*.json"))[:-keep]:
+        old.with_suffix(".prof").unlink(missing_ok=True)
+        old.unlink(missing_ok=True)
+    return capture_id
+
+
+def list_captures():
+    """
+    Metadata of the kept captures, newest first, without their SQL logs.
+    """
+    captures = []
+    for path in sorted(profile_dir().glob("*.json"), reverse=True):
+        try:
+            meta = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # dropped by another process meanwhile
+        meta.pop("queries", None)
+        captures.append(meta)
+    return captures
+
+
+def capture_path(capture_id, suffix):
+    """
+    Path of a capture's ``.prof`` or ``.json`` file, or None if there is no
+    such capture.
+    """
+    path = profile_dir() / f"{capture_id}{suffix}"
+    # Capture ids are generated names, never paths
+    if "/" in capture_id or "\\" in capture_id or capture_id.startswith(".") or not path.is_file():
+        return None
+    return path
+
+
+class ProfilerMiddleware:
+    """
+    Profile requests that carry a valid token for their user. Must come
+    after ``AuthenticationMiddleware``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.GET.get(TOKEN_PARAM) or request.META.get(TOKEN_HEADER)
+        if not token or not getattr(settings, "PROFILER_ENABLED", True):
+            return self.get_response(request)
+        if not request.user.is_authenticated or token_user_id(token) != request.user.pk:
+            return self.get_response(request)
+        if not _profiling.acquire(blocking=False):
+            response = self.get_response(request)
+            response["X-Profile"] = "busy"
+            return response
+        try:
+            return self.profile(request)
+        finally:
+            _profiling.release()
+
+    def profile(self, request):
+        log = QueryLog()
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(log.wrapper(connection.alias)))
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+        duration_ms = (time.perf_counter() - started) * 1000
+        capture_id = save_capture(profile, {
+            "captured_at": timezone.now().isoformat(),
+            "user": request.user.get_username(),
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(duration_ms, 2),
+            "query_count": log.count,
+            "sql_ms": round(log.total_ms, 2),
+            "queries": log.queries,
+        })
+        response["X-Profile-Id"] = capture_id
+        return response
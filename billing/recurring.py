@@ -0,0 +1,171 @@
+"""
+Set-based generation of invoices from recurring schedules.
+
+Due schedules are processed in batches. For each batch the generator:
+
+1. locks the batch's schedules (``SKIP LOCKED`` on PostgreSQL, so parallel
+   runners share the work instead of blocking each other),
+2. locks the batch's clients and reads the last invoice number of each in
+   one query, then hands out consecutive numbers per client; anything else
+   numbering those clients (``Invoice.save``, duplication) takes the same
+   locks and waits,
+3. skips the periods that already have an invoice of their schedule,
+4. bulk-inserts the invoices, then all their template work entries,
+5. moves every schedule's ``next_period_start`` past the generated periods,
+6. records the new invoices and entries for incremental sync.
+
+All of it happens in one transaction per batch, so a re-run (or a crash
+half-way) never produces duplicates; the ``unique_schedule_period``
+constraint on ``Invoice`` is the backstop.
+"""
+from django.db.models import Max
+from django.utils import timezone
+
+from .counters import add_to_counters, updating_counters
+from .models import ArchivedInvoice, Client, Invoice, RecurringSchedule, WorkEntry
+from .periods import days_between, next_period_start, parse_entries, period_end
+from .sync import track
+
+# Never generate more than this many periods for one schedule in one run,
+# e.g. after a schedule was created with a start date far in the past.
+MAX_CATCH_UP_PERIODS = 53
+
+
+def last_invoice_numbers(client_ids):
+    """
+    Map client id -> last numeric invoice number, following the same
+    "latest invoice by id" rule as ``Invoice.save``, archive included.
+
+    Locks the clients' rows until the end of the transaction, so numbers
+    handed out from the result can't be handed out again meanwhile.
+    """
+    # In pk order, so two runners locking overlapping clients can't deadlock
+    list(Client.objects.select_for_update().filter(pk__in=client_ids).order_by("pk").values_list("pk", flat=True))
+    last_ids = (
+        Invoice.objects.filter(client_id__in=client_ids)
+        .values("client_id")
+        .annotate(last_id=Max("id"))
+        .values_list("last_id", flat=True)
+    )
+    archived_last_ids = (
+        ArchivedInvoice.objects.filter(client_id__in=client_ids)
+        .values("client_id")
+        .annotate(last_id=Max("id"))
+        .values_list("last_id", flat=True)
+    )
+    latest = {}
+    for model, ids in ((Invoice, last_ids), (ArchivedInvoice, archived_last_ids)):
+        for pk, client_id, number in model.objects.filter(id__in=ids).values_list("pk", "client_id", "invoice_number"):
+            if client_id not in latest or pk > latest[client_id][0]:
+                latest[client_id] = (pk, number)
+    return {
+        client_id: int(number) if (number or "").isdigit() else 0
+        for client_id, (_, number) in latest.items()
+    }
+
+
+def _generate_batch(schedule_ids, today):
+    schedules = list(
+        RecurringSchedule.objects.select_for_update(skip_locked=True, of=("self",))
+        .select_related("client")
+        .filter(pk__in=schedule_ids, is_active=True, next_period_start__lte=today)
+    )
+    if not schedules:
+        return 0
+
+    numbers = last_invoice_numbers({s.client_id for s in schedules})
+    # Periods generated before, e.g. by a schedule whose start was moved back
+    existing = set(
+        Invoice.objects.filter(
+            schedule__in=schedules, period_start__gte=min(s.next_period_start for s in schedules),
+        ).values_list("schedule_id", "period_start")
+    )
+    invoices = []
+    for schedule in schedules:
+        client = schedule.client
+        rate = schedule.hourly_rate or client.default_hourly_rate
+        start = schedule.next_period_start
+        for _ in range(MAX_CATCH_UP_PERIODS):
+            if start > today:
+                break
+            if (schedule.pk, start) in existing:
+                start = next_period_start(schedule.period_type, start)
+                continue
+            numbers[client.pk] = numbers.get(client.pk, 0) + 1
+            invoices.append(Invoice(
+                user_id=schedule.user_id,
+                client=client,
+                schedule=schedule,
+                invoice_number=f"{numbers[client.pk]:05d}",
+                client_name=client.name,
+                client_email=client.email,
+                period_type=schedule.period_type,
+                period_start=start,
+                period_end=period_end(schedule.period_type, start),
+                hourly_rate=rate,
+                status="draft",
+                notes=schedule.notes,
+            ))
+            start = next_period_start(schedule.period_type, start)
+        schedule.next_period_start = start
+
+    Invoice.objects.bulk_create(invoices)
+    if any(invoice.pk is None for invoice in invoices):
+        # Backends that can't return ids from a bulk insert
+        ids = {
+            (schedule_id, period_start): pk
+            for pk, schedule_id, period_start in Invoice.objects.filter(
+                schedule__in=schedules, period_start__in={i.period_start for i in invoices}
+            ).values_list("pk", "schedule_id", "period_start")
+        }
+        for invoice in invoices:
+            invoice.pk = ids[(invoice.schedule_id, invoice.period_start)]
+
+    entries = []
+    for invoice in invoices:
+        template = invoice.schedule.weekday_hours
+        rows = [
+            {"work_date": day, "hours": template[day.weekday()], "description": invoice.schedule.entry_description}
+            for day in days_between(invoice.period_start, invoice.period_end)
+        ]
+        for entry in parse_entries(rows, invoice.period_start, invoice.period_end):
+            if not entry.hours:
+                continue
+            entry.invoice_id = invoice.pk
+            entry.amount = entry.compute_amount(invoice.hourly_rate)
+            entries.append(entry)
+    WorkEntry.objects.bulk_create(entries, batch_size=2000)
+
+    RecurringSchedule.objects.bulk_update(schedules, ["next_period_start"])
+
+    # bulk_create sends no signals; record the new rows for sync and the counters ourselves
+    for invoice in invoices:
+        add_to_counters(invoice.client_id, invoices=1, issued=invoice.date_issued)
+    owners = {invoice.pk: invoice.user_id for invoice in invoices}
+    entry_ids = [(e.pk, e.invoice_id) for e in entries]
+    if any(pk is None for pk, _ in entry_ids):
+        entry_ids = list(WorkEntry.objects.filter(invoice_id__in=owners).values_list("pk", "invoice_id"))
+    for user_id in set(owners.values()):
+        track("invoice", [pk for pk, owner in owners.items() if owner == user_id], user_id=user_id)
+        track("work_entry", [pk for pk, invoice_id in entry_ids if owners[invoice_id] == user_id], user_id=user_id)
+    return len(invoices)
+
+
+def generate_due_invoices(today=None, batch_size=500):
+    """
+    Create every due recurring invoice. Returns the number created.
+    """
+    today = today or timezone.localdate()
+    created = 0
+    last_id = 0
+    while True:
+        schedule_ids = list(
+            RecurringSchedule.objects.filter(
+                pk__gt=last_id, is_active=True, next_period_start__lte=today
+            ).order_by("pk").values_list("pk", flat=True)[:batch_size]
+        )
+        if not schedule_ids:
+            return created
+        with updating_counters():
+            created += _generate_batch(schedule_ids, today)
+        last_id = schedule_ids[-1]
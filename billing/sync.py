@@ -0,0 +1,139 @@
+"""
+Change tracking for incremental sync (``/api/v1/changes/``).
+
+Every save or delete of a ``Client``, ``Invoice`` or ``WorkEntry`` moves
+that object's ``ChangeLog`` row to the next value of its owner's
+``ChangeCounter``; deletes leave the row behind as a tombstone. A client
+that remembers the last sequence number it saw can then ask for everything
+after it.
+
+Log rows are written in the transaction that made the change, so a
+change is never committed without its log row or the other way round.
+Inside ``tracking_changes`` (used by the write paths that save many rows
+at once: saving an invoice with its entries, status changes and the
+API's batch create) changes are collected and written together just
+before the block commits, so a view that saves 31 work entries costs a
+handful of extra queries, not 31 times as many, and the owner's counter
+row is only locked at the very end. Anywhere else each change is written
+at once, in whatever transaction is open. Bulk code paths (``bulk_create``,
+queryset ``update``) bypass signals and call ``track`` themselves.
+
+Every change carries its owner: a work entry deleted along with its
+invoice would have no invoice left to find the owner through by the
+time its log row is written.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+
+from .models import ChangeCounter, ChangeLog, Client, Invoice, WorkEntry
+
+MODEL_NAMES = {Client: "client", Invoice: "invoice", WorkEntry: "work_entry"}
+
+_pending = ContextVar("sync_pending", default=None)
+# Invoice id -> owner, for work entries saved without their invoice loaded
+_owners = ContextVar("sync_owners", default=None)
+
+
+def track(model_name, object_ids, user_id, deleted=False):
+    """
+    Record a change of ``object_ids``, owned by ``user_id``, in the current
+    transaction.
+    """
+    changes = {(model_name, pk): (user_id, deleted) for pk in object_ids}
+    pending = _pending.get()
+    if pending is not None:
+        pending.update(changes)
+    elif changes:
+        _write(changes)
+
+
+@contextmanager
+def tracking_changes():
+    """
+    Run the block in a transaction and write the changes it tracked
+    together, just before that transaction commits.
+    """
+    if _pending.get() is not None:
+        # An enclosing block writes them
+        with transaction.atomic():
+            yield
+        return
+    pending_token, owners_token = _pending.set({}), _owners.set({})
+    try:
+        with transaction.atomic():
+            yield
+            _write(_pending.get())
+    finally:
+        _pending.reset(pending_token)
+        _owners.reset(owners_token)
+
+
+def _write(pending):
+    by_user = {}
+    for (name, pk), (user_id, deleted) in pending.items():
+        if user_id:
+            by_user.setdefault(user_id, []).append((name, pk, deleted))
+    with transaction.atomic():
+        # Fixed lock order, so two writers never wait on each other in a cycle
+        for user_id in sorted(by_user):
+            changes = by_user[user_id]
+            if not ChangeCounter.objects.filter(user_id=user_id).update(value=F("value") + len(changes)):
+                ChangeCounter.objects.get_or_create(user_id=user_id)
+                ChangeCounter.objects.filter(user_id=user_id).update(value=F("value") + len(changes))
+            last = ChangeCounter.objects.values_list("value", flat=True).get(user_id=user_id)
+            first = last - len(changes) + 1
+            ChangeLog.objects.bulk_create(
+                [
+                    ChangeLog(user_id=user_id, model=name, object_id=pk, seq=first + i, deleted=deleted)
+                    for i, (name, pk, deleted) in enumerate(changes)
+                ],
+                update_conflicts=True,
+                unique_fields=["model", "object_id"],
+                update_fields=["user", "seq", "deleted"],
+            )
+
+
+# --- Signal receivers --------------------------------------------------------
+
+def _owner(instance):
+    if not isinstance(instance, WorkEntry):
+        return instance.user_id
+    if WorkEntry.invoice.is_cached(instance):
+        return instance.invoice.user_id
+    # Entries deleted with their invoice go first, so the invoice is still there
+    owners = _owners.get()
+    if owners is not None and instance.invoice_id in owners:
+        return owners[instance.invoice_id]
+    user_id = Invoice.objects.filter(pk=instance.invoice_id).values_list("user_id", flat=True).first()
+    if owners is not None:
+        owners[instance.invoice_id] = user_id
+    return user_id
+
+
+def _saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    track(MODEL_NAMES[sender], [instance.pk], _owner(instance))
+    if sender is Invoice:
+        loaded_rate = getattr(instance, "_loaded_hourly_rate", None)
+        if loaded_rate is not None and loaded_rate != instance.hourly_rate:
+            # Invoice.save re-prices entries without their own rate in bulk
+            track(
+                "work_entry",
+                list(instance.work_entries.filter(hourly_rate__isnull=True).values_list("pk", flat=True)),
+                user_id=instance.user_id,
+            )
+
+
+def _deleted(sender, instance, **kwargs):
+    track(MODEL_NAMES[sender], [instance.pk], _owner(instance), deleted=True)
+
+
+def connect_signals():
+    for model in MODEL_NAMES:
+        post_save.connect(_saved, sender=model, dispatch_uid=f"sync_saved_{model.__name__}")
+        post_delete.connect(_deleted, sender=model, dispatch_uid=f"sync_deleted_{model.__name__}")
@@ -0,0 +1,19 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+register = template.Library()
+
+SPRITE = "icons.svg"
+
+
+@register.simple_tag
+def icon(name, css_class=""):
+    """
+    ``{% icon "copy" %}``: an inline SVG drawing symbol ``name`` from the
+    static sprite, sized and coloured like the surrounding text.
+    """
+    return format_html(
+        '<svg class="icon {}" aria-hidden="true"><use href="{}#{}"></use></svg>',
+        css_class, static(SPRITE), name,
+    )
@@ -1,3 +1,1533 @@
-from django.test import TestCase
+import gzip
+import json
+import pstats
+import random
+import re
+import socketserver
+import tempfile
+import threading
+import zipfile
+from contextlib import nullcontext
+from io import BytesIO, StringIO
+from xml.etree import ElementTree
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connections, transaction
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from whitenoise import compress as whitenoise_compress
+
+from .archive import archive_cutoff, archive_invoices
+from .benchmark import (
+    SCENARIOS, compare_to_baseline, generate_dataset, invoice_post_data, pdf_memory_leaks,
+    run_compression, run_pdf_memory, run_scenarios,
+)
+from .compression import brotli, minify_html, negotiate
+from .counters import reconcile_counters
+from .duplication import duplicate_invoices
+from .forms import RecurringScheduleForm
+from .loadtest import TASKS, VirtualUser, has_status, is_page, redirects_to
+from .mail import deliver_due
+from .models import (
+    ArchivedInvoice, ChangeLog, Client, Invoice, OutboundEmail, RecurringSchedule, TimeSlice, UserProfile, WorkEntry,
+)
+from . import health, pdf, pdf_store
+from .pdf import BasePDFRenderer, XHTML2PDFRenderer, register_fonts, render_invoice_pdf
+from .pdf_store import blob_path, freeze_pending_pdfs, read_pdf
+from .profiling import issue_token
+from .periods import InvalidEntries, parse_entries, period_bounds
+from .recurring import generate_due_invoices
+from .sync import tracking_changes
+from .timeslices import coalesce_time_slices, purge_coalesced_slices
+from .ubl import write_ubl_archive
+from invoicegen.gunicorn_conf import size_workers
+
+
+# --- Fixtures ----------------------------------------------------------------
+#
+# Shared by every test class: tests build the few rows they assert on with
+# these factories. The seeded benchmark dataset is only for the tests of the
+# harnesses that run on it.
+
+def make_user(username="freelancer", business_name="Freelance Studio"):
+    user = User.objects.create_user(username, email=f"{username}@example.com", password="x")
+    UserProfile.objects.create(user=user, business_name=business_name)
+    return user
+
+
+def make_client(user, name="Acme", rate=80):
+    return Client.objects.create(
+        user=user, name=name, email=f"accounts@{name.lower()}.example.com", default_hourly_rate=rate,
+    )
+
+
+def make_invoice(client, start=date(2026, 3, 2), days=7, hours="8.00", status="draft", period_type="weekly", **fields):
+    """
+    An invoice of ``client`` for ``days`` days from ``start``, issued on its
+    last day, with an entry of ``hours`` on every day (none if ``hours`` is None).
+    """
+    end = start + timedelta(days=days - 1)
+    fields.setdefault("hourly_rate", client.default_hourly_rate)
+    fields.setdefault("date_issued", end)
+    invoice = Invoice.objects.create(
+        user=client.user, client=client, client_name=client.name, client_email=client.email,
+        period_type=period_type, period_start=start, period_end=end, status=status, **fields,
+    )
+    if hours is not None:
+        for i in range(days):
+            WorkEntry.objects.create(
+                invoice=invoice, work_date=start + timedelta(days=i), hours=Decimal(hours), description="Development",
+            )
+    return invoice
+
+
+@override_settings(HEALTHCHECK_CACHE_TTL=0, HEALTHCHECK_TIMEOUT=0.5)
+class HealthCheckTests(TestCase):
+    # The replica, when configured, is probed too
+    databases = "__all__"
+
+    def test_liveness_never_touches_the_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("health_live"))
+        self.assertEqual((response.status_code, response.content), (200, b"OK"))
+
+    def test_readiness_reports_each_dependency(self):
+        response = self.client.get(reverse("health_ready"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "ok")
+        self.assertTrue(response.json()["checks"]["database"]["ok"])
+
+        with mock.patch.object(connections["default"], "cursor", side_effect=OperationalError("connection lost")):
+            response = self.client.get(reverse("health_ready"))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["checks"]["database"], {
+            "ok": False, "latency_ms": mock.ANY, "error": "connection lost",
+        })
+
+    @override_settings(HEALTHCHECK_PDF_PROBE=True, HEALTHCHECK_TIMEOUT=5)
+    def test_pdf_probe_renders_with_the_configured_engine(self):
+        for engine in ("billing.pdf.XHTML2PDFRenderer", "billing.pdf_reportlab.ReportLabRenderer"):
+            with self.subTest(engine=engine), override_settings(INVOICE_PDF_RENDERER=engine):
+                self.assertEqual(self.client.get(reverse("health_ready")).status_code, 200)
+                with mock.patch.object(
+                    type(pdf.get_renderer()), "render", side_effect=pdf.PDFRenderError("PDF generation error"),
+                ):
+                    checks = self.client.get(reverse("health_ready")).json()["checks"]
+                self.assertEqual(checks["pdf_renderer"]["error"], "PDF generation error")
+
+    @override_settings(HEALTHCHECK_PDF_PROBE=True, HEALTHCHECK_TIMEOUT=0.05)
+    def test_a_hung_pdf_render_fails_probes_without_piling_up(self):
+        release = threading.Event()
+        with mock.patch.object(health, "_render_probe_pdf", side_effect=lambda: release.wait(5)):
+            response = self.client.get(reverse("health_ready"))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json()["checks"]["pdf_renderer"]["error"], "timeout")
+            # The render is still stuck: the next probe fails at once rather than waiting on it
+            checks = self.client.get(reverse("health_ready")).json()["checks"]
+            self.assertEqual(checks["pdf_renderer"]["error"], "previous probe still running")
+            release.set()
+            health._pdf_probe.join()
+            self.assertEqual(self.client.get(reverse("health_ready")).status_code, 200)
+
+
+class BenchmarkHarnessTests(TestCase):
+    def test_every_scenario_runs_on_a_small_dataset(self):
+        dataset = generate_dataset(users=1, clients=2, invoices=2, seed=7)
+        results = run_scenarios(dataset, repeat=1)
+        self.assertEqual(set(results), set(SCENARIOS))
+        for name, result in results.items():
+            self.assertIn(result["status_code"], (200, 202, 302), name)
+            self.assertGreater(result["queries"], 0, name)
+        # Resetting the status scenarios between runs leaves the counters right
+        self.assertEqual(reconcile_counters(dry_run=True)[1], 0)
+
+    def test_compression_report_weighs_bytes_against_cpu(self):
+        dataset = generate_dataset(users=1, clients=2, invoices=2, seed=7)
+        results = run_compression(dataset, ["invoice_list", "invoice_ubl"], repeat=1)
+        self.assertLess(results["invoice_list"]["minified_kb"], results["invoice_list"]["raw_kb"])
+        self.assertLess(results["invoice_ubl"]["gzip"]["kb"], results["invoice_ubl"]["raw_kb"])
+
+    def test_compare_to_baseline_flags_slowdowns_and_extra_queries(self):
+        baseline = {"dashboard": {"wall_ms": {"median": 10.0}, "queries": 5}}
+        ok = {"dashboard": {"wall_ms": {"median": 12.0}, "queries": 5}}
+        slow = {"dashboard": {"wall_ms": {"median": 20.0}, "queries": 6}}
+        self.assertEqual(compare_to_baseline(ok, baseline, threshold=0.25), [])
+        self.assertEqual(len(compare_to_baseline(slow, baseline, threshold=0.25)), 2)
+
+
+def _http_response(status_code, body=b"", redirected=False, **headers):
+    response = requests.Response()
+    response.status_code, response._content = status_code, body
+    response.headers.update({name.replace("_", "-"): value for name, value in headers.items()})
+    response.history = [requests.Response()] if redirected else []
+    return response
+
+
+class LoadTestTests(LiveServerTestCase):
+    def test_every_task_succeeds_against_a_live_server(self):
+        dataset = generate_dataset(users=1, clients=1, invoices=2, seed=9)
+        vu = VirtualUser(self.live_server_url, dataset.user, random.Random(5))
+        vu.login()
+        for name, _, func in TASKS:
+            self.assertIs(func(vu), True, name)
+
+        # Logged out, every page answers 200 through a redirect to the login form
+        vu.session.cookies.clear()
+        for name, _, func in TASKS:
+            self.assertIs(func(vu), False, name)
+
+    def test_answers_below_400_that_are_not_the_expected_one_are_errors(self):
+        self.assertTrue(is_page(_http_response(200, Content_Type="text/html; charset=utf-8")))
+        self.assertFalse(is_page(_http_response(200, Content_Type="text/html", redirected=True)))
+        self.assertFalse(is_page(_http_response(200, Content_Type="text/html"), "application/pdf"))
+
+        self.assertTrue(redirects_to(_http_response(302, Location="/invoices/7/"), "invoice_detail"))
+        # The create form re-rendered with errors, and a redirect elsewhere
+        self.assertFalse(redirects_to(_http_response(200), "invoice_detail"))
+        self.assertFalse(redirects_to(_http_response(302, Location="/login/?next=/"), "invoice_detail"))
+        self.assertFalse(redirects_to(_http_response(302, Location="/nowhere/"), "invoice_detail"))
+
+        self.assertTrue(has_status(_http_response(200, b'{"status": "paid"}'), "paid"))
+        self.assertFalse(has_status(_http_response(200, b'{"status": "sent"}'), "paid"))
+        self.assertFalse(has_status(_http_response(200, b"<html>"), "paid"))
+
+
+class InvoiceRenderingQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.invoice = make_invoice(make_client(cls.user))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _add_entries(self, count):
+        start = self.invoice.period_end + timedelta(days=1)
+        for i in range(count):
+            WorkEntry.objects.create(invoice=self.invoice, work_date=start + timedelta(days=i), hours=8)
+
+    def test_entry_amount_is_stored_and_honours_rate_override(self):
+        entry = WorkEntry.objects.create(invoice=self.invoice, work_date=date(2025, 1, 1), hours="2.5")
+        self.assertEqual(entry.amount, Decimal("2.5") * self.invoice.hourly_rate)
+        entry.hourly_rate = Decimal("10.00")
+        entry.save()
+        self.assertEqual(WorkEntry.objects.get(pk=entry.pk).amount, Decimal("25.00"))
+
+    def test_changing_invoice_rate_updates_entry_amounts(self):
+        self.invoice.refresh_from_db()
+        self.invoice.hourly_rate = Decimal("100.00")
+        self.invoice.save()
+        for entry in self.invoice.work_entries.all():
+            self.assertEqual(entry.amount, entry.hours * Decimal("100.00"))
+
+    def test_detail_and_pdf_query_count_does_not_grow_with_entries(self):
+        self._add_entries(31)
+        # Session + user, then the invoice and its entries.
+        with self.assertNumQueries(4):
+            self.client.get(reverse("invoice_detail", args=[self.invoice.pk]))
+        with self.assertNumQueries(4):
+            self.client.get(reverse("invoice_pdf", args=[self.invoice.pk]))
+
+    def test_list_query_counts_do_not_grow_with_invoices(self):
+        client = self.invoice.client
+        pages = [
+            reverse("dashboard"), reverse("invoice_list"),
+            reverse("client_list"), reverse("client_detail", args=[client.pk]),
+        ]
+
+        def counts():
+            result = []
+            for url in pages:
+                with CaptureQueriesContext(connections["default"]) as queries:
+                    self.client.get(url)
+                result.append(len(queries))
+            return result
+
+        before = counts()
+        for week in range(1, 5):
+            make_invoice(client, self.invoice.period_start + timedelta(weeks=week), status="paid")
+        self.assertEqual(counts(), before)
+        # Session + user, four status counts, both amounts, the recent
+        # invoices with their totals, the clients (count and list) and the
+        # archive check.
+        with self.assertNumQueries(11):
+            response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.context["total_earned"], sum(
+            (i.total_amount for i in Invoice.objects.filter(status="paid")), Decimal("0")
+        ))
+
+
+class CachedAuthTests(TestCase):
+    cached = override_settings(
+        SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+        AUTHENTICATION_BACKENDS=["billing.auth.CachedModelBackend"],
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.client_obj = make_client(cls.user)
+        cls.invoice = make_invoice(cls.client_obj)
+
+    def setUp(self):
+        cache.clear()
+        invoice, client = self.invoice, self.client_obj
+        self.urls = [
+            reverse("dashboard"), reverse("client_list"), reverse("client_detail", args=[client.pk]),
+            reverse("invoice_list"), reverse("invoice_detail", args=[invoice.pk]),
+            reverse("invoice_pdf", args=[invoice.pk]), reverse("profile"),
+        ]
+
+    def queries_per_view(self):
+        # A new test client, so its middleware picks up the session engine
+        http = self.client_class()
+        http.force_login(self.user)
+        counts = {}
+        for url in self.urls:
+            http.get(url)  # fills the caches
+            with CaptureQueriesContext(connections["default"]) as queries:
+                self.assertEqual(http.get(url).status_code, 200)
+            counts[url] = len(queries)
+        return counts
+
+    def test_cached_sessions_and_users_save_two_queries_per_view(self):
+        baseline = self.queries_per_view()
+        with self.cached:
+            cached = self.queries_per_view()
+        for url in self.urls:
+            self.assertLessEqual(cached[url], baseline[url] - 2, url)
+
+    def test_profile_save_refreshes_the_cached_user(self):
+        with self.cached:
+            http = self.client_class()
+            http.force_login(self.user)
+            http.get(reverse("profile"))
+            # The cache entry is dropped when the transaction commits
+            with self.captureOnCommitCallbacks(execute=True):
+                http.post(reverse("profile"), {
+                    "first_name": "Renamed", "last_name": "", "email": self.user.email,
+                    "business_name": "New Business", "phone": "", "address": "", "default_hourly_rate": "60",
+                })
+            response = http.get(reverse("profile"))
+        self.assertEqual(response.wsgi_request.user.first_name, "Renamed")
+        self.assertEqual(response.wsgi_request.user.userprofile.business_name, "New Business")
+
+
+class RecurringGenerationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.client_obj = make_client(cls.user)
+        for start in (date(2025, 12, 22), date(2025, 12, 29)):
+            make_invoice(cls.client_obj, start, hours=None)
+
+    def test_generates_due_periods_once_with_consecutive_numbers(self):
+        last_number = int(self.client_obj.invoices.order_by("-id").first().invoice_number)
+        schedule = RecurringSchedule.objects.create(
+            user=self.user, client=self.client_obj, period_type="weekly",
+            next_period_start=date(2026, 1, 5),
+        )
+        self.assertEqual(generate_due_invoices(today=date(2026, 1, 14)), 2)
+        self.assertEqual(generate_due_invoices(today=date(2026, 1, 14)), 0)
+
+        invoices = list(schedule.invoices.order_by("period_start"))
+        self.assertEqual([i.period_end for i in invoices], [date(2026, 1, 11), date(2026, 1, 18)])
+        self.assertEqual(
+            [i.invoice_number for i in invoices],
+            [f"{last_number + 1:05d}", f"{last_number + 2:05d}"],
+        )
+        # Monday to Friday at 8 hours from the default template
+        self.assertEqual(invoices[0].work_entries.count(), 5)
+        self.assertEqual(invoices[0].total_hours, Decimal("40.00"))
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.next_period_start, date(2026, 1, 19))
+
+    def test_a_schedule_moved_back_skips_the_periods_it_generated(self):
+        schedule = RecurringSchedule.objects.create(
+            user=self.user, client=self.client_obj, period_type="weekly", next_period_start=date(2026, 1, 5),
+        )
+        generate_due_invoices(today=date(2026, 1, 14))
+
+        form = RecurringScheduleForm(instance=schedule, data={
+            "period_type": "weekly", "next_period_start": "2026-01-12", "hourly_rate": "80",
+            "entry_description": "", "notes": "", "is_active": "on",
+            **{f"hours_{day}": "8" for day in RecurringScheduleForm.WEEKDAYS},
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn("already generated up to 2026-01-18", form.errors["next_period_start"][0])
+
+        # Moved back all the same, e.g. from the admin or a script
+        RecurringSchedule.objects.filter(pk=schedule.pk).update(next_period_start=date(2026, 1, 5))
+        self.assertEqual(generate_due_invoices(today=date(2026, 1, 21)), 1)
+        self.assertEqual(
+            list(schedule.invoices.order_by("period_start").values_list("period_start", flat=True)),
+            [date(2026, 1, 5), date(2026, 1, 12), date(2026, 1, 19)],
+        )
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.next_period_start, date(2026, 1, 26))
+
+
+class DuplicationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.clients = [make_client(cls.user, "Acme"), make_client(cls.user, "Globex")]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def make_invoice(self, client, start, end, period_type="monthly"):
+        invoice = make_invoice(
+            client, start, (end - start).days + 1, hours=None, status="paid", period_type=period_type, hourly_rate=40,
+        )
+        for day, rate in ((start, None), (start + (end - start) // 2, 60), (end, None)):
+            WorkEntry.objects.create(invoice=invoice, work_date=day, hours=2, hourly_rate=rate, description="Dev")
+        return invoice
+
+    def test_duplicate_to_next_period_shifts_entry_dates(self):
+        source = self.make_invoice(self.clients[0], date(2026, 1, 1), date(2026, 1, 31))
+        response = self.client.get(reverse("invoice_duplicate_next", args=[source.pk]))
+        copy = Invoice.objects.latest("pk")
+        self.assertRedirects(response, reverse("invoice_detail", args=[copy.pk]))
+        self.assertEqual((copy.period_start, copy.period_end), (date(2026, 2, 1), date(2026, 2, 28)))
+        self.assertEqual(copy.invoice_number, f"{int(source.invoice_number) + 1:05d}")
+        self.assertEqual(copy.status, "draft")
+        # January 31st has no counterpart in February
+        self.assertEqual(
+            list(copy.work_entries.values_list("work_date", "hourly_rate", "amount")),
+            [(date(2026, 2, 1), None, Decimal("80.00")), (date(2026, 2, 16), Decimal("60.00"), Decimal("120.00"))],
+        )
+        self.assertEqual(source.work_entries.count(), 3)
+
+    def test_bulk_roll_forward_uses_a_fixed_number_of_queries(self):
+        week = (date(2026, 3, 2), date(2026, 3, 8))
+
+        def make(count):
+            ids = [self.make_invoice(self.clients[i % 2], *week, period_type="weekly").pk for i in range(count)]
+            return Invoice.objects.filter(pk__in=ids)
+
+        one, six = make(1), make(6)
+        with CaptureQueriesContext(connections["default"]) as single:
+            duplicate_invoices(one, next_period=True)
+        with CaptureQueriesContext(connections["default"]) as bulk:
+            copies = duplicate_invoices(six, next_period=True)
+        self.assertEqual(len(bulk), len(single))
+        self.assertEqual({(c.period_start, c.period_end) for c in copies}, {(date(2026, 3, 9), date(2026, 3, 15))})
+        self.assertEqual(WorkEntry.objects.filter(invoice__in=copies).count(), 18)
+
+    def test_roll_forward_view_skips_invoices_already_rolled(self):
+        self.make_invoice(self.clients[0], date(2026, 3, 2), date(2026, 3, 8), period_type="weekly")
+        data = {"date_from": "2026-03-02", "date_to": "2026-03-08"}
+        count = Invoice.objects.count()
+        self.client.post(reverse("invoice_roll_forward"), data)
+        self.assertEqual(Invoice.objects.count(), count + 1)
+        self.client.post(reverse("invoice_roll_forward"), data)
+        self.assertEqual(Invoice.objects.count(), count + 1)
+
+    def test_roll_forward_skips_client_less_invoices_already_rolled(self):
+        week = {"period_type": "weekly", "period_start": date(2026, 3, 2), "period_end": date(2026, 3, 8)}
+        source = Invoice.objects.create(user=self.user, client_name="Walk-in", **week)
+        # Another user's client-less invoice in the target week doesn't count
+        Invoice.objects.create(
+            user=make_user("other"), client_name="Walk-in", **dict(week, period_start=date(2026, 3, 9)),
+        )
+        invoices = Invoice.objects.filter(pk=source.pk)
+        self.assertEqual(len(duplicate_invoices(invoices, next_period=True, skip_existing=True)), 1)
+        self.assertEqual(duplicate_invoices(invoices, next_period=True, skip_existing=True), [])
+
+    def test_roll_forward_keeps_the_list_client_filter(self):
+        for client in self.clients:
+            self.make_invoice(client, date(2026, 3, 2), date(2026, 3, 8), period_type="weekly")
+        query = {"client": self.clients[1].pk, "date_from": "2026-03-02", "date_to": "2026-03-08"}
+        page = self.client.get(reverse("invoice_list"), query).content.decode()
+        roll_form = re.search(f'<form method="post" action="{reverse("invoice_roll_forward")}">.*?</form>', page, re.S)
+        fields = dict(re.findall(r'type="hidden" name="(client|date_\w+)" value="([^"]*)"', roll_form.group()))
+        self.assertEqual(fields, {k: str(v) for k, v in query.items()})
+
+        self.client.post(reverse("invoice_roll_forward"), fields)
+        self.assertEqual(
+            list(Invoice.objects.filter(period_start=date(2026, 3, 9)).values_list("client_id", flat=True)),
+            [self.clients[1].pk],
+        )
+
+
+class StatusFragmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.client_obj = make_client(cls.user)
+        cls.invoice = make_invoice(cls.client_obj, status="sent")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse("invoice_status_fragment", args=[self.invoice.pk])
+
+    def test_status_change_returns_picker_and_tile_deltas(self):
+        amount = self.invoice.total_amount
+        with CaptureQueriesContext(connections["default"]) as queries:
+            response = self.client.post(self.url, {"status": "paid", "next": "/dashboard/"})
+        data = response.json()
+        self.assertEqual(data["status"], "paid")
+        self.assertEqual(data["stats"], {
+            "sent-count": -1, "paid-count": 1, "sent-amount": str(-amount), "paid-amount": str(amount),
+        })
+        self.assertInHTML('<option value="paid" selected>Paid</option>', data["html"])
+        self.assertInHTML('<option value="sent">Sent</option>', data["html"])
+        self.assertInHTML('<input type="hidden" name="next" value="/dashboard/">', data["html"])
+        self.assertEqual(Invoice.objects.get(pk=self.invoice.pk).status, "paid")
+        # One UPDATE of the status column, and no page-wide aggregates
+        updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "billing_invoice"')]
+        self.assertEqual(len(updates), 1)
+        self.assertFalse([q for q in queries if q["sql"].startswith("SELECT COUNT(")])
+
+    def test_unchanged_or_unknown_status_changes_nothing(self):
+        response = self.client.post(self.url, {"status": "sent"})
+        self.assertEqual(response.json()["stats"], {})
+        response = self.client.post(self.url, {"status": "void"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Invoice.objects.get(pk=self.invoice.pk).status, "sent")
+
+    def test_pages_wire_pickers_and_tiles_to_the_fragment(self):
+        response = self.client.get(reverse("dashboard"))
+        self.assertContains(response, f'data-fragment="{self.url}"')
+        for key in ("paid-amount", "sent-amount", "draft-count", "sent-count", "paid-count"):
+            self.assertContains(response, f'data-stat="{key}"')
+        response = self.client.get(reverse("client_detail", args=[self.client_obj.pk]))
+        self.assertContains(response, 'data-stat="paid-amount"')
+
+
+class ClientCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.client_obj = make_client(cls.user)
+        for start, status in ((date(2025, 6, 2), "paid"), (date(2025, 6, 9), "sent"), (date(2025, 6, 16), "draft")):
+            make_invoice(cls.client_obj, start, status=status)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertCountersCurrent(self):
+        client = Client.objects.get(pk=self.client_obj.pk)
+        invoices = list(client.invoices.all())
+        archived = list(client.archived_invoices.all())
+        paid = sum((i.total_amount for i in invoices if i.status == "paid"), Decimal("0"))
+        self.assertEqual(client.invoice_count, len(invoices) + len(archived))
+        self.assertEqual(client.total_paid, paid + sum((a.total_amount for a in archived), Decimal("0")))
+        self.assertEqual(client.last_invoiced, max(i.date_issued for i in invoices + archived))
+
+    def test_invoice_and_status_writes_keep_counters_current(self):
+        self.assertCountersCurrent()
+        data = invoice_post_data(None, date(2026, 1, 5), 7)
+        data["status"] = "paid"
+        self.client.post(reverse("invoice_create_for_client", args=[self.client_obj.pk]), data)
+        self.assertCountersCurrent()
+        invoice = Invoice.objects.filter(client=self.client_obj).exclude(status="paid").first()
+        self.client.post(reverse("invoice_status_fragment", args=[invoice.pk]), {"status": "paid"})
+        self.assertCountersCurrent()
+        # Re-pricing a paid invoice changes what it is worth
+        invoice.refresh_from_db()
+        invoice.hourly_rate += 10
+        invoice.save()
+        self.assertCountersCurrent()
+        duplicate_invoices(Invoice.objects.filter(pk=invoice.pk), next_period=True)
+        self.assertCountersCurrent()
+        archive_invoices(cutoff=timezone.localdate() + timedelta(days=400))
+        self.assertTrue(self.client_obj.archived_invoices.exists())
+        self.assertCountersCurrent()
+        invoice = Invoice.objects.filter(client=self.client_obj).first()
+        invoice.delete()
+        self.assertCountersCurrent()
+
+    def test_writes_move_counters_without_reading_the_history(self):
+        paid = Invoice.objects.get(client=self.client_obj, status="paid")
+        entry = paid.work_entries.first()
+        writes = [
+            lambda: self.client.post(reverse("invoice_status_fragment", args=[paid.pk]), {"status": "sent"}),
+            lambda: self.client.post(reverse("invoice_status_fragment", args=[paid.pk]), {"status": "paid"}),
+            lambda: setattr(entry, "hours", entry.hours + 1) or entry.save(),
+            lambda: entry.delete(),
+            lambda: make_invoice(self.client_obj, date(2026, 2, 2), status="paid"),
+        ]
+        for write in writes:
+            with CaptureQueriesContext(connections["default"]) as queries:
+                write()
+            # A recount would update the client from subqueries over its whole history
+            self.assertFalse([q for q in queries if 'UPDATE "billing_client"' in q["sql"] and "SELECT" in q["sql"]])
+            self.assertCountersCurrent()
+
+    def test_client_pages_read_counters_without_counting(self):
+        for name in ("client_list", "client_detail", "client_delete"):
+            args = [] if name == "client_list" else [self.client_obj.pk]
+            with CaptureQueriesContext(connections["default"]) as queries:
+                response = self.client.get(reverse(name, args=args))
+            self.assertContains(response, str(self.client_obj.invoice_count))
+            self.assertFalse([q for q in queries if "COUNT(" in q["sql"]], name)
+
+    def test_reconcile_command_fixes_stale_counters(self):
+        Client.objects.update(invoice_count=0, total_paid=0, last_invoiced=None)
+        out = StringIO()
+        call_command("reconcile_client_counters", "--dry-run", stdout=out)
+        self.assertIn("1 had stale counters", out.getvalue())
+        self.assertEqual(Client.objects.get(pk=self.client_obj.pk).invoice_count, 0)
+        call_command("reconcile_client_counters", stdout=StringIO())
+        self.assertCountersCurrent()
+
+
+class RequestProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        make_invoice(make_client(cls.user))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.settings_override = override_settings(PROFILER_DIR=self.directory.name, PROFILER_KEEP=2)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def captures(self):
+        return sorted(Path(self.directory.name).glob("*.json"))
+
+    def test_only_requests_with_the_users_token_are_profiled(self):
+        other = User.objects.create_user("other", password="x")
+        self.assertNotIn("X-Profile-Id", self.client.get(reverse("dashboard")))
+        for token in ("forged", issue_token(other)):
+            self.assertNotIn("X-Profile-Id", self.client.get(reverse("dashboard"), {"_profile": token}))
+        self.assertEqual(self.captures(), [])
+
+        response = self.client.get(reverse("dashboard"), HTTP_X_PROFILE_TOKEN=issue_token(self.user))
+        capture = json.loads(self.captures()[0].read_text())
+        self.assertEqual(capture["id"], response["X-Profile-Id"])
+        self.assertEqual((capture["path"], capture["status"]), ("/dashboard/", 200))
+        self.assertEqual(capture["query_count"], len(capture["queries"]))
+        self.assertTrue(any("billing_invoice" in query["sql"] for query in capture["queries"]))
+        self.assertTrue(pstats.Stats(str(self.captures()[0].with_suffix(".prof"))).total_calls)
+
+    def test_only_the_newest_captures_are_kept(self):
+        token = issue_token(self.user)
+        ids = [self.client.get(reverse("client_list"), {"_profile": token})["X-Profile-Id"] for _ in range(3)]
+        self.assertEqual([path.stem for path in self.captures()], ids[1:])
+        self.assertEqual(len(list(Path(self.directory.name).glob("*.prof"))), 2)
+
+    def test_admin_pages_are_staff_only(self):
+        capture_id = self.client.get(reverse("dashboard"), {"_profile": issue_token(self.user)})["X-Profile-Id"]
+        self.assertEqual(self.client.get(reverse("request_profiles")).status_code, 302)
+
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.post(reverse("request_profiles"), {"username": self.user.username})
+        self.assertContains(response, reverse("request_profile", args=[capture_id]))
+        self.assertContains(response, "?_profile=")
+        response = self.client.get(reverse("request_profile", args=[capture_id]), {"sort": "tottime"})
+        self.assertContains(response, "function calls")
+        self.assertContains(response, "billing_invoice")
+        response = self.client.get(reverse("request_profile_download", args=[capture_id, "prof"]))
+        self.assertEqual(response["Content-Disposition"], f'attachment; filename="{capture_id}.prof"')
+        self.assertEqual(self.client.get(reverse("request_profile", args=["missing"])).status_code, 404)
+
+
+class PeriodCalendarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.client_obj = make_client(cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_period_bounds_follow_the_form_rules(self):
+        wednesday = date(2026, 2, 11)
+        self.assertEqual(period_bounds("weekly", wednesday), (date(2026, 2, 9), date(2026, 2, 15)))
+        self.assertEqual(period_bounds("fortnightly", wednesday), (wednesday, date(2026, 2, 24)))
+        self.assertEqual(period_bounds("monthly", wednesday), (wednesday, date(2026, 2, 28)))
+        with self.assertRaises(ValueError):
+            period_bounds("custom", wednesday, date(2026, 2, 1))
+
+    def test_parse_entries_uses_decimal_and_reports_every_bad_row(self):
+        start, end = date(2026, 2, 9), date(2026, 2, 15)
+        rows = [
+            {"work_date": "2026-02-09", "hours": "7.1", "description": "Dev"},
+            {"work_date": "2026-02-10", "hours": "", "description": ""},
+            {"work_date": "2026-02-16", "hours": "8"},
+            {"work_date": "2026-02-11", "hours": "lots"},
+        ]
+        with self.assertRaises(InvalidEntries) as raised:
+            parse_entries(rows, start, end)
+        self.assertEqual(set(raised.exception.errors), {2, 3})
+        entries = parse_entries(rows[:2], start, end)
+        self.assertEqual([(e.work_date, e.hours) for e in entries], [(start, Decimal("7.10"))])
+
+    def test_form_rejects_dates_outside_the_period(self):
+        data = invoice_post_data(None, date(2026, 2, 9), 7)
+        data["work_entries-6-work_date"] = "2026-03-01"
+        url = reverse("invoice_create_for_client", args=[self.client_obj.pk])
+        count = Invoice.objects.count()
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "outside the invoice period")
+        self.assertEqual(Invoice.objects.count(), count)
+
+        data["work_entries-6-work_date"] = "2026-02-15"
+        data["work_entries-0-hours"] = "0.1"
+        self.client.post(url, data)
+        invoice = Invoice.objects.latest("pk")
+        self.assertEqual(invoice.work_entries.count(), 7)
+        self.assertEqual(invoice.total_hours, Decimal("45.10"))
+
+    def test_api_rejects_dates_outside_the_period(self):
+        response = self.client.post(
+            reverse("api_invoice_batch_create"),
+            {
+                "client": self.client_obj.pk, "period_type": "weekly",
+                "period_start": "2026-02-09", "period_end": "2026-02-15",
+                "work_entries": [{"work_date": "2026-02-20", "hours": "8"}],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("0", response.json()["errors"])
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP for smtplib: records each message and connection.
+    """
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost stand-in")
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == "QUIT":
+                self.reply("221 bye")
+                return
+            if command == "EHLO":
+                self.reply("250 localhost")
+            elif command == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while (chunk := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(chunk)
+                self.server.messages.append(b"".join(data).decode())
+                self.reply("250 queued")
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply("250 ok")
+
+
+class _SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.messages = []
+        self.connections = 0
+
+
+@override_settings(
+    EMAIL_BACKEND="billing.mail.QueuedEmailBackend",
+    MAIL_QUEUE_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+    EMAIL_HOST="127.0.0.1",
+    EMAIL_USE_TLS=False,
+)
+class MailQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        client = make_client(cls.user)
+        for start in (date(2026, 3, 2), date(2026, 3, 9)):
+            make_invoice(client, start)
+
+    def setUp(self):
+        self.smtp = _SMTPStandIn()
+        threading.Thread(target=self.smtp.serve_forever, daemon=True).start()
+        self.addCleanup(self.smtp.server_close)
+        self.addCleanup(self.smtp.shutdown)
+        self.client.force_login(self.user)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        sent_pdfs = override_settings(SENT_PDF_ROOT=directory.name)
+        sent_pdfs.enable()
+        self.addCleanup(sent_pdfs.disable)
+
+    def test_send_invoice_only_enqueues_then_worker_delivers_batch_on_one_connection(self):
+        invoices = list(Invoice.objects.filter(user=self.user))
+        for invoice in invoices:
+            self.client.post(reverse("invoice_send", args=[invoice.pk]))
+        self.assertEqual(self.smtp.connections, 0)
+        self.assertEqual(OutboundEmail.objects.filter(status="queued").count(), 2)
+
+        with override_settings(EMAIL_PORT=self.smtp.server_address[1]):
+            self.assertEqual(deliver_due(), (2, 0))
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(len(self.smtp.messages), 2)
+        self.assertIn("application/pdf", self.smtp.messages[0])
+        self.assertFalse(OutboundEmail.objects.exclude(status="sent").exists())
+        # The worker stored each PDF as sent, and attached those bytes
+        for email in OutboundEmail.objects.select_related("invoice"):
+            self.assertFalse(email.invoice.sent_pdf_pending)
+            self.assertEqual(bytes(email.attachment), read_pdf(email.invoice.sent_pdf_sha256))
+
+    def test_password_reset_is_queued_and_failures_back_off(self):
+        self.client.post(reverse("password_reset"), {"email": self.user.email})
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.to, [self.user.email])
+
+        # Nothing listening on this port: the attempt fails and is rescheduled.
+        self.smtp.server_close()
+        with override_settings(EMAIL_PORT=self.smtp.server_address[1]):
+            self.assertEqual(deliver_due(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ("queued", 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+
+    def test_worker_loop_logs_a_failed_round_and_keeps_going(self):
+        command = "billing.management.commands.send_queued_mail"
+
+        class Stop(Exception):
+            pass
+
+        failing = mock.patch(f"{command}.deliver_due", side_effect=[OperationalError("connection lost"), (0, 0)])
+        with failing as deliver, mock.patch(f"{command}.time.sleep", side_effect=[None, Stop]):
+            with self.assertLogs(command, "ERROR") as logs, self.assertRaises(Stop):
+                call_command("send_queued_mail", "--loop")
+        self.assertEqual(deliver.call_count, 2)
+        self.assertIn("connection lost", logs.output[0])
+
+        # A single run still fails loudly
+        with mock.patch(f"{command}.deliver_due", side_effect=OperationalError("connection lost")):
+            with self.assertRaises(OperationalError):
+                call_command("send_queued_mail")
+
+
+class APITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.client_obj = make_client(cls.user)
+        cls.invoices = [make_invoice(cls.client_obj, date(2026, 3, 2) + timedelta(weeks=i), days=2) for i in range(3)]
+        # Someone else's invoice never shows up
+        make_invoice(make_client(make_user("other")))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post_batch(self, **payload):
+        payload = {
+            "client": self.client_obj.pk, "period_type": "weekly",
+            "period_start": "2026-04-06", "period_end": "2026-04-12",
+            "work_entries": [{"work_date": "2026-04-06", "hours": "7.5", "description": "Development"}],
+            **payload,
+        }
+        return self.client.post(reverse("api_invoice_batch_create"), payload, content_type="application/json")
+
+    def test_cursor_pagination_walks_every_invoice_once(self):
+        url = reverse("api_invoice_list")
+        page = self.client.get(url, {"limit": 2, "fields": "id,total_hours"}).json()
+        self.assertEqual(
+            page["results"],
+            [{"id": i.pk, "total_hours": "16.00"} for i in reversed(self.invoices[1:])],
+        )
+        last = self.client.get(url, {"limit": 2, "fields": "id", "cursor": page["next_cursor"]}).json()
+        self.assertEqual(last, {"results": [{"id": self.invoices[0].pk}], "next_cursor": None})
+        self.assertEqual(self.client.get(url, {"cursor": "not a cursor"}).status_code, 400)
+
+    def test_if_none_match_lists_are_compared_weakly(self):
+        url = reverse("api_invoice_detail", args=[self.invoices[0].pk])
+        etag = self.client.get(url)["ETag"].removeprefix("W/")
+        for header in (etag, f'"other", W/{etag}', "*"):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=header).status_code, 304, header)
+        # A tag that merely contains the current one is a different tag
+        for header in ('"other"', f'"x{etag[1:]}'):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=header).status_code, 200, header)
+
+    def test_batch_create_validates_before_writing(self):
+        response = self.post_batch()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["total_hours"], "7.50")
+        self.assertEqual(response.json()["total_amount"], "600.00")
+
+        for payload, error in (
+            ({"client": True}, "client must be a client id."),
+            ({"client": str(self.client_obj.pk)}, "client must be a client id."),
+            ({"period_end": "2026-04-01"}, "Invalid invoice."),
+            ({"work_entries": {"hours": 8}}, "work_entries must be a list."),
+            ({"work_entries": [{"work_date": "2026-04-06", "hours": "-1"}]}, "Invalid work entries."),
+        ):
+            response = self.post_batch(**payload)
+            self.assertEqual((response.status_code, response.json()["error"]), (400, error), payload)
+        self.assertEqual(self.client.post(
+            reverse("api_invoice_batch_create"), "[]", content_type="application/json",
+        ).status_code, 400)
+        self.assertEqual(Invoice.objects.filter(user=self.user).count(), 4)
+
+
+class TimeSliceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.client_obj = make_client(cls.user, rate=80)
+        cls.invoice = make_invoice(cls.client_obj, date(2030, 3, 4), hours=None)
+        cls.entry = WorkEntry.objects.create(invoice=cls.invoice, work_date=date(2030, 3, 4), hours=Decimal("2.00"))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse("api_time_slice_create")
+
+    def post(self, *slices):
+        return self.client.post(self.url, json.dumps({"slices": list(slices)}), content_type="application/json")
+
+    def slice(self, day, seconds, **extra):
+        return {"client": self.client_obj.pk, "started_at": f"{day}T09:00:00+01:00", "seconds": seconds, **extra}
+
+    def test_posts_only_append_slices_and_retries_are_ignored(self):
+        with CaptureQueriesContext(connections["default"]) as queries:
+            response = self.post(self.slice("2030-03-04", 300, key="a"), self.slice("2030-03-05", 300, key="b"))
+        self.assertEqual((response.status_code, response.json()), (202, {"received": 2}))
+        # One INSERT and nothing else written (not even the session); no invoice or work entry read
+        writes = [q["sql"] for q in queries if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))]
+        self.assertEqual(len(writes), 1)
+        self.assertIn("billing_timeslice", writes[0])
+        self.assertFalse([q for q in queries if "billing_invoice" in q["sql"] or "billing_workentry" in q["sql"]])
+        self.post(self.slice("2030-03-04", 300, key="a"))
+        self.assertEqual(TimeSlice.objects.count(), 2)
+
+        other = make_client(make_user("other"), "Other", rate=1)
+        response = self.post(self.slice("2030-03-04", 0), {**self.slice("2030-03-04", 60), "client": other.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()["errors"]), {"0", "1"})
+        self.assertEqual(TimeSlice.objects.count(), 2)
+
+    def test_coalescing_adds_whole_hundredths_to_the_open_invoice(self):
+        self.post(
+            self.slice("2030-03-04", 1800), self.slice("2030-03-04", 1500),
+            self.slice("2030-03-06", 300, description="Timer"), self.slice("2030-04-01", 600),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(coalesce_time_slices(batch_size=2), 2)  # two days, one per batch
+
+        self.entry.refresh_from_db()
+        # 3300 s is 0.91 h and 24 s left over
+        self.assertEqual((self.entry.hours, self.entry.amount), (Decimal("2.91"), Decimal("232.80")))
+        created = WorkEntry.objects.get(invoice=self.invoice, work_date=date(2030, 3, 6))
+        self.assertEqual((created.hours, created.amount, created.description), (Decimal("0.08"), Decimal("6.40"), "Timer"))
+        self.assertEqual(
+            sorted(TimeSlice.objects.filter(coalesced_at__isnull=True).values_list("work_date", "seconds")),
+            [(date(2030, 3, 4), 24), (date(2030, 3, 6), 12), (date(2030, 4, 1), 600)],
+        )
+        self.assertEqual(
+            set(ChangeLog.objects.values_list("model", "object_id").filter(model__in=["invoice", "work_entry"])),
+            {("invoice", self.invoice.pk), ("work_entry", self.entry.pk), ("work_entry", created.pk)},
+        )
+
+        # The leftovers go in with the day's next slices
+        self.post(self.slice("2030-03-04", 12))
+        coalesce_time_slices()
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.hours, Decimal("2.92"))
+        self.assertFalse(TimeSlice.objects.filter(work_date=date(2030, 3, 4), coalesced_at__isnull=True).exists())
+
+    def test_retry_after_coalescing_is_not_counted_again(self):
+        self.post(self.slice("2030-03-04", 3600, key="a"))
+        coalesce_time_slices()
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.hours, Decimal("3.00"))
+
+        # The timer did not see the answer and posts the slice again
+        self.assertEqual(self.post(self.slice("2030-03-04", 3600, key="a")).status_code, 202)
+        coalesce_time_slices()
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.hours, Decimal("3.00"))
+
+        # The key is given up once kept for TIME_SLICE_KEY_DAYS
+        self.assertEqual(purge_coalesced_slices(timezone.now() + timedelta(days=6)), 0)
+        self.assertEqual(purge_coalesced_slices(timezone.now() + timedelta(days=8)), 1)
+        self.assertFalse(TimeSlice.objects.exists())
+
+
+    def test_hours_over_the_entry_limit_stay_pending(self):
+        WorkEntry.objects.filter(pk=self.entry.pk).update(hours=Decimal("999.00"))
+        self.post(self.slice("2030-03-04", 7200, key="a"), self.slice("2030-03-05", 3600, key="b"))
+        with self.assertLogs("billing.timeslices", "WARNING"):
+            self.assertEqual(coalesce_time_slices(), 1)
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.hours, Decimal("999.00"))
+        # Nothing is lost: the day's slices wait until the entry has room
+        self.assertEqual(list(TimeSlice.objects.filter(coalesced_at__isnull=True).values_list("key", flat=True)), ["a"])
+        WorkEntry.objects.filter(pk=self.entry.pk).update(hours=Decimal("8.00"))
+        coalesce_time_slices()
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.hours, Decimal("10.00"))
+
+    def test_worker_loop_logs_a_failed_run_and_keeps_going(self):
+        command = "billing.management.commands.coalesce_time_slices"
+
+        class Stop(Exception):
+            pass
+
+        failing = mock.patch(f"{command}.coalesce_time_slices", side_effect=[OperationalError("connection lost"), 0])
+        with failing as coalesce, mock.patch(f"{command}.time.sleep", side_effect=[None, Stop]):
+            with self.assertLogs(command, "ERROR") as logs, self.assertRaises(Stop):
+                call_command("coalesce_time_slices", "--loop", stdout=StringIO())
+        self.assertEqual(coalesce.call_count, 2)
+        self.assertIn("connection lost", logs.output[0])
+
+
+class ChangeSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.invoice = make_invoice(make_client(cls.user))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _changes(self, **params):
+        response = self.client.get(reverse("api_changes"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_edit_reports_invoice_new_entries_and_tombstones(self):
+        invoice = self.invoice
+        old_entries = set(invoice.work_entries.values_list("pk", flat=True))
+        cursor = self._changes()["cursor"]
+
+        self.client.post(reverse("invoice_edit", args=[invoice.pk]), invoice_post_data(invoice, invoice.period_start, 3))
+        page = self._changes(since=cursor)
+        by_type = {}
+        for change in page["changes"]:
+            by_type.setdefault(change["type"], []).append(change)
+
+        self.assertEqual([c["id"] for c in by_type["invoice"]], [invoice.pk])
+        self.assertEqual(by_type["invoice"][0]["data"]["total_hours"], "22.50")
+        self.assertEqual({c["id"] for c in by_type["work_entry"] if c.get("deleted")}, old_entries)
+        self.assertEqual(len([c for c in by_type["work_entry"] if "data" in c]), 3)
+        seqs = [c["seq"] for c in page["changes"]]
+        self.assertEqual(seqs, sorted(seqs))
+
+        self.assertEqual(self._changes(since=page["cursor"])["changes"], [])
+        first = self._changes(since=cursor, limit=2)
+        self.assertTrue(first["has_more"])
+        self.assertEqual(first["changes"], page["changes"][:2])
+
+    def test_edit_writes_its_log_rows_together(self):
+        invoice = self.invoice
+        with CaptureQueriesContext(connections["default"]) as queries:
+            self.client.post(reverse("invoice_edit", args=[invoice.pk]), invoice_post_data(invoice, invoice.period_start, 7))
+        inserts = [q["sql"] for q in queries if q["sql"].startswith('INSERT INTO "billing_changelog"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_log_rows_commit_and_roll_back_with_the_change(self):
+        log = ChangeLog.objects.filter(model="invoice", object_id=self.invoice.pk)
+        seq = log.get().seq
+        with self.assertRaises(OperationalError), transaction.atomic():
+            self.invoice.notes = "Rolled back"
+            self.invoice.save()
+            self.assertGreater(log.get().seq, seq)
+            raise OperationalError("connection lost")
+        self.assertEqual(log.get().seq, seq)
+
+    def test_entries_deleted_with_their_invoice_leave_tombstones(self):
+        entries = set(self.invoice.work_entries.values_list("pk", flat=True))
+        cursor = self._changes()["cursor"]
+        for buffered in (True, False):
+            with self.subTest(buffered=buffered), transaction.atomic():
+                with tracking_changes() if buffered else nullcontext():
+                    Invoice.objects.get(pk=self.invoice.pk).delete()
+                changes = self._changes(since=cursor)["changes"]
+                self.assertEqual(
+                    {(c["type"], c["id"], c.get("deleted")) for c in changes},
+                    {("invoice", self.invoice.pk, True)} | {("work_entry", pk, True) for pk in entries},
+                )
+                transaction.set_rollback(True)
+
+
+class StaticAssetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+
+    def test_sprite_has_every_icon_the_templates_use(self):
+        sprite = (settings.BASE_DIR / "static" / "icons.svg").read_text()
+        used = set()
+        for path in (settings.BASE_DIR / "templates").rglob("*.html"):
+            used |= set(re.findall(r'{% icon "([\w-]+)"', path.read_text()))
+        self.assertTrue(used)
+        self.assertEqual({name for name in used if f'<symbol id="{name}"' not in sprite}, set())
+
+    def test_collected_assets_are_hashed_precompressed_and_cached_forever(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            STATIC_ROOT=root, STATICFILES_STORAGE="whitenoise.storage.CompressedManifestStaticFilesStorage",
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            http = self.client_class()  # WhiteNoise indexes STATIC_ROOT when it starts
+            http.force_login(self.user)
+            page = http.get(reverse("dashboard")).content.decode()
+            self.assertNotIn("<style>", page)
+            css_url = re.search(r'href="(/?static/css/app\.[0-9a-f]{12}\.css)"', page).group(1)
+            response = http.get("/" + css_url.lstrip("/"), HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertIn("immutable", response["Cache-Control"])
+
+            js_url = re.search(r'src="(/?static/vendor/bootstrap/bootstrap\.bundle\.min\.[0-9a-f]{12}\.js)"', page).group(1)
+            response = http.get("/" + js_url.lstrip("/"), HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual((response.status_code, response["Content-Encoding"]), (200, "gzip"))
+
+    # collectstatic needs the Brotli package itself; brotlicffi is not enough
+    @skipUnless(whitenoise_compress.brotli_installed, "Brotli is not installed")
+    def test_collected_assets_are_served_brotli_encoded_when_accepted(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            STATIC_ROOT=root, STATICFILES_STORAGE="whitenoise.storage.CompressedManifestStaticFilesStorage",
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            self.assertTrue(list(Path(root).glob("css/app.*.css.br")))
+            http = self.client_class()
+            http.force_login(self.user)
+            page = http.get(reverse("dashboard")).content.decode()
+            css_url = re.search(r'href="(/?static/css/app\.[0-9a-f]{12}\.css)"', page).group(1)
+            response = http.get("/" + css_url.lstrip("/"), HTTP_ACCEPT_ENCODING="gzip, br")
+            self.assertEqual(response["Content-Encoding"], "br")
+            self.assertIn(b".app-nav", brotli.decompress(b"".join(response.streaming_content)))
+
+
+class ServerBootTests(TestCase):
+    def test_workers_are_sized_by_cpu_and_memory(self):
+        # 2 * cpus + 1 requests in flight, as workers while memory lasts, then as threads
+        self.assertEqual(size_workers(cpus=1, memory_mb=512), (2, 2))
+        self.assertEqual(size_workers(cpus=4, memory_mb=8192), (9, 1))
+        self.assertEqual(size_workers(cpus=2, memory_mb=200), (1, 4))
+
+    def test_boot_skips_collectstatic_when_sources_are_unchanged(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            out = StringIO()
+            call_command("boot", "--skip-migrate", stdout=out)
+            self.assertIn("collectstatic: collected", out.getvalue())
+            self.assertTrue((Path(root) / "css" / "app.css").is_file())
+            out = StringIO()
+            call_command("boot", "--skip-migrate", stdout=out)
+            self.assertIn("collectstatic: unchanged, skipped", out.getvalue())
+            self.assertIn("check: passed", out.getvalue())
+
+
+class CompressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.invoice = make_invoice(make_client(cls.user))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_negotiation_prefers_brotli_and_honours_q_zero(self):
+        self.assertEqual(negotiate("gzip, deflate, br"), "br" if brotli else "gzip")
+        self.assertEqual(negotiate("gzip, br;q=0"), "gzip")
+        self.assertIsNone(negotiate("identity"))
+
+    def test_pages_and_streams_are_compressed_but_pdfs_are_not(self):
+        page = self.client.get(reverse("invoice_list"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(page["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", page["Vary"])
+        self.assertIn(b"<!doctype html>", gzip.decompress(page.content))
+
+        ubl = self.client.get(reverse("invoice_ubl", args=[self.invoice.pk]), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(ubl.streaming)
+        self.assertEqual(ubl["Content-Encoding"], "gzip")
+        ElementTree.fromstring(gzip.decompress(b"".join(ubl.streaming_content)))
+
+        pdf = self.client.get(reverse("invoice_pdf", args=[self.invoice.pk]), HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertFalse(pdf.has_header("Content-Encoding"))
+        self.assertTrue(pdf.content.startswith(b"%PDF"))
+
+    def test_minify_keeps_preformatted_blocks(self):
+        html = "<div>\n    <p>Hi</p>\n\n  </div>\n<textarea>\n  line one\n    line two</textarea>"
+        self.assertEqual(minify_html(html), "<div>\n<p>Hi</p>\n</div>\n<textarea>\n  line one\n    line two</textarea>")
+        plain = self.client.get(reverse("invoice_list")).content.decode()
+        with override_settings(HTML_MINIFY=True):
+            minified = self.client.get(reverse("invoice_list")).content.decode()
+        self.assertLess(len(minified), len(plain))
+        self.assertEqual(minify_html(minified), minified)
+
+
+class PDFRendererTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.client_obj = make_client(cls.user)
+        cls.invoice = make_invoice(cls.client_obj)
+
+    def test_template_and_stylesheet_are_prepared_once(self):
+        renderer = XHTML2PDFRenderer()
+        self.assertIs(renderer.prepare(), renderer.prepare())
+        self.assertTrue(renderer.render(self.invoice).startswith(b"%PDF"))
+
+    def test_missing_fonts_fall_back_to_helvetica(self):
+        with self.assertLogs("billing.pdf", "WARNING"):
+            self.assertFalse(register_fonts(Path(__file__).parent / "no-fonts"))
+
+    @skipUnless((Path(settings.PDF_FONT_DIR) / "DejaVuSans.ttf").is_file(), "DejaVu Sans not installed")
+    def test_dejavu_sans_is_embedded(self):
+        self.assertIn(b"DejaVuSans", XHTML2PDFRenderer().render(self.invoice))
+
+    @override_settings(INVOICE_PDF_RENDERER="billing.pdf_reportlab.ReportLabRenderer")
+    def test_reportlab_engine_serves_the_download_and_breaks_pages(self):
+        long_invoice = make_invoice(self.client_obj, date(2026, 1, 1), days=120, hours="7.50", period_type="custom")
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("invoice_pdf", args=[long_invoice.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b"%PDF"))
+        self.assertGreater(response.content.count(b"/Type /Page\n"), 1)
+
+
+class _SteadyRenderer(BasePDFRenderer):
+    def render(self, invoice, profile=None):
+        return bytes(bytearray(20000)[:4])
+
+
+class _LeakyRenderer(BasePDFRenderer):
+    kept = []
+
+    def render(self, invoice, profile=None):
+        self.kept.append(bytearray(20000))
+        return b"%PDF"
+
+
+class _BlockingRenderer(BasePDFRenderer):
+    started, release = threading.Event(), threading.Event()
+
+    def render(self, invoice, profile=None):
+        self.started.set()
+        self.release.wait(5)
+        return b"%PDF"
+
+
+class PDFMemoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.invoice = make_invoice(make_client(make_user()))
+
+    def test_render_drops_xhtml2pdf_caches(self):
+        render_invoice_pdf(self.invoice, engine="billing.pdf.XHTML2PDFRenderer")
+        self.assertFalse(any(pdf._xhtml2pdf_caches()))
+
+    def test_caches_are_kept_while_another_render_runs(self):
+        memoized = {"12pt": 12.0}
+        self.addCleanup(_BlockingRenderer.release.clear)
+        self.addCleanup(_BlockingRenderer.started.clear)
+        with mock.patch.object(pdf, "_memoized_caches", [memoized]):
+            slow = threading.Thread(target=pdf._render, args=("billing.tests._BlockingRenderer", self.invoice, None))
+            slow.start()
+            self.assertTrue(_BlockingRenderer.started.wait(5))
+            pdf._render("billing.tests._SteadyRenderer", self.invoice, None)
+            self.assertEqual(memoized, {"12pt": 12.0})
+            _BlockingRenderer.release.set()
+            slow.join(5)
+            self.assertEqual(memoized, {})
+
+    def test_harness_flags_memory_that_grows_with_every_render(self):
+        results = run_pdf_memory(
+            generate_dataset(users=1, clients=1, invoices=2, seed=47), renders=60, engines=["billing.tests._SteadyRenderer", "billing.tests._LeakyRenderer"],
+        )
+        _LeakyRenderer.kept.clear()
+        self.assertLess(results["billing.tests._SteadyRenderer"]["traced_kb_per_1000"], 512)
+        self.assertGreater(results["billing.tests._LeakyRenderer"]["traced_kb_per_1000"], 15000)
+        leaks = pdf_memory_leaks(results)
+        self.assertEqual({leak.split(":")[0] for leak in leaks}, {"billing.tests._LeakyRenderer"})
+        self.assertIn("billing.tests._LeakyRenderer: Python memory grows", leaks[0])
+
+    @override_settings(PDF_RENDER_MEMORY_LIMIT_MB=1, INVOICE_PDF_RENDERER="billing.pdf_reportlab.ReportLabRenderer")
+    def test_over_the_memory_limit_renders_in_a_helper_process(self):
+        self.addCleanup(setattr, pdf, "_subprocess_pool", None)
+        invoice = (
+            Invoice.objects.select_related("client", "user").prefetch_related("work_entries").get(pk=self.invoice.pk)
+        )
+        self.assertTrue(render_invoice_pdf(invoice).startswith(b"%PDF"))
+        self.assertIsNotNone(pdf._subprocess_pool)
+        self.addCleanup(pdf._subprocess_pool.shutdown)
+
+
+class SentPDFTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.invoice = make_invoice(make_client(cls.user))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings_override = override_settings(SENT_PDF_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def mark_sent(self):
+        self.client.post(reverse("invoice_mark_sent", args=[self.invoice.pk]))
+        self.assertEqual(freeze_pending_pdfs(), 1)
+        return Invoice.objects.get(pk=self.invoice.pk).sent_pdf_sha256
+
+    def test_marking_sent_leaves_the_render_to_the_worker(self):
+        with mock.patch.object(pdf, "_render", wraps=pdf._render) as render:
+            self.client.post(reverse("invoice_status_fragment", args=[self.invoice.pk]), {"status": "sent"})
+        render.assert_not_called()
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+        self.assertEqual((invoice.sent_pdf_sha256, invoice.sent_pdf_pending), ("", True))
+        # Rendered on demand until the worker has stored it
+        response = self.client.get(reverse("invoice_pdf", args=[self.invoice.pk]))
+        self.assertTrue(response.content.startswith(b"%PDF"))
+        self.assertNotIn("ETag", response)
+
+        self.assertEqual(freeze_pending_pdfs(), 1)
+        invoice.refresh_from_db()
+        self.assertEqual(read_pdf(invoice.sent_pdf_sha256), response.content)
+        self.assertFalse(invoice.sent_pdf_pending)
+        self.assertEqual(freeze_pending_pdfs(), 0)
+
+    def test_invoices_created_as_sent_are_stored(self):
+        data = invoice_post_data(None, date(2026, 4, 6), 7)
+        data.update(client=self.invoice.client_id, status="sent")
+        self.client.post(reverse("invoice_create"), data)
+        response = self.client.post(reverse("api_invoice_batch_create"), json.dumps({
+            "client": self.invoice.client_id, "period_start": "2026-04-13", "period_end": "2026-04-19", "status": "sent",
+        }), content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        created = Invoice.objects.exclude(pk=self.invoice.pk)
+        self.assertEqual(sorted(created.values_list("status", "sent_pdf_pending")), [("sent", True), ("sent", True)])
+
+        self.assertEqual(freeze_pending_pdfs(), 2)
+        self.assertFalse(created.filter(sent_pdf_sha256="").exists())
+
+    def test_failed_renders_are_tried_again(self):
+        self.client.post(reverse("invoice_mark_sent", args=[self.invoice.pk]))
+        with mock.patch("billing.pdf_store.render_invoice_pdf", side_effect=pdf.PDFRenderError("out of memory")):
+            with self.assertLogs("billing.pdf_store", "ERROR"):
+                self.assertEqual(freeze_pending_pdfs(), 0)
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+        self.assertEqual((invoice.sent_pdf_sha256, invoice.sent_pdf_pending), ("", True))
+        # Left to the failed worker until its claim runs out
+        self.assertEqual(freeze_pending_pdfs(), 0)
+        Invoice.objects.filter(pk=invoice.pk).update(sent_pdf_claimed_at=timezone.now() - pdf_store.FREEZE_LEASE)
+        self.assertEqual(freeze_pending_pdfs(), 1)
+        self.assertFalse(Invoice.objects.get(pk=invoice.pk).sent_pdf_pending)
+
+    def test_editing_a_sent_invoice_stores_it_again(self):
+        digest = self.mark_sent()
+        data = invoice_post_data(self.invoice, self.invoice.period_start, 7)
+        data.update(status="sent", hourly_rate="120.00")
+        self.client.post(reverse("invoice_edit", args=[self.invoice.pk]), data)
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+        self.assertEqual((invoice.sent_pdf_sha256, invoice.sent_pdf_pending), ("", True))
+
+        self.assertEqual(freeze_pending_pdfs(), 1)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.hourly_rate, Decimal("120.00"))
+        self.assertNotIn(invoice.sent_pdf_sha256, ("", digest))
+
+    def test_downloads_serve_the_pdf_stored_when_sent(self):
+        self.assertEqual(self.client.get(reverse("invoice_pdf", args=[self.invoice.pk])).get("ETag"), None)
+        digest = self.mark_sent()
+        self.assertEqual(blob_path(digest), self.directory / digest[:2] / f"{digest}.pdf")
+        stored = read_pdf(digest)
+
+        # Editing the profile afterwards does not change what the client was sent
+        UserProfile.objects.filter(user=self.user).update(business_name="Renamed Business")
+        response = self.client.get(reverse("invoice_pdf", args=[self.invoice.pk]))
+        self.assertEqual(b"".join(response.streaming_content), stored)
+        self.assertEqual(response["ETag"], f'"{digest}"')
+        self.assertEqual(response["Content-Length"], str(len(stored)))
+
+        # Back to draft drops the stored copy; sending again stores the new render
+        self.client.post(reverse("invoice_change_status", args=[self.invoice.pk]), {"status": "draft"})
+        self.assertEqual(Invoice.objects.get(pk=self.invoice.pk).sent_pdf_sha256, "")
+        self.assertNotEqual(self.mark_sent(), digest)
+
+    def test_ranges_and_conditional_requests(self):
+        digest = self.mark_sent()
+        stored = read_pdf(digest)
+        url = reverse("invoice_pdf", args=[self.invoice.pk])
+
+        response = self.client.get(url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), stored[10:20])
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(stored)}")
+        response = self.client.get(url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), stored[-5:])
+        response = self.client.get(url, HTTP_RANGE=f"bytes={len(stored)}-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, f"bytes */{len(stored)}"))
+        # A range of another version of the file gets the whole file
+        response = self.client.get(url, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f'"{digest}"').status_code, 304)
+
+    def test_identical_documents_are_stored_once(self):
+        digest = self.mark_sent()
+        self.client.post(reverse("invoice_change_status", args=[self.invoice.pk]), {"status": "draft"})
+        self.assertEqual(self.mark_sent(), digest)
+        self.assertEqual(list(self.directory.rglob("*")), [self.directory / digest[:2], blob_path(digest)])
+
+
+class UBLExportTests(TestCase):
+    NS = {
+        "cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
+        "cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        client = make_client(cls.user)
+        cls.invoice = make_invoice(client)
+        for start in (date(2026, 3, 9), date(2026, 3, 16)):
+            make_invoice(client, start)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_download_streams_a_complete_document(self):
+        invoice = self.invoice
+        response = self.client.get(reverse("invoice_ubl", args=[invoice.pk]))
+        self.assertTrue(response.streaming)
+        root = ElementTree.fromstring(b"".join(response.streaming_content))
+        self.assertEqual(root.find("cbc:ID", self.NS).text, invoice.invoice_number)
+        self.assertEqual(len(root.findall("cac:InvoiceLine", self.NS)), invoice.work_entries.count())
+        self.assertEqual(
+            root.find("cac:LegalMonetaryTotal/cbc:PayableAmount", self.NS).text, f"{invoice.total_amount:.2f}"
+        )
+        self.assertEqual(
+            root.find("cac:AccountingSupplierParty/cac:Party/cac:PartyName/cbc:Name", self.NS).text,
+            "Freelance Studio",
+        )
+
+    def test_bulk_archive_has_one_document_per_invoice(self):
+        output = BytesIO()
+        invoices = Invoice.objects.prefetch_related("work_entries").iterator(chunk_size=2)
+        self.assertEqual(write_ubl_archive(output, invoices), 3)
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual(len(archive.namelist()), 3)
+            for name in archive.namelist():
+                ElementTree.fromstring(archive.read(name))
+
+
+@override_settings(ARCHIVE_AFTER_DAYS=30)
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.client_obj = make_client(cls.user)
+        today = timezone.localdate()
+        # Four recent invoices, then eight paid ones that ended before the cutoff
+        for week in range(1, 5):
+            make_invoice(cls.client_obj, today - timedelta(weeks=week), status="sent")
+        cls.old_ids = {
+            make_invoice(cls.client_obj, today - timedelta(days=60, weeks=week), status="paid").pk
+            for week in range(8)
+        }
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _dashboard_totals(self, **params):
+        context = self.client.get(reverse("dashboard"), params).context
+        return context["total_invoices"], context["paid_count"], context["total_earned"]
+
+    def test_archived_invoices_leave_hot_tables_but_stay_readable(self):
+        reaching_back = {"date_to": archive_cutoff().isoformat()}
+        before = self._dashboard_totals(**reaching_back)
+        self.assertEqual(archive_invoices()[0], len(self.old_ids))
+        self.assertFalse(Invoice.objects.filter(pk__in=self.old_ids).exists())
+        self.assertFalse(WorkEntry.objects.filter(invoice_id__in=self.old_ids).exists())
+        self.assertEqual(self._dashboard_totals(**reaching_back), before)
+
+        response = self.client.get(reverse("invoice_list"), reaching_back)
+        self.assertEqual({inv.pk for inv in response.context["invoices"]}, self.old_ids)
+
+        pk = min(self.old_ids)
+        self.assertContains(self.client.get(reverse("invoice_detail", args=[pk])), "Archived")
+        self.assertEqual(self.client.get(reverse("invoice_pdf", args=[pk])).status_code, 200)
+
+    def test_only_date_filters_reaching_back_read_the_archive(self):
+        archive_invoices()
+        recent = {"date_from": (archive_cutoff() + timedelta(days=1)).isoformat()}
+        for name in ("dashboard", "invoice_list"):
+            for params, reads_archive in (({}, False), (recent, False), ({"date_to": archive_cutoff().isoformat()}, True)):
+                with self.subTest(name, **params), CaptureQueriesContext(connections["default"]) as queries:
+                    response = self.client.get(reverse(name), params)
+                # Apart from the note's one-row existence check
+                reads = [q for q in queries if "billing_archivedinvoice" in q["sql"] and "LIMIT 1" not in q["sql"]]
+                self.assertEqual(bool(reads), reads_archive)
+                self.assertEqual(response.context.get("has_archive", False), not params)
+        self.assertContains(self.client.get(reverse("dashboard")), "which are archived")
+
+    def test_archived_invoices_leave_the_change_feed_with_tombstones(self):
+        entry_ids = set(WorkEntry.objects.filter(invoice_id__in=self.old_ids).values_list("pk", flat=True))
+        cursor = self.client.get(reverse("api_changes")).json()["cursor"]
+        archive_invoices()
+        changes = self.client.get(reverse("api_changes"), {"since": cursor}).json()["changes"]
+        self.assertEqual(
+            {(c["type"], c["id"], c.get("deleted")) for c in changes},
+            {("invoice", pk, True) for pk in self.old_ids} | {("work_entry", pk, True) for pk in entry_ids},
+        )
+
+    def test_numbering_continues_after_the_archive(self):
+        # The newest invoices are the paid ones, numbered 00005 to 00012
+        archive_invoices()
+        self.assertEqual(ArchivedInvoice.objects.count(), 8)
+        invoice = make_invoice(self.client_obj, timezone.localdate(), days=1, hours=None)
+        self.assertEqual(invoice.invoice_number, "00013")
+
+
+@skipUnless("replica" in settings.DATABASES, "run with --settings=invoicegen.settings_test")
+@override_settings(DATABASE_REPLICA_READS=True)
+class ReplicaRoutingTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        # Created on the primary only, so reads served by the replica see nothing.
+        cls.user = make_user()
+        cls.client_obj = make_client(cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_read_only_views_use_replica_until_the_session_writes(self):
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            response = self.client.get(reverse("client_list"))
+        self.assertTrue(replica_queries)
+        self.assertNotContains(response, self.client_obj.name)
+
+        self.client.post(reverse("client_create"), {"name": "Fresh Client", "default_hourly_rate": "80", "is_active": "on"})
+
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            response = self.client.get(reverse("client_list"))
+        self.assertFalse(replica_queries)
+        self.assertContains(response, "Fresh Client")
+        self.assertContains(response, self.client_obj.name)
+
+    def test_pin_expires(self):
+        self.client.post(reverse("client_create"), {"name": "Fresh Client", "default_hourly_rate": "80", "is_active": "on"})
+        with override_settings(DATABASE_REPLICA_PIN_SECONDS=0):
+            self.client.post(reverse("client_create"), {"name": "Other Client", "default_hourly_rate": "80", "is_active": "on"})
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            self.client.get(reverse("invoice_list"))
+        self.assertTrue(replica_queries)
@@ -0,0 +1,254 @@
+"""
+Time slices posted by desktop timers, added up into daily work entries.
+
+Timers post the time they tracked every few minutes
+(``POST /api/v1/time-slices/``). A post only checks the slices and
+appends them to ``TimeSlice`` with one INSERT: no invoice or work entry is
+read, locked or written, so posts never wait on each other or on invoice
+edits. A retried post is dropped by that INSERT when its slices carry the
+same ``key``.
+
+``coalesce_time_slices`` (``manage.py coalesce_time_slices``) adds them to
+invoices in batches. For each batch, in one transaction, it:
+
+1. locks the next slices whose client has an open (draft) invoice covering
+   their day (``SKIP LOCKED`` on PostgreSQL, so parallel runners share the
+   work instead of blocking each other),
+2. sums them per user, client and day, and adds the hours to that day's
+   work entry of the newest such invoice with one relative UPDATE
+   (``hours = hours + n``, so an edit made meanwhile is added to rather
+   than overwritten), or creates the entry,
+3. marks the slices it added as coalesced (``coalesced_at``) and records
+   the entries and invoices for incremental sync.
+
+Coalesced slices are not deleted straight away: their ``key`` has to stay
+taken, or a timer retrying a post after its slices were added would have
+them counted again. They are deleted once older than
+``TIME_SLICE_KEY_DAYS`` (``purge_coalesced_slices``, at the end of each
+run), long after any timer gives up retrying.
+
+Hours are added in whole hundredths. The seconds left over (under 36) stay
+behind as one slice and go in with the day's next slices. Slices of days
+with no open invoice wait until one is created, and so do those that
+would take the day's entry over ``MAX_HOURS`` (logged), rather than the
+excess being cut off. Draft invoices do not count towards the client
+counters, so those are left alone.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, Exists, ExpressionWrapper, F, OuterRef, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Client, Invoice, TimeSlice, WorkEntry
+from .periods import CENTS, DESCRIPTION_LENGTH, MAX_HOURS
+from .sync import track
+
+logger = logging.getLogger(__name__)
+
+MAX_SLICES = 500
+MAX_SLICE_SECONDS = 24 * 3600
+KEY_LENGTH = 64
+HOURS = DecimalField(max_digits=5, decimal_places=2)
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+
+class InvalidSlices(ValueError):
+    def __init__(self, errors):
+        super().__init__("Invalid time slices.")
+        self.errors = errors
+
+
+def parse_slices(rows, user):
+    """
+    Turn posted slices (mappings with ``client``, ``started_at``,
+    ``seconds`` and optionally ``description`` and ``key``) into unsaved
+    ``TimeSlice`` objects of ``user``.
+
+    The day of a slice is the date of ``started_at`` as the timer wrote it,
+    i.e. the freelancer's own calendar day. Raises ``InvalidSlices`` listing
+    every bad row, including clients that are not the user's.
+    """
+    slices, errors = [], {}
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors[i] = "Each slice must be an object."
+            continue
+        try:
+            started_at = parse_datetime(row.get("started_at") or "")
+        except (TypeError, ValueError):
+            started_at = None
+        if started_at is None:
+            errors[i] = "Enter started_at as an ISO 8601 date and time."
+            continue
+        seconds, description, key = row.get("seconds"), row.get("description") or "", row.get("key") or ""
+        if type(seconds) is not int or not 0 < seconds <= MAX_SLICE_SECONDS:
+            errors[i] = f"seconds must be a whole number from 1 to {MAX_SLICE_SECONDS}."
+            continue
+        if type(row.get("client")) is not int:
+            errors[i] = "client must be a client id."
+            continue
+        if not isinstance(description, str) or not isinstance(key, str) or len(key) > KEY_LENGTH:
+            errors[i] = f"description and key must be strings, key at most {KEY_LENGTH} characters."
+            continue
+        slices.append((i, TimeSlice(
+            user=user,
+            client_id=row["client"],
+            work_date=started_at.date(),
+            seconds=seconds,
+            description=description[:DESCRIPTION_LENGTH],
+            key=key,
+        )))
+
+    owned = set(Client.objects.filter(user=user, pk__in={s.client_id for _, s in slices}).values_list("pk", flat=True))
+    for i, time_slice in slices:
+        if time_slice.client_id not in owned:
+            errors[i] = "Unknown client."
+    if errors:
+        raise InvalidSlices(errors)
+    return [time_slice for _, time_slice in slices]
+
+
+def record_slices(slices):
+    """
+    Append ``slices``; those whose ``key`` was already recorded, added to
+    an invoice or not, are dropped.
+    """
+    TimeSlice.objects.bulk_create(slices, ignore_conflicts=True)
+
+
+def _add_hours(entry_pk, hours, invoice_rate):
+    """
+    Add ``hours`` to a work entry in place, re-pricing it in the same
+    statement, unless that would take it over ``MAX_HOURS``. Returns
+    whether the hours were added.
+    """
+    total = ExpressionWrapper(F("hours") + Value(hours, output_field=HOURS), output_field=HOURS)
+    rate = Coalesce(F("hourly_rate"), Value(invoice_rate, output_field=MONEY), output_field=MONEY)
+    return WorkEntry.objects.filter(pk=entry_pk, hours__lte=MAX_HOURS - hours).update(
+        hours=total, amount=ExpressionWrapper(total * rate, output_field=MONEY),
+    )
+
+
+def _coalesce_batch(last_id, batch_size):
+    """
+    Add the next ``batch_size`` slices after ``last_id`` that have an open
+    invoice. Returns the id of the last slice looked at (None when there
+    were none) and how many work entries were updated or created.
+    """
+    open_invoice = Invoice.objects.filter(
+        user_id=OuterRef("user_id"), client_id=OuterRef("client_id"), status="draft",
+        period_start__lte=OuterRef("work_date"), period_end__gte=OuterRef("work_date"),
+    )
+    slices = list(
+        TimeSlice.objects.select_for_update(skip_locked=True)
+        .filter(Exists(open_invoice), coalesced_at__isnull=True, pk__gt=last_id).order_by("pk")[:batch_size]
+    )
+    if not slices:
+        return None, 0
+
+    days = {}
+    for time_slice in slices:
+        days.setdefault((time_slice.user_id, time_slice.client_id, time_slice.work_date), []).append(time_slice)
+    dates = [work_date for _, _, work_date in days]
+    # Newest first, so each day goes to the newest open invoice covering it
+    invoices = {}
+    for invoice in (
+        Invoice.objects.filter(
+            status="draft", client_id__in={client_id for _, client_id, _ in days},
+            period_start__lte=max(dates), period_end__gte=min(dates),
+        ).only("user_id", "client_id", "period_start", "period_end", "hourly_rate").order_by("-pk")
+    ):
+        invoices.setdefault((invoice.user_id, invoice.client_id), []).append(invoice)
+    entries = {}
+    for pk, invoice_id, work_date in (
+        WorkEntry.objects.filter(invoice__in=[i for group in invoices.values() for i in group], work_date__in=dates)
+        .order_by("pk").values_list("pk", "invoice_id", "work_date")
+    ):
+        entries.setdefault((invoice_id, work_date), pk)
+
+    added, kept, new_entries, updated = [], [], [], 0
+    changed_entries, changed_invoices = {}, {}
+    for (user_id, client_id, work_date), day_slices in days.items():
+        invoice = next(
+            (i for i in invoices.get((user_id, client_id), []) if i.period_start <= work_date <= i.period_end), None,
+        )
+        hundredths, leftover = divmod(sum(s.seconds for s in day_slices), 36)
+        if invoice is None or not hundredths:
+            continue  # no longer open, or under a hundredth of an hour so far
+        hours = (Decimal(hundredths) * CENTS).quantize(CENTS)
+        entry_pk = entries.get((invoice.pk, work_date))
+        if entry_pk and _add_hours(entry_pk, hours, invoice.hourly_rate):
+            changed_entries.setdefault(user_id, set()).add(entry_pk)
+        elif hours > MAX_HOURS or (entry_pk and WorkEntry.objects.filter(pk=entry_pk).exists()):
+            # The entry can't hold them: the slices wait, rather than the hours being cut off
+            logger.warning("Time slices of user %s on %s would exceed %s hours; left pending", user_id, work_date, MAX_HOURS)
+            continue
+        else:
+            entry = WorkEntry(
+                invoice=invoice, work_date=work_date, hours=hours,
+                description=next((s.description for s in day_slices if s.description), ""),
+            )
+            entry.amount = entry.compute_amount(invoice.hourly_rate)
+            new_entries.append(entry)
+        updated += 1
+        changed_invoices.setdefault(user_id, set()).add(invoice.pk)
+        if leftover:
+            day_slices[0].seconds = leftover
+            kept.append(day_slices[0])
+            day_slices = day_slices[1:]
+        added.extend(s.pk for s in day_slices)
+
+    WorkEntry.objects.bulk_create(new_entries)
+    TimeSlice.objects.bulk_update(kept, ["seconds"])
+    # Kept, not deleted, so their keys still catch retried posts
+    TimeSlice.objects.filter(pk__in=added).update(coalesced_at=timezone.now())
+
+    # Relative updates and bulk_create send no signals; record the changes for sync ourselves
+    if any(entry.pk is None for entry in new_entries):
+        # Backends that can't return ids from a bulk insert
+        ids = {
+            (invoice_id, work_date): pk for pk, invoice_id, work_date in
+            WorkEntry.objects.filter(invoice__in={e.invoice for e in new_entries}, work_date__in=dates)
+            .order_by("pk").values_list("pk", "invoice_id", "work_date")
+        }
+        for entry in new_entries:
+            entry.pk = ids[entry.invoice_id, entry.work_date]
+    for entry in new_entries:
+        changed_entries.setdefault(entry.invoice.user_id, set()).add(entry.pk)
+    for user_id, ids in changed_entries.items():
+        track("work_entry", ids, user_id=user_id)
+    for user_id, ids in changed_invoices.items():
+        track("invoice", ids, user_id=user_id)
+    return slices[-1].pk, updated
+
+
+def purge_coalesced_slices(now=None):
+    """
+    Delete the slices added more than ``TIME_SLICE_KEY_DAYS`` ago. Returns
+    how many were deleted.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=getattr(settings, "TIME_SLICE_KEY_DAYS", 7))
+    return TimeSlice.objects.filter(coalesced_at__lt=cutoff).delete()[0]
+
+
+def coalesce_time_slices(batch_size=5000):
+    """
+    Add every pending slice that has an open invoice to its work entry,
+    then purge the slices kept long enough. Returns the number of work
+    entry updates (one per day and batch).
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            last_id, count = _coalesce_batch(last_id, batch_size)
+        if last_id is None:
+            purge_coalesced_slices()
+            return updated
+        updated += count
@@ -0,0 +1,168 @@
+"""
+UBL 2.1 (Peppol BIS Billing 3.0 style) e-invoice export.
+
+Documents are written element by element with a SAX ``XMLGenerator`` and
+handed out in chunks, so nothing builds a DOM: the download view streams
+the chunks straight to the client and ``manage.py export_ubl`` writes them
+straight into a zip archive, one invoice at a time.
+"""
+import zipfile
+from io import StringIO
+from xml.sax.saxutils import XMLGenerator
+
+from django.conf import settings
+
+NAMESPACES = {
+    "xmlns": "urn:oasis:names:specification:ubl:schema:xsd:Invoice-2",
+    "xmlns:cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
+    "xmlns:cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
+}
+CUSTOMIZATION_ID = "urn:cen.eu:en16931:2017#compliant#urn:fdc:peppol.eu:2017:poacc:billing:3.0"
+PROFILE_ID = "urn:fdc:peppol.eu:2017:poacc:billing:01:1.0"
+COMMERCIAL_INVOICE = "380"
+HOURS_UNIT = "HUR"  # UN/ECE rec 20 code for "hour"
+
+# Work entries written between two chunks
+LINES_PER_CHUNK = 100
+
+
+def invoice_ubl_filename(invoice):
+    return f"Invoice_{invoice.invoice_number or invoice.pk}.xml"
+
+
+class _Writer:
+    def __init__(self):
+        self.buffer = StringIO()
+        self.xml = XMLGenerator(self.buffer, encoding="utf-8", short_empty_elements=True)
+
+    def drain(self):
+        chunk = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return chunk
+
+    def start(self, name, attrs=None):
+        self.xml.startElement(name, attrs or {})
+
+    def end(self, name):
+        self.xml.endElement(name)
+
+    def value(self, name, text, attrs=None):
+        if text in (None, ""):
+            return
+        self.xml.startElement(name, attrs or {})
+        self.xml.characters(str(text))
+        self.xml.endElement(name)
+
+    def amount(self, name, value, currency):
+        self.value(name, f"{value:.2f}", {"currencyID": currency})
+
+
+def _party(w, role, name, email="", phone="", address=""):
+    w.start(role)
+    w.start("cac:Party")
+    w.start("cac:PartyName")
+    w.value("cbc:Name", name)
+    w.end("cac:PartyName")
+    if address:
+        lines = [line.strip() for line in address.splitlines() if line.strip()]
+        w.start("cac:PostalAddress")
+        w.value("cbc:StreetName", lines[0] if lines else "")
+        w.value("cbc:AdditionalStreetName", ", ".join(lines[1:]))
+        w.end("cac:PostalAddress")
+    w.start("cac:PartyLegalEntity")
+    w.value("cbc:RegistrationName", name)
+    w.end("cac:PartyLegalEntity")
+    if email or phone:
+        w.start("cac:Contact")
+        w.value("cbc:Telephone", phone)
+        w.value("cbc:ElectronicMail", email)
+        w.end("cac:Contact")
+    w.end("cac:Party")
+    w.end(role)
+
+
+def iter_invoice_ubl(invoice, profile=None):
+    """
+    Yield the UBL document of ``invoice`` as text chunks. Work entries
+    should be prefetched; totals are taken from them.
+    """
+    currency = getattr(settings, "INVOICE_CURRENCY", "USD")
+    entries = invoice.work_entries.all()
+    total = invoice.total_amount
+    user = invoice.user
+    w = _Writer()
+
+    w.xml.startDocument()
+    w.start("Invoice", NAMESPACES)
+    w.value("cbc:CustomizationID", CUSTOMIZATION_ID)
+    w.value("cbc:ProfileID", PROFILE_ID)
+    w.value("cbc:ID", invoice.invoice_number or invoice.pk)
+    w.value("cbc:IssueDate", invoice.date_issued.isoformat())
+    w.value("cbc:InvoiceTypeCode", COMMERCIAL_INVOICE)
+    w.value("cbc:Note", invoice.notes)
+    w.value("cbc:DocumentCurrencyCode", currency)
+    w.start("cac:InvoicePeriod")
+    w.value("cbc:StartDate", invoice.period_start.isoformat())
+    w.value("cbc:EndDate", invoice.period_end.isoformat())
+    w.end("cac:InvoicePeriod")
+
+    sender = (profile.business_name if profile else "") or (user.get_full_name() or user.username if user else "")
+    _party(
+        w, "cac:AccountingSupplierParty", sender,
+        email=user.email if user else "",
+        phone=profile.phone if profile else "",
+        address=profile.address if profile else "",
+    )
+    _party(w, "cac:AccountingCustomerParty", invoice.client_name, email=invoice.client_email)
+
+    w.start("cac:TaxTotal")
+    w.amount("cbc:TaxAmount", 0, currency)
+    w.end("cac:TaxTotal")
+    w.start("cac:LegalMonetaryTotal")
+    w.amount("cbc:LineExtensionAmount", total, currency)
+    w.amount("cbc:TaxExclusiveAmount", total, currency)
+    w.amount("cbc:TaxInclusiveAmount", total, currency)
+    w.amount("cbc:PayableAmount", total, currency)
+    w.end("cac:LegalMonetaryTotal")
+    yield w.drain()
+
+    for line, entry in enumerate(entries, 1):
+        w.start("cac:InvoiceLine")
+        w.value("cbc:ID", line)
+        w.value("cbc:InvoicedQuantity", f"{entry.hours:.2f}", {"unitCode": HOURS_UNIT})
+        w.amount("cbc:LineExtensionAmount", entry.amount, currency)
+        w.start("cac:InvoicePeriod")
+        w.value("cbc:StartDate", entry.work_date.isoformat())
+        w.value("cbc:EndDate", entry.work_date.isoformat())
+        w.end("cac:InvoicePeriod")
+        w.start("cac:Item")
+        w.value("cbc:Name", entry.description or "Services")
+        w.end("cac:Item")
+        w.start("cac:Price")
+        w.amount("cbc:PriceAmount", entry.hourly_rate if entry.hourly_rate is not None else invoice.hourly_rate, currency)
+        w.end("cac:Price")
+        w.end("cac:InvoiceLine")
+        if line % LINES_PER_CHUNK == 0:
+            yield w.drain()
+
+    w.end("Invoice")
+    w.xml.endDocument()
+    yield w.drain()
+
+
+def write_ubl_archive(fileobj, invoices):
+    """
+    Write one UBL document per invoice into a zip archive on ``fileobj``.
+    ``invoices`` should be an iterator (e.g. ``QuerySet.iterator()``) so only
+    one chunk of invoices is held in memory. Returns the number written.
+    """
+    count = 0
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for invoice in invoices:
+            name = f"{invoice.pk}_{invoice_ubl_filename(invoice)}"
+            with archive.open(name, "w") as member:
+                for chunk in iter_invoice_ubl(invoice, getattr(invoice.user, "userprofile", None)):
+                    member.write(chunk.encode("utf-8"))
+            count += 1
+    return count
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 from django.contrib.auth import views as auth_views
 
 urlpatterns = [
@@ -7,6 +7,8 @@ urlpatterns = [
     
     # Health check for Railway (moved to /health/)
     path("health/", views.health_check, name="health_check"),
+    path("health/live/", views.health_check, name="health_live"),
+    path("health/ready/", views.readiness_check, name="health_ready"),
     
     # Dashboard (redirect to client list for now)
     path("dashboard/", views.dashboard, name="dashboard"),
@@ -18,18 +20,35 @@ urlpatterns = [
     path("clients/<int:pk>/edit/", views.client_edit, name="client_edit"),
     path("clients/<int:pk>/delete/", views.client_delete, name="client_delete"),
     path("clients/<int:pk>/invoices/new/", views.invoice_create_for_employee, name="invoice_create_for_client"),
+    path("clients/<int:pk>/recurring/new/", views.recurring_schedule_create, name="recurring_schedule_create"),
+    path("recurring/<int:pk>/edit/", views.recurring_schedule_edit, name="recurring_schedule_edit"),
     
     # Invoice management
     path("invoices/", views.invoice_list, name="invoice_list"),
     path("invoices/new/", views.invoice_create, name="invoice_create"),
+    path("invoices/roll-forward/", views.invoice_roll_forward, name="invoice_roll_forward"),
     path("invoices/<int:pk>/", views.invoice_detail, name="invoice_detail"),
     path("invoices/<int:pk>/pdf/", views.invoice_pdf, name="invoice_pdf"),
+    path("invoices/<int:pk>/ubl/", views.invoice_ubl, name="invoice_ubl"),
     path("invoices/<int:pk>/edit/", views.invoice_edit, name="invoice_edit"),
     path("invoices/<int:pk>/status/", views.invoice_change_status, name="invoice_change_status"),
+    path("invoices/<int:pk>/status/fragment/", views.invoice_status_fragment, name="invoice_status_fragment"),
+    path("invoices/<int:pk>/send/", views.invoice_send, name="invoice_send"),
     path("invoices/<int:pk>/mark-sent/", views.invoice_mark_sent, name="invoice_mark_sent"),
     path("invoices/<int:pk>/mark-paid/", views.invoice_mark_paid, name="invoice_mark_paid"),
     path("invoices/<int:pk>/duplicate/", views.invoice_duplicate, name="invoice_duplicate"),
+    path("invoices/<int:pk>/duplicate-next/", views.invoice_duplicate_next, name="invoice_duplicate_next"),
     
+    # JSON API
+    path("api/v1/clients/", api.client_list, name="api_client_list"),
+    path("api/v1/clients/<int:pk>/", api.client_detail, name="api_client_detail"),
+    path("api/v1/invoices/", api.invoice_list, name="api_invoice_list"),
+    path("api/v1/invoices/batch/", api.invoice_batch_create, name="api_invoice_batch_create"),
+    path("api/v1/invoices/<int:pk>/", api.invoice_detail, name="api_invoice_detail"),
+    path("api/v1/invoices/<int:pk>/work-entries/", api.work_entry_list, name="api_work_entry_list"),
+    path("api/v1/time-slices/", api.time_slice_create, name="api_time_slice_create"),
+    path("api/v1/changes/", api.changes, name="api_changes"),
+
     # Authentication URLs
     path("profile/", views.profile, name="profile"),
     path("login/", views.login_view, name="login"),
@@ -1,56 +1,99 @@
-from datetime import timedelta
+import json
+from datetime import date, timedelta
 
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import Q, Sum, prefetch_related_objects
 from django.shortcuts import get_object_or_404, redirect, render
-from django.utils import timezone
-from django.http import HttpResponse
 from django.template.loader import render_to_string
-
-from .forms import InvoiceForm, WorkEntryFormSet, ClientForm, UserProfileForm, RegisterForm
-from .models import Invoice, Client, WorkEntry, UserProfile
+from django.utils import timezone
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+
+from .archive import archive_cutoff, archived_totals, reaches_archive
+from .counters import add_to_counters, updating_counters
+from .db_router import read_replica
+from .duplication import duplicate_invoices
+from .forms import InvoiceForm, WorkEntryFormSet, ClientForm, UserProfileForm, RegisterForm, RecurringScheduleForm
+from .health import run_readiness_checks
+from .mail import enqueue_invoice_email
+from .models import Invoice, Client, WorkEntry, UserProfile, RecurringSchedule, ArchivedInvoice
+from .pdf import PDFRenderError, invoice_pdf_filename, render_invoice_pdf
+from .pdf_store import serve_pdf
+from .periods import InvalidEntries, days_between, default_period, monday_of, parse_entries, posted_entry_rows
+from .sync import track, tracking_changes
+from .ubl import invoice_ubl_filename, iter_invoice_ubl
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 
 
-from io import BytesIO
-from xhtml2pdf import pisa
-
-# Simple health check view
+# Liveness: the process is up and serving requests. Never touches the DB.
 def health_check(request):
     return HttpResponse("OK", content_type="text/plain")
 
 
+# Readiness: dependencies answer in time. Returns 503 so the load balancer
+# stops routing to a worker whose database connection is dead.
+def readiness_check(request):
+    ok, checks, cached = run_readiness_checks()
+    return JsonResponse(
+        {"status": "ok" if ok else "fail", "cached": cached, "checks": checks},
+        status=200 if ok else 503,
+    )
+
+
 def root_redirect(request):
     if request.user.is_authenticated:
         return redirect('dashboard')
     return redirect('login')
 
 
+def _filter_invoices(invoices, client_ids, date_from, date_to):
+    """
+    Client and period filters shared by the dashboard and the invoice list;
+    ``invoices`` may be a hot or an archived queryset.
+    """
+    if client_ids:
+        invoices = invoices.filter(client_id__in=client_ids)
+    if date_from:
+        invoices = invoices.filter(period_start__gte=date_from)
+    if date_to:
+        invoices = invoices.filter(period_end__lte=date_to)
+    return invoices
+
+
 @login_required
+@read_replica
 def dashboard(request):
     all_clients = Client.objects.filter(user=request.user, is_active=True)
     selected_ids = [int(i) for i in request.GET.getlist('clients') if i.isdigit()]
     date_from = request.GET.get('date_from', '')
     date_to = request.GET.get('date_to', '')
 
-    invoices = Invoice.objects.filter(user=request.user)
-    if selected_ids:
-        invoices = invoices.filter(client_id__in=selected_ids)
-    if date_from:
-        invoices = invoices.filter(period_start__gte=date_from)
-    if date_to:
-        invoices = invoices.filter(period_end__lte=date_to)
+    invoices = _filter_invoices(Invoice.objects.filter(user=request.user), selected_ids, date_from, date_to)
 
     total_invoices = invoices.count()
     draft_count = invoices.filter(status='draft').count()
     sent_count = invoices.filter(status='sent').count()
     paid_count = invoices.filter(status='paid').count()
 
-    total_earned = sum(inv.total_amount for inv in invoices.filter(status='paid'))
-    pending_amount = sum(inv.total_amount for inv in invoices.filter(status='sent'))
+    amounts = WorkEntry.objects.filter(invoice__in=invoices).aggregate(
+        earned=Sum('amount', filter=Q(invoice__status='paid')),
+        pending=Sum('amount', filter=Q(invoice__status='sent')),
+    )
+    total_earned = amounts['earned'] or 0
+    pending_amount = amounts['pending'] or 0
+
+    if reaches_archive(date_from, date_to):
+        # Archived invoices are all paid and carry their own totals
+        archived = _filter_invoices(
+            ArchivedInvoice.objects.filter(user=request.user), selected_ids, date_from, date_to
+        )
+        archived_count, _, archived_amount = archived_totals(archived)
+        total_invoices += archived_count
+        paid_count += archived_count
+        total_earned += archived_amount
 
-    recent_invoices = invoices.select_related('client')[:5]
+    recent_invoices = Invoice.with_totals(invoices.select_related('client'))[:5]
 
     return render(request, 'billing/dashboard.html', {
         'total_invoices': total_invoices,
@@ -65,12 +108,15 @@ def dashboard(request):
         'selected_ids': selected_ids,
         'date_from': date_from,
         'date_to': date_to,
+        'has_archive': not (date_from or date_to) and ArchivedInvoice.objects.filter(user=request.user).exists(),
+        'archive_cutoff': archive_cutoff(),
     })
 
 
 # --- Client management views ---
 
 @login_required
+@read_replica
 def client_list(request):
     """
     Display list of all clients with search and filtering capabilities.
@@ -97,7 +143,7 @@ def client_list(request):
     
     clients_list = list(clients)
     for client in clients_list:
-        client.recent_invoices = list(client.invoices.order_by('-id')[:5])
+        client.recent_invoices = list(Invoice.with_totals(client.invoices.order_by('-id'))[:5])
 
     return render(request, "billing/client_list.html", {
         "clients": clients_list,
@@ -107,20 +153,25 @@ def client_list(request):
 
 
 @login_required
+@read_replica
 def client_detail(request, pk):
     """
     Display client details and their associated invoices.
     Only shows clients belonging to the current user.
     """
     client = get_object_or_404(Client, pk=pk, user=request.user)
-    invoices = client.invoices.all().order_by("-id")
-    
-    total_revenue = sum(invoice.total_amount for invoice in invoices.filter(status='paid'))
-    
+    invoices = list(Invoice.with_totals(client.invoices.order_by("-id")))
+
+    # Totals come from the client's counters (billing.counters); whatever
+    # they count beyond the hot invoices listed here is in the archive
     return render(request, "billing/client_detail.html", {
         "client": client,
         "invoices": invoices,
-        "total_revenue": total_revenue,
+        "invoice_count": client.invoice_count,
+        "archived_count": max(client.invoice_count - len(invoices), 0),
+        "archive_cutoff": archive_cutoff(),
+        "total_revenue": client.total_paid,
+        "schedules": client.recurring_schedules.all(),
     })
 
 
@@ -194,6 +245,135 @@ def client_delete(request, pk):
     })
 
 
+# --- Recurring invoice schedules ---
+
+@login_required
+def recurring_schedule_create(request, pk):
+    """
+    Create a recurring invoice schedule for a client.
+    Invoices are generated by the ``generate_recurring`` command.
+    """
+    client = get_object_or_404(Client, pk=pk, user=request.user)
+
+    if request.method == "POST":
+        form = RecurringScheduleForm(request.POST)
+        if form.is_valid():
+            schedule = form.save(commit=False)
+            schedule.user = request.user
+            schedule.client = client
+            schedule.save()
+            messages.success(request, f"Recurring {schedule.get_period_type_display().lower()} invoice set up for '{client.name}'.")
+            return redirect("client_detail", pk=client.pk)
+    else:
+        form = RecurringScheduleForm(initial={
+            "period_type": "weekly",
+            "next_period_start": monday_of(timezone.localdate()),
+            "hourly_rate": client.default_hourly_rate,
+        })
+
+    return render(request, "billing/recurring_schedule_form.html", {
+        "form": form,
+        "client": client,
+        "title": f"Recurring Invoice: {client.name}",
+        "submit_text": "Create Schedule",
+    })
+
+
+@login_required
+def recurring_schedule_edit(request, pk):
+    """
+    Edit or pause a recurring invoice schedule.
+    """
+    schedule = get_object_or_404(RecurringSchedule, pk=pk, user=request.user)
+
+    if request.method == "POST":
+        form = RecurringScheduleForm(request.POST, instance=schedule)
+        if form.is_valid():
+            form.save()
+            messages.success(request, "Recurring schedule updated successfully.")
+            return redirect("client_detail", pk=schedule.client_id)
+    else:
+        form = RecurringScheduleForm(instance=schedule)
+
+    return render(request, "billing/recurring_schedule_form.html", {
+        "form": form,
+        "client": schedule.client,
+        "title": f"Recurring Invoice: {schedule.client.name}",
+        "submit_text": "Update Schedule",
+    })
+
+
+# --- Invoice form work entries ---
+def _period_rows(start, end, entries=()):
+    """
+    One entry table row per day of the period, filled from ``entries``.
+    """
+    by_date = {entry.work_date: entry for entry in entries}
+    return [
+        {
+            "work_date": day,
+            "hours": by_date[day].hours if day in by_date else "",
+            "description": by_date[day].description if day in by_date else "",
+        }
+        for day in days_between(start, end)
+    ]
+
+
+def _entry_table(rows):
+    """
+    Template context for the entry table: the rows rendered server-side,
+    and their values by date for the JavaScript to keep when the period
+    changes and it rebuilds the table.
+    """
+    for row in rows:
+        if not isinstance(row["work_date"], date):
+            try:
+                row["work_date"] = date.fromisoformat(row["work_date"])
+            except ValueError:
+                pass
+    formset = WorkEntryFormSet(queryset=WorkEntry.objects.none(), initial=rows)
+    formset.extra = len(rows)
+    entries_json = json.dumps({
+        str(row["work_date"]): {"hours": str(row["hours"]), "description": row["description"]}
+        for row in rows if row["hours"] != "" or row["description"]
+    })
+    return {"formset": formset, "entries_json": entries_json}
+
+
+def _clean_entries(form, rows):
+    """
+    Validate the invoice form and its entry rows together. Returns the
+    parsed entries, or None with every problem added to ``form``.
+    """
+    if not form.is_valid():
+        return None
+    try:
+        return parse_entries(rows, form.cleaned_data["period_start"], form.cleaned_data["period_end"])
+    except InvalidEntries as exc:
+        for i, message in sorted(exc.errors.items()):
+            form.add_error(None, f"Row {i + 1}: {message}")
+        return None
+
+
+def _save_with_entries(invoice, entries, replace=False):
+    """
+    Save ``invoice`` and insert its entries with one bulk insert; with
+    ``replace`` its previous entries are deleted first.
+    """
+    with tracking_changes(), updating_counters():
+        invoice.save()
+        if replace:
+            invoice.work_entries.all().delete()
+        for entry in entries:
+            entry.invoice = invoice
+            entry.amount = entry.compute_amount(invoice.hourly_rate)
+        WorkEntry.objects.bulk_create(entries)
+        # bulk_create sends no post_save; record the rows for sync and the counters ourselves
+        track("work_entry", [entry.pk for entry in entries], user_id=invoice.user_id)
+        if invoice.status == "paid":
+            add_to_counters(invoice.client_id, paid=sum(entry.amount for entry in entries))
+
+
 # --- Create invoice for specific client ---
 @login_required
 def invoice_create_for_employee(request, pk):
@@ -205,8 +385,10 @@ def invoice_create_for_employee(request, pk):
 
     if request.method == "POST":
         form = InvoiceForm(request.POST)
-        
-        if form.is_valid():
+        rows = posted_entry_rows(request.POST)
+        entries = _clean_entries(form, rows)
+
+        if entries is not None:
             invoice = form.save(commit=False)
             invoice.client = client
             invoice.client_name = client.name
@@ -214,47 +396,22 @@ def invoice_create_for_employee(request, pk):
             if not invoice.hourly_rate:
                 invoice.hourly_rate = client.default_hourly_rate
             invoice.user = request.user
-            invoice.save()
-            
-            # Handle work entries
-            formset = WorkEntryFormSet(request.POST, instance=invoice)
-            
-            # Handle work entries manually without formset validation
-            saved_entries = 0
-            for i in range(int(request.POST.get('work_entries-TOTAL_FORMS', 0))):
-                work_date = request.POST.get(f'work_entries-{i}-work_date')
-                hours = request.POST.get(f'work_entries-{i}-hours')
-                description = request.POST.get(f'work_entries-{i}-description')
-                
-                # Only save if there's meaningful data
-                if work_date and (hours or description):
-                    work_entry = WorkEntry(
-                        invoice=invoice,
-                        work_date=work_date,
-                        hours=float(hours) if hours else 0.0,
-                        description=description or ''
-                    )
-                    work_entry.save()
-                    saved_entries += 1
-            
-            if saved_entries > 0:
-                messages.success(request, f"Invoice created successfully with {saved_entries} work entries.")
+            _save_with_entries(invoice, entries)
+
+            if entries:
+                messages.success(request, f"Invoice created successfully with {len(entries)} work entries.")
             else:
                 messages.success(request, "Invoice created successfully. You can add work entries later.")
             return redirect("invoice_detail", pk=invoice.pk)
-        else:
-            formset = WorkEntryFormSet()
 
         return render(
             request,
             "billing/invoice_form.html",
-            {"form": form, "formset": formset, "fixed_employee": client},
+            {"form": form, "fixed_employee": client, **_entry_table(rows)},
         )
 
     # GET: inicializamos con weekly y el hourly del empleado
-    today = timezone.localdate()
-    start = today - timedelta(days=today.weekday())
-    end = start + timedelta(days=6)
+    start, end = default_period("weekly", timezone.localdate())
 
     form = InvoiceForm(
         initial={
@@ -267,25 +424,65 @@ def invoice_create_for_employee(request, pk):
             "hourly_rate": client.default_hourly_rate,  # Client's default rate
         }
     )
-    formset = WorkEntryFormSet()  # filas las genera el JS del template
-
     return render(
         request,
         "billing/invoice_form.html",
-        {"form": form, "formset": formset, "fixed_employee": client},
+        {"form": form, "fixed_employee": client, **_entry_table(_period_rows(start, end))},
     )
 
 
 @login_required
+@read_replica
 def invoice_list(request):
     # Show only invoices belonging to the current user
-    invoices = Invoice.objects.filter(user=request.user)
-    return render(request, "billing/invoice_list.html", {"invoices": invoices})
+    client_ids = [int(i) for i in request.GET.getlist('client') if i.isdigit()]
+    date_from = request.GET.get('date_from', '')
+    date_to = request.GET.get('date_to', '')
+    invoices = _filter_invoices(Invoice.objects.filter(user=request.user), client_ids, date_from, date_to)
+    invoices = Invoice.with_totals(invoices)
+
+    # Without a date filter the list shows the hot table only; a range that
+    # starts before the archive cutoff brings archived invoices in as well.
+    filtered = bool(date_from or date_to)
+    if reaches_archive(date_from, date_to):
+        archived = _filter_invoices(
+            ArchivedInvoice.objects.filter(user=request.user), client_ids, date_from, date_to
+        )
+        invoices = sorted([*invoices, *archived], key=lambda inv: inv.pk, reverse=True)
+
+    return render(request, "billing/invoice_list.html", {
+        "invoices": invoices,
+        "date_from": date_from,
+        "date_to": date_to,
+        "client_ids": client_ids,
+        "filtered": filtered,
+        "has_archive": not filtered and ArchivedInvoice.objects.filter(user=request.user).exists(),
+        "archive_cutoff": archive_cutoff(),
+    })
+
+
+def _invoice_with_entries(request, pk, entries=True):
+    """
+    Load an invoice of the current user for rendering: the invoice with its
+    client, owner and profile in one query, and (unless not ``entries``)
+    its work entries in a second. Totals and line amounts are then computed
+    from the prefetched rows. Invoices moved to the archive are looked up
+    there, read-only.
+    """
+    for model in (Invoice, ArchivedInvoice):
+        queryset = model.objects.select_related("client", "user__userprofile")
+        if entries:
+            queryset = queryset.prefetch_related("work_entries")
+        invoice = queryset.filter(pk=pk, user=request.user).first()
+        if invoice is not None:
+            return invoice
+    raise Http404("No invoice matches the given query.")
 
 
 @login_required
+@read_replica
 def invoice_detail(request, pk):
-    invoice = get_object_or_404(Invoice, pk=pk, user=request.user)
+    invoice = _invoice_with_entries(request, pk)
     return render(request, "billing/invoice_detail.html", {"invoice": invoice})
 
 
@@ -293,8 +490,10 @@ def invoice_detail(request, pk):
 def invoice_create(request):
     if request.method == "POST":
         form = InvoiceForm(request.POST)
+        rows = posted_entry_rows(request.POST)
+        entries = _clean_entries(form, rows)
 
-        if form.is_valid():
+        if entries is not None:
             # Create invoice without saving yet
             invoice = form.save(commit=False)
 
@@ -309,49 +508,21 @@ def invoice_create(request):
 
             # Assign to the current user
             invoice.user = request.user
-            
-            # Save invoice first to get an ID
-            invoice.save()
-            
-            # Formset linked to the invoice
-            formset = WorkEntryFormSet(request.POST, instance=invoice)
-
-            # Handle work entries manually without formset validation
-            saved_entries = 0
-            for i in range(int(request.POST.get('work_entries-TOTAL_FORMS', 0))):
-                work_date = request.POST.get(f'work_entries-{i}-work_date')
-                hours = request.POST.get(f'work_entries-{i}-hours')
-                description = request.POST.get(f'work_entries-{i}-description')
-                
-                # Only save if there's meaningful data
-                if work_date and (hours or description):
-                    work_entry = WorkEntry(
-                        invoice=invoice,
-                        work_date=work_date,
-                        hours=float(hours) if hours else 0.0,
-                        description=description or ''
-                    )
-                    work_entry.save()
-                    saved_entries += 1
-            
-            if saved_entries > 0:
-                messages.success(request, f"Invoice created successfully with {saved_entries} work entries.")
+            _save_with_entries(invoice, entries)
+
+            if entries:
+                messages.success(request, f"Invoice created successfully with {len(entries)} work entries.")
             else:
                 messages.success(request, "Invoice created successfully. You can add work entries later.")
             return redirect("invoice_detail", pk=invoice.pk)
 
-        else:
-            # Si el form principal NO es válido, construimos el formset para no perder filas
-            formset = WorkEntryFormSet(request.POST)
-
+        # Re-render the submitted rows so nothing typed is lost
         return render(
-            request, "billing/invoice_form.html", {"form": form, "formset": formset}
+            request, "billing/invoice_form.html", {"form": form, **_entry_table(rows)}
         )
 
-    # GET: inicializamos solo el formulario de Invoice (sin filas; JS las generará)
-    today = timezone.localdate()
-    start = today - timedelta(days=today.weekday())  # Monday
-    end = start + timedelta(days=6)  # Sunday
+    # GET: inicializamos el formulario y las filas de la semana actual
+    start, end = default_period("weekly", timezone.localdate())
 
     form = InvoiceForm(
         initial={
@@ -361,40 +532,73 @@ def invoice_create(request):
             "hourly_rate": 50,  # genérico; si eliges empleado, se aplicará su rate al guardar
         }
     )
-    formset = (
-        WorkEntryFormSet()
-    )  # sin filas; el JS del template las crea según el periodo
-
     return render(
-        request, "billing/invoice_form.html", {"form": form, "formset": formset}
+        request, "billing/invoice_form.html", {"form": form, **_entry_table(_period_rows(start, end))}
     )
 
 
 # Creacion de invoices como PDF para poder ser enviados
 @login_required
+@read_replica
 def invoice_pdf(request, pk):
-    invoice = get_object_or_404(Invoice, pk=pk, user=request.user)
-    profile = UserProfile.objects.filter(user=request.user).first()
-    html = render_to_string("billing/invoice_pdf.html", {"invoice": invoice, "profile": profile})
-
-    result = BytesIO()
-    pdf = pisa.CreatePDF(html, dest=result, encoding="UTF-8")
-
-    if pdf.err:
+    invoice = _invoice_with_entries(request, pk, entries=False)
+    if invoice.sent_pdf_sha256:
+        # The copy the client was sent, streamed from disk
+        response = serve_pdf(request, invoice.sent_pdf_sha256, invoice_pdf_filename(invoice))
+        if response is not None:
+            return response
+    prefetch_related_objects([invoice], "work_entries")
+    profile = getattr(invoice.user, "userprofile", None)
+
+    try:
+        pdf = render_invoice_pdf(invoice, profile)
+    except PDFRenderError:
         return HttpResponse("PDF generation error", status=500)
 
-    filename = f"Invoice_{invoice.invoice_number or invoice.pk}.pdf"
-    resp = HttpResponse(result.getvalue(), content_type="application/pdf")
+    filename = invoice_pdf_filename(invoice)
+    resp = HttpResponse(pdf, content_type="application/pdf")
     resp["Content-Disposition"] = f'attachment; filename="{filename}"'
     return resp
 
 
+@login_required
+@read_replica
+def invoice_ubl(request, pk):
+    """
+    Download the invoice as a UBL e-invoice, streamed as it is written.
+    """
+    invoice = _invoice_with_entries(request, pk)
+    profile = getattr(invoice.user, "userprofile", None)
+    resp = StreamingHttpResponse(iter_invoice_ubl(invoice, profile), content_type="application/xml; charset=utf-8")
+    resp["Content-Disposition"] = f'attachment; filename="{invoice_ubl_filename(invoice)}"'
+    return resp
+
+
+@login_required
+def invoice_send(request, pk):
+    """
+    Queue the invoice PDF for email delivery to the client.
+    Only enqueues; the ``send_queued_mail`` worker renders and sends it.
+    """
+    if request.method != "POST":
+        return redirect("invoice_detail", pk=pk)
+    invoice = get_object_or_404(Invoice.objects.select_related("user__userprofile"), pk=pk, user=request.user)
+    if not invoice.client_email:
+        messages.error(request, "This invoice has no client email address.")
+        return redirect("invoice_detail", pk=invoice.pk)
+
+    enqueue_invoice_email(invoice, getattr(invoice.user, "userprofile", None))
+    if invoice.status == 'draft':
+        _change_status(invoice, 'sent')
+    messages.success(request, f"Invoice {invoice.invoice_number} queued for delivery to {invoice.client_email}.")
+    return redirect("invoice_detail", pk=invoice.pk)
+
+
 @login_required
 def invoice_mark_sent(request, pk):
     invoice = get_object_or_404(Invoice, pk=pk, user=request.user)
     if invoice.status == 'draft':
-        invoice.status = 'sent'
-        invoice.save()
+        _change_status(invoice, 'sent')
         messages.success(request, f"Invoice {invoice.invoice_number} marked as sent.")
     # Redirect back to client detail page
     return redirect('client_detail', pk=invoice.client.pk)
@@ -404,101 +608,148 @@ def invoice_mark_sent(request, pk):
 def invoice_mark_paid(request, pk):
     invoice = get_object_or_404(Invoice, pk=pk, user=request.user)
     if invoice.status in ('sent', 'overdue'):
-        invoice.status = 'paid'
-        invoice.save()
+        _change_status(invoice, 'paid')
         messages.success(request, f"Invoice {invoice.invoice_number} marked as paid.")
     # Redirect back to client detail page
     return redirect('client_detail', pk=invoice.client.pk)
 
 
+def _change_status(invoice, new_status):
+    """
+    Save ``new_status`` with a single UPDATE, and the client's
+    counters in the same transaction. Returns the previous status, or None
+    when the status is unknown or unchanged.
+
+    An invoice that leaves "draft" is flagged for the mail worker to store
+    its PDF as sent; one moved back to "draft" drops it, and is stored
+    again when next sent.
+    """
+    previous = invoice.status
+    if new_status not in dict(Invoice.STATUS_CHOICES) or new_status == previous:
+        return None
+    invoice.status = new_status
+    update_fields = ['status']
+    if new_status == 'draft' or not invoice.sent_pdf_sha256:
+        update_fields += invoice.reset_sent_pdf()
+    with tracking_changes(), updating_counters():
+        invoice.save(update_fields=update_fields)
+    return previous
+
+
 @login_required
 def invoice_change_status(request, pk):
     if request.method == 'POST':
         invoice = get_object_or_404(Invoice, pk=pk, user=request.user)
-        new_status = request.POST.get('status')
-        if new_status in dict(Invoice.STATUS_CHOICES):
-            invoice.status = new_status
-            invoice.save()
+        _change_status(invoice, request.POST.get('status'))
     next_url = request.POST.get('next') or request.META.get('HTTP_REFERER') or 'invoice_list'
     return redirect(next_url)
 
 
 @login_required
-def invoice_duplicate(request, pk):
-    original_invoice = get_object_or_404(Invoice, pk=pk, user=request.user)
-    
-    # Create a copy of the invoice
-    new_invoice = Invoice.objects.create(
-        user=request.user,  # Assign to current user
-        client=original_invoice.client,  # Use client instead of employee
-        client_name=original_invoice.client_name,
-        client_email=original_invoice.client_email,
-        period_type=original_invoice.period_type,
-        period_start=original_invoice.period_start,
-        period_end=original_invoice.period_end,
-        hourly_rate=original_invoice.hourly_rate,
-        status='draft',
-        notes=original_invoice.notes,
+@require_POST
+def invoice_status_fragment(request, pk):
+    """
+    ``invoice_change_status`` for the status pickers' script: instead of
+    redirecting to a page that recomputes every total, answer with the
+    re-rendered picker and what changed in the stat tiles, keyed like their
+    ``data-stat`` attributes ("paid-amount", "draft-count", ...).
+    """
+    invoice = get_object_or_404(Invoice, pk=pk, user=request.user)
+    new_status = request.POST.get('status')
+    if new_status not in dict(Invoice.STATUS_CHOICES):
+        return JsonResponse({"error": f"Unknown status {new_status!r}."}, status=400)
+
+    stats = {}
+    previous = _change_status(invoice, new_status)
+    if previous:
+        amount = invoice.total_amount
+        stats = {
+            f"{previous}-count": -1, f"{new_status}-count": 1,
+            f"{previous}-amount": -amount, f"{new_status}-amount": amount,
+        }
+    html = render_to_string(
+        "billing/_status_form.html", {"invoice": invoice, "next": request.POST.get('next', '')}, request=request,
     )
-    
-    # Copy work entries
-    for work_entry in original_invoice.work_entries.all():
-        WorkEntry.objects.create(
-            invoice=new_invoice,
-            work_date=work_entry.work_date,
-            hours=work_entry.hours,
-            description=work_entry.description,
-        )
-    
+    return JsonResponse({"status": invoice.status, "html": html, "stats": stats})
+
+
+def _duplicate(request, pk, next_period=False):
+    copies = duplicate_invoices(Invoice.objects.filter(pk=pk, user=request.user), next_period=next_period)
+    if not copies:
+        raise Http404("No invoice matches the given query.")
+    new_invoice = copies[0]
     messages.success(request, f"Invoice duplicated. New invoice: {new_invoice.invoice_number}")
     return redirect('invoice_detail', pk=new_invoice.pk)
 
 
+@login_required
+def invoice_duplicate(request, pk):
+    return _duplicate(request, pk)
+
+
+@login_required
+def invoice_duplicate_next(request, pk):
+    # Same invoice for the following period, entry dates moved along
+    return _duplicate(request, pk, next_period=True)
+
+
+@login_required
+def invoice_roll_forward(request):
+    """
+    Copy every invoice in the list's client/date filter (last week's when
+    no dates are given) into its next period. Invoices already rolled
+    forward are skipped, so posting twice creates nothing new.
+    """
+    if request.method != 'POST':
+        return redirect('invoice_list')
+    client_ids = [int(i) for i in request.POST.getlist('client') if i.isdigit()]
+    dates = [request.POST.get('date_from', ''), request.POST.get('date_to', '')]
+    try:
+        date_from, date_to = [date.fromisoformat(value) if value else None for value in dates]
+    except ValueError:
+        messages.error(request, "Enter the dates as YYYY-MM-DD.")
+        return redirect('invoice_list')
+    if not (date_from or date_to):
+        date_to = monday_of(timezone.localdate()) - timedelta(days=1)
+        date_from = date_to - timedelta(days=6)
+
+    invoices = _filter_invoices(Invoice.objects.filter(user=request.user), client_ids, date_from, date_to)
+    copies = duplicate_invoices(invoices, next_period=True, skip_existing=True)
+    if copies:
+        messages.success(request, f"Rolled {len(copies)} invoice(s) forward to their next period.")
+    else:
+        messages.info(request, "No invoices to roll forward.")
+    return redirect('invoice_list')
+
+
 @login_required
 def invoice_edit(request, pk):
     invoice = get_object_or_404(Invoice, pk=pk, user=request.user)
 
     if request.method == "POST":
         form = InvoiceForm(request.POST, instance=invoice)
-        if form.is_valid():
-            invoice = form.save()
-            invoice.work_entries.all().delete()
-            for i in range(int(request.POST.get('work_entries-TOTAL_FORMS', 0))):
-                work_date = request.POST.get(f'work_entries-{i}-work_date')
-                hours = request.POST.get(f'work_entries-{i}-hours')
-                description = request.POST.get(f'work_entries-{i}-description')
-                if work_date and (hours or description):
-                    WorkEntry.objects.create(
-                        invoice=invoice,
-                        work_date=work_date,
-                        hours=float(hours) if hours else 0.0,
-                        description=description or '',
-                    )
+        rows = posted_entry_rows(request.POST)
+        entries = _clean_entries(form, rows)
+        if entries is not None:
+            # Saving drops the stored PDF of a sent invoice; the mail worker stores the edited one
+            _save_with_entries(form.save(commit=False), entries, replace=True)
             messages.success(request, "Invoice updated successfully.")
             return redirect("invoice_detail", pk=invoice.pk)
-        formset = WorkEntryFormSet()
         return render(request, "billing/invoice_form.html", {
-            "form": form, "formset": formset,
-            "invoice": invoice, "fixed_employee": invoice.client,
+            "form": form, "invoice": invoice, "fixed_employee": invoice.client, **_entry_table(rows),
         })
 
-    import json
-    entries_json = json.dumps({
-        str(e.work_date): {"hours": str(e.hours), "description": e.description}
-        for e in invoice.work_entries.all()
-    })
     form = InvoiceForm(instance=invoice)
-    formset = WorkEntryFormSet()
+    rows = _period_rows(invoice.period_start, invoice.period_end, invoice.work_entries.all())
     return render(request, "billing/invoice_form.html", {
-        "form": form, "formset": formset,
-        "invoice": invoice, "fixed_employee": invoice.client,
-        "entries_json": entries_json,
+        "form": form, "invoice": invoice, "fixed_employee": invoice.client, **_entry_table(rows),
     })
 
 
 @login_required
 def profile(request):
-    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    # Usually already loaded with the user (see billing.auth)
+    profile = getattr(request.user, "userprofile", None) or UserProfile.objects.create(user=request.user)
     if request.method == 'POST':
         # Update Django User fields
         user = request.user
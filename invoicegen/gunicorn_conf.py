@@ -0,0 +1,135 @@
+"""
+Gunicorn settings for production: ``gunicorn -c invoicegen/gunicorn_conf.py``.
+
+Workers and threads are sized from the CPU and memory the container may
+actually use (cgroup limits, not the host's), unless ``WEB_CONCURRENCY`` /
+``GUNICORN_THREADS`` say otherwise:
+
+* CPU allows the usual ``2 * cpus + 1`` concurrent requests.
+* Memory allows one worker per ``GUNICORN_WORKER_MEMORY_MB`` (default 150)
+  left after the application itself, which preloading loads once and
+  shares copy-on-write between workers.
+* When memory allows fewer workers than CPU would, each worker gets enough
+  threads to make up the difference (up to 4): views mostly wait on the
+  database, and threads share the worker's memory.
+
+Workers restart after ``GUNICORN_MAX_REQUESTS`` requests (default 1000,
+plus up to 10% random jitter so they do not all restart at once), which
+caps how far xhtml2pdf/ReportLab memory growth can go. With the app
+preloaded a replacement worker is a fork, not a fresh import.
+
+Start-up timing is logged: the boot steps of ``start.sh`` (from
+``BOOT_STARTED_AT``), loading the app in the master, and each worker's
+start.
+"""
+import gc
+import math
+import os
+import time
+
+# Imported under another name: gunicorn would take "config" for its own setting
+from decouple import config as env
+
+CONFIG_LOADED_AT = time.time()
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def available_cpus():
+    """
+    CPUs this process may use: the cgroup quota if there is one, else the
+    CPUs it is allowed to run on.
+    """
+    quota = _read("/sys/fs/cgroup/cpu.max")  # cgroup v2: "<quota> <period>" or "max <period>"
+    if quota and not quota.startswith("max"):
+        limit, period = (int(value) for value in quota.split())
+        return max(1, math.ceil(limit / period))
+    limit, period = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if limit and period and int(limit) > 0:
+        return max(1, math.ceil(int(limit) / int(period)))
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - not Linux
+        return os.cpu_count() or 1
+
+
+def available_memory_mb():
+    """
+    Memory this process may use: the cgroup limit if there is one, else
+    the machine's.
+    """
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        limit = _read(path)
+        # cgroup v1 reports "no limit" as a huge number
+        if limit and limit.isdigit() and int(limit) < 1 << 60:
+            return int(limit) // (1024 * 1024)
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+
+
+def size_workers(cpus, memory_mb, app_mb=110, worker_mb=150, max_threads=4):
+    """
+    ``(workers, threads)`` for ``cpus`` and ``memory_mb``; ``app_mb`` is the
+    preloaded, shared part of every worker.
+    """
+    wanted = 2 * cpus + 1
+    workers = max(1, min(wanted, (memory_mb - app_mb) // worker_mb))
+    threads = min(max_threads, math.ceil(wanted / workers))
+    return workers, threads
+
+
+CPUS = available_cpus()
+MEMORY_MB = available_memory_mb()
+_workers, _threads = size_workers(CPUS, MEMORY_MB, worker_mb=env("GUNICORN_WORKER_MEMORY_MB", default=150, cast=int))
+
+bind = f"0.0.0.0:{env('PORT', default='8000')}"
+workers = env("WEB_CONCURRENCY", default=_workers, cast=int)
+threads = env("GUNICORN_THREADS", default=_threads, cast=int)
+worker_class = "gthread" if threads > 1 else "sync"
+
+preload_app = True
+max_requests = env("GUNICORN_MAX_REQUESTS", default=1000, cast=int)
+max_requests_jitter = env("GUNICORN_MAX_REQUESTS_JITTER", default=max_requests // 10, cast=int)
+
+# Longest PDF render plus margin; Render's proxy keeps connections alive
+timeout = env("GUNICORN_TIMEOUT", default=30, cast=int)
+graceful_timeout = 20
+keepalive = 5
+# Worker heartbeats on tmpfs, so a slow disk never looks like a hung worker
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def on_starting(server):
+    # With preload_app the master has just imported the application
+    server.app_loaded_at = time.time()
+
+
+def when_ready(server):
+    now = time.time()
+    boot_started = env("BOOT_STARTED_AT", default=0.0, cast=float)
+    boot_steps = CONFIG_LOADED_AT - boot_started if boot_started else None
+    # Objects loaded so far are shared with every worker; keep the garbage
+    # collector from touching (and so copying) their pages after the fork.
+    gc.freeze()
+    server.log.info(
+        "Ready in %.2fs: boot steps %s, app load %.2fs, master start %.2fs. "
+        "%d workers x %d threads (%d CPUs, %d MB; max_requests %d + jitter %d)",
+        now - (boot_started or CONFIG_LOADED_AT),
+        f"{boot_steps:.2f}s" if boot_steps is not None else "n/a",
+        server.app_loaded_at - CONFIG_LOADED_AT,
+        now - server.app_loaded_at,
+        server.cfg.workers, server.cfg.threads, CPUS, MEMORY_MB, max_requests, max_requests_jitter,
+    )
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.time()
+
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s ready in %.3fs", worker.pid, time.time() - worker.forked_at)
@@ -44,10 +44,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "billing.compression.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "billing.profiling.ProfilerMiddleware",
+    "billing.db_router.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -119,6 +122,9 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = "static/"
+# Site CSS/JS and the icon sprite; production serves them through WhiteNoise
+# with hashed names, gzip/brotli variants and far-future cache headers
+STATICFILES_DIRS = [BASE_DIR / "static"]
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -130,12 +136,79 @@ LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/login/'
 
+# Seconds billing.auth.CachedModelBackend keeps a user and profile cached
+# (production; see settings_production.py)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=60, cast=int)
+
 # Support Supabase / PostgreSQL in dev via DATABASE_URL
 _db_url = config('DATABASE_URL', default=None)
 if _db_url:
     import dj_database_url
     DATABASES = {'default': dj_database_url.parse(_db_url)}
 
+# Optional read replica for read-only views (see billing/db_router.py)
+_replica_url = config('DATABASE_REPLICA_URL', default=None)
+if _replica_url:
+    import dj_database_url
+    DATABASES['replica'] = dj_database_url.parse(_replica_url)
+DATABASE_ROUTERS = ['billing.db_router.PrimaryReplicaRouter']
+# Kill switch: keep the replica configured but serve every read from the primary
+DATABASE_REPLICA_READS = config('DATABASE_REPLICA_READS', default=True, cast=bool)
+# Seconds a session reads from the primary after it writes (replica lag cover)
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS', default=10, cast=int)
+
 # Email — dev uses console backend (reset emails print to terminal)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@invoiceapp.local'
+
+# Outbound mail queue — `manage.py send_queued_mail` delivers queued emails
+# (e.g. "send invoice") through this backend, reusing one connection per batch.
+MAIL_QUEUE_BACKEND = EMAIL_BACKEND
+MAIL_QUEUE_MAX_ATTEMPTS = 6
+MAIL_QUEUE_RETRY_BASE = 60    # seconds; doubles on each failed attempt
+MAIL_QUEUE_RETRY_MAX = 3600
+
+# Health checks — /health/live/ never touches dependencies; /health/ready/
+# probes the database (and optionally the PDF renderer) and caches the result.
+HEALTHCHECK_CACHE_TTL = config('HEALTHCHECK_CACHE_TTL', default=5, cast=int)
+HEALTHCHECK_TIMEOUT = config('HEALTHCHECK_TIMEOUT', default=2.0, cast=float)
+HEALTHCHECK_PDF_PROBE = config('HEALTHCHECK_PDF_PROBE', default=False, cast=bool)
+
+# ISO 4217 code written into UBL e-invoices (`manage.py export_ubl`)
+INVOICE_CURRENCY = config('INVOICE_CURRENCY', default='USD')
+
+# Strip template indentation from HTML pages before they are compressed
+# (billing/compression.py)
+HTML_MINIFY = config('HTML_MINIFY', default=False, cast=bool)
+
+# Invoice PDF engine: 'billing.pdf.XHTML2PDFRenderer' (HTML template) or
+# 'billing.pdf_reportlab.ReportLabRenderer' (direct ReportLab layout, faster)
+INVOICE_PDF_RENDERER = config('INVOICE_PDF_RENDERER', default='billing.pdf.XHTML2PDFRenderer')
+
+# Directory with DejaVuSans.ttf and DejaVuSans-Bold.ttf for invoice PDFs
+# (Debian/Ubuntu `fonts-dejavu-core`); PDFs fall back to Helvetica without them.
+PDF_FONT_DIR = config('PDF_FONT_DIR', default='/usr/share/fonts/truetype/dejavu')
+
+# Worker memory (MB) above which invoice PDFs are rendered in a helper process
+# instead, replaced every PDF_SUBPROCESS_RENDERS renders; 0 renders in-process.
+PDF_RENDER_MEMORY_LIMIT_MB = config('PDF_RENDER_MEMORY_LIMIT_MB', default=0, cast=int)
+PDF_SUBPROCESS_RENDERS = config('PDF_SUBPROCESS_RENDERS', default=100, cast=int)
+
+# PDFs of sent invoices, stored as sent (billing/pdf_store.py). Never pruned:
+# must be on a persistent disk.
+SENT_PDF_ROOT = config('SENT_PDF_ROOT', default=str(BASE_DIR / 'sent_pdfs'))
+
+# Timer time slices (billing/timeslices.py) — added slices are kept this long
+# so a timer's retried post is still recognised by its key.
+TIME_SLICE_KEY_DAYS = config('TIME_SLICE_KEY_DAYS', default=7, cast=int)
+
+# Archive — `manage.py archive_invoices` moves paid invoices older than this
+# out of the hot tables.
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=730, cast=int)
+
+# Request profiler (billing/profiling.py) — staff issue tokens from the admin's
+# "Request profiles" page; the newest PROFILER_KEEP captures stay on disk.
+PROFILER_ENABLED = config('PROFILER_ENABLED', default=True, cast=bool)
+PROFILER_DIR = config('PROFILER_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILER_KEEP = config('PROFILER_KEEP', default=50, cast=int)
+PROFILER_TOKEN_MAX_AGE = config('PROFILER_TOKEN_MAX_AGE', default=3600, cast=int)  # seconds
@@ -29,16 +29,61 @@ else:
         }
     }
 
-# Static files
+# Read replica for dashboards, lists and reports
+if config('DATABASE_REPLICA_URL', default=None):
+    import dj_database_url
+    DATABASES['replica'] = dj_database_url.parse(config('DATABASE_REPLICA_URL'))
+
+# Cache — per process unless REDIS_URL points at a shared Redis (needs the
+# `redis` package), which also makes user cache invalidation reach every worker
+if config('REDIS_URL', default=None):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('REDIS_URL'),
+        }
+    }
+
+# Sessions and users are read from the cache, so an authenticated request
+# usually costs no query before the view runs. SESSION_ENGINE may also be
+# 'django.contrib.sessions.backends.signed_cookies' (no server-side state).
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.cached_db')
+# Users are only cached in a shared cache: with a per-process one, a
+# password change or deactivation would not reach the other workers until
+# AUTH_USER_CACHE_TTL runs out. ModelBackend stays listed so sessions
+# started before the switch keep working.
+if config('REDIS_URL', default=None):
+    AUTHENTICATION_BACKENDS = [
+        'billing.auth.CachedModelBackend',
+        'django.contrib.auth.backends.ModelBackend',
+    ]
+
+# Templates — always through the cached loader, so each worker reads and
+# compiles a template once instead of on every render
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
+
+# Static files — collectstatic writes content-hashed copies with .gz and
+# (with Brotli installed) .br variants; WhiteNoise serves the hashed names
+# with a ten-year immutable Cache-Control and picks the encoding per request
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATIC_URL = '/static/'
-# STATICFILES_DIRS = [
-#     os.path.join(BASE_DIR, 'static'),
-# ]
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Security headers
 SECURE_SSL_REDIRECT = True
+SECURE_REDIRECT_EXEMPT = [r'^health/']
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
@@ -53,8 +98,11 @@ LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/login/'
 
-# Email — configure SMTP via environment variables
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Email — configure SMTP via environment variables. Requests only enqueue
+# messages; the send_queued_mail worker talks to SMTP.
+EMAIL_BACKEND = 'billing.mail.QueuedEmailBackend'
+MAIL_QUEUE_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=30, cast=int)
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
 EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 EMAIL_USE_TLS = True
@@ -0,0 +1,21 @@
+"""
+Test settings: two local SQLite databases so the primary/replica routing
+is exercised. Run with ``python manage.py test --settings=invoicegen.settings_test``.
+
+The replica test database starts empty, so replica reads are switched off
+except in the routing tests, which turn them back on.
+"""
+from .settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+    },
+}
+
+DATABASE_REPLICA_READS = False
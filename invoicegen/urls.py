@@ -19,9 +19,12 @@ from django.contrib import admin
 from django.urls import path, include
 from decouple import config
 
+from billing.admin import profile_urls
+
 admin_url = config('ADMIN_URL', default='admin/')
 
 urlpatterns = [
+    path(admin_url + "profiles/", include(profile_urls)),
     path(admin_url, admin.site.urls),
     path("", include("billing.urls")),
 ]
@@ -13,4 +13,10 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'invoicegen.settings_production')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Load the PDF template, stylesheet and fonts once per worker, before the
+# first request
+from billing.pdf import warm_up  # noqa: E402
+
+warm_up()
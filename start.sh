@@ -1,20 +1,33 @@
 #!/bin/bash
 
-# Create staticfiles directory
-mkdir -p staticfiles
+# Start-up timing is logged by the gunicorn config from here on
+export BOOT_STARTED_AT=$(date +%s.%N)
 
-# Collect static files
-echo "Collecting static files..."
-python manage.py collectstatic --noinput --settings=invoicegen.settings_production
+# Collect static files, check the setup and apply migrations, in one Django
+# process; collectstatic is skipped when the static files are unchanged since
+# it last ran (run `manage.py boot --skip-migrate` in the build step to do it
+# there once), and migrate when no migration is pending
+mkdir -p staticfiles
+echo "Running boot steps..."
+python manage.py boot --settings=invoicegen.settings_production
 
-# Test basic Django setup
-echo "Testing Django setup..."
-python manage.py check --settings=invoicegen.settings_production
+# Queued email (invoices, password resets) is delivered by a separate Render
+# background worker running `python manage.py send_queued_mail --loop`, which
+# Render restarts if it exits. RUN_MAIL_WORKER=1 runs it here instead, as an
+# unsupervised child of this container: for local or single-instance setups.
+if [ "${RUN_MAIL_WORKER:-0}" = "1" ]; then
+    echo "Starting mail worker..."
+    python manage.py send_queued_mail --loop --settings=invoicegen.settings_production &
+fi
 
-# Run migrations (only if database is available)
-echo "Running migrations..."
-python manage.py migrate --settings=invoicegen.settings_production || echo "Migrations failed, continuing..."
+# Posted timer time slices are added to invoices every minute by another
+# background worker (`python manage.py coalesce_time_slices --loop`);
+# RUN_TIME_SLICE_WORKER=1 runs it here instead, likewise unsupervised.
+if [ "${RUN_TIME_SLICE_WORKER:-0}" = "1" ]; then
+    echo "Starting time slice worker..."
+    python manage.py coalesce_time_slices --loop --settings=invoicegen.settings_production &
+fi
 
-# Start gunicorn
+# Start gunicorn: workers, threads and recycling are set in invoicegen/gunicorn_conf.py
 echo "Starting gunicorn..."
-exec gunicorn invoicegen.wsgi_production:application --bind 0.0.0.0:$PORT
+exec gunicorn -c invoicegen/gunicorn_conf.py invoicegen.wsgi_production:application
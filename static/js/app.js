@@ -0,0 +1,86 @@
+(function(){
+  function fmt(d){ return d.toISOString().slice(0,10); }
+  function mondayOf(d){
+    const day = d.getDay();
+    const offset = (day === 0 ? -6 : 1 - day);
+    const m = new Date(d);
+    m.setDate(d.getDate() + offset);
+    return m;
+  }
+  function endOfMonth(d){
+    return new Date(d.getFullYear(), d.getMonth() + 1, 0);
+  }
+  const sel = document.getElementById("id_period_type");
+  const start = document.getElementById("id_period_start");
+  const end = document.getElementById("id_period_end");
+  if (!sel || !start || !end) return;
+  sel.addEventListener("change", function(){
+    const today = new Date();
+    if (this.value === "weekly") {
+      const mon = mondayOf(today);
+      const sun = new Date(mon); sun.setDate(mon.getDate() + 6);
+      start.value = fmt(mon); end.value = fmt(sun);
+    } else if (this.value === "fortnightly") {
+      const mon = mondayOf(today);
+      const last = new Date(mon); last.setDate(mon.getDate() + 13);
+      start.value = fmt(mon); end.value = fmt(last);
+    } else if (this.value === "monthly") {
+      const first = new Date(today.getFullYear(), today.getMonth(), 1);
+      start.value = fmt(first); end.value = fmt(endOfMonth(today));
+    } else {
+      start.value = ""; end.value = "";
+    }
+  });
+})();
+
+(function(){
+  // Status pickers (billing/_status_form.html) post to their fragment URL,
+  // swap in the returned picker and adjust the [data-stat] tiles on the
+  // page, so a change never reloads the page. Any failure falls back to
+  // submitting the form.
+  function applyStats(stats){
+    Object.keys(stats).forEach(function(key){
+      document.querySelectorAll('[data-stat="' + key + '"]').forEach(function(el){
+        const current = parseFloat(el.textContent.replace(/[^0-9.-]/g, '')) || 0;
+        if (key.endsWith('-amount')) {
+          const cents = Math.round(current * 100) + Math.round(parseFloat(stats[key]) * 100);
+          el.textContent = '$' + (cents / 100).toFixed(2);
+        } else {
+          el.textContent = current + stats[key];
+        }
+      });
+    });
+  }
+  document.addEventListener('change', function(e){
+    const sel = e.target;
+    if (!sel.classList.contains('status-select')) return;
+    const form = sel.form;
+    sel.dataset.status = sel.value;
+    if (!form.dataset.fragment || !window.fetch) { form.submit(); return; }
+    fetch(form.dataset.fragment, {method: 'POST', body: new FormData(form), credentials: 'same-origin'})
+      .then(function(response){
+        if (!response.ok) throw new Error(response.status);
+        return response.json();
+      })
+      .then(function(data){
+        form.outerHTML = data.html;
+        applyStats(data.stats);
+      })
+      .catch(function(){ form.submit(); });
+  });
+})();
+
+(function(){
+  const btn = document.getElementById('nav-hamburger');
+  const menu = document.getElementById('nav-menu');
+  if (!btn || !menu) return;
+  btn.addEventListener('click', function(e){
+    e.stopPropagation();
+    btn.classList.toggle('open');
+    menu.classList.toggle('open');
+  });
+  document.addEventListener('click', function(){
+    btn.classList.remove('open');
+    menu.classList.remove('open');
+  });
+})();